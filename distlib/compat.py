@@ -20,7 +20,8 @@ if sys.version_info[0] < 3:
     from ._backport import shutil
     from urlparse import urlparse, urlunparse, urljoin, urlsplit, urlunsplit
     from urllib import (urlretrieve, quote as _quote, unquote, url2pathname,
-                        pathname2url, ContentTooShortError, splittype)
+                        pathname2url, ContentTooShortError, splittype,
+                        addinfourl)
 
     def quote(s):
         if isinstance(s, unicode):
@@ -127,6 +128,7 @@ else:
                                 HTTPSHandler, HTTPHandler, HTTPRedirectHandler,
                                 build_opener)
     from urllib.error import HTTPError, URLError, ContentTooShortError
+    from urllib.response import addinfourl
     import http.client as httplib
     import urllib.request as urllib2
     import xmlrpc.client as xmlrpclib
@@ -189,6 +191,11 @@ try:
 except ImportError: # pragma: no cover
     from ._backport import sysconfig
 
+try:
+    from os import scandir
+except ImportError: # pragma: no cover
+    scandir = None
+
 try:
     callable = callable
 except NameError:   # pragma: no cover
@@ -24,7 +24,7 @@ from .util import (parse_requirement, cached_property, get_export_entry,
                    CSVReader, CSVWriter)
 
 
-__all__ = ['Distribution', 'BaseInstalledDistribution',
+__all__ = ['Distribution', 'LazyDistribution', 'BaseInstalledDistribution',
            'InstalledDistribution', 'EggInfoDistribution',
            'DistributionPath']
 
@@ -230,7 +230,7 @@ class DistributionPath(object):
         matcher = None
         if not version is None:
             try:
-                matcher = self._scheme.matcher('%s (%s)' % (name, version))
+                matcher = self._scheme.get_matcher('%s (%s)' % (name, version))
             except ValueError:
                 raise DistlibException('invalid name or version: %r, %r' %
                                       (name, version))
@@ -394,20 +394,20 @@ class Distribution(object):
         """
         scheme = get_scheme(self.metadata.scheme)
         try:
-            matcher = scheme.matcher(req)
+            matcher = scheme.get_matcher(req)
         except UnsupportedVersionError:
             # XXX compat-mode if cannot read the version
             logger.warning('could not read version %r - using name only',
                            req)
             name = req.split()[0]
-            matcher = scheme.matcher(name)
+            matcher = scheme.get_matcher(name)
 
         name = matcher.key   # case-insensitive
 
         result = False
         # Note this is similar to code in make_graph - to be refactored
         for p in self.provides:
-            vm = scheme.matcher(p)
+            vm = scheme.get_matcher(p)
             if vm.key != name:
                 continue
             version = vm.exact_version
@@ -452,6 +452,170 @@ class Distribution(object):
         return hash(self.name) + hash(self.version) + hash(self.download_url)
 
 
+class LazyDistribution(Distribution):
+    """
+    A distribution for which only a few metadata fields, such as the download
+    URL, are known to begin with (typically, one found by a locator). The
+    :class:`Metadata` instance for it isn't created until its ``metadata``
+    attribute is first used, so that creating many of them is cheap.
+
+    All the candidate downloads for the distribution are kept, and the best
+    one (according to ``scorer``) is only chosen when the download URL, the
+    digest or the metadata are needed.
+    """
+
+    def __init__(self, name, version, scheme='default', scorer=None):
+        """
+        Initialise an instance.
+        :param name: The name of the distribution.
+        :param version: The version of the distribution.
+        :param scheme: The version scheme for the distribution's metadata.
+        :param scorer: A callable which is passed a list of candidates (see
+                       :meth:`add_candidate`) and returns a list of their
+                       scores, where lower scores are better. If ``None``,
+                       the first candidate added is chosen.
+        """
+        self.name = name
+        self.key = name.lower()     # for case-insensitive comparisons
+        self.version = version
+        self.scheme = scheme
+        self.scorer = scorer
+        self.locator = None
+        self.extras = None
+        self.candidates = []
+        self._chosen = True
+        self._md5_digest = None
+        self._python_version = None
+        self._metadata = None
+        self._fields = {}
+
+    def add_candidate(self, url, md5_digest=None, python_version=None):
+        """
+        Add a candidate download for this distribution.
+
+        :param url: The URL of the download.
+        :param md5_digest: The MD5 digest of the download, if known.
+        :param python_version: The value for ``Requires-Python`` if this
+                               candidate is chosen, if known.
+        """
+        self.candidates.append((url, md5_digest, python_version))
+        self._chosen = False
+
+    def sorted_candidates(self):
+        """
+        Return the candidate downloads, as (url, md5_digest, python_version)
+        tuples, best first.
+        """
+        candidates = self.candidates
+        if self.scorer is None or len(candidates) < 2:
+            result = list(candidates)
+        else:
+            scores = self.scorer(candidates)
+            order = sorted(range(len(candidates)), key=scores.__getitem__)
+            result = [candidates[i] for i in order]
+        return result
+
+    def _choose(self):
+        """
+        Choose the best candidate download, if candidates have been added
+        since the last choice.
+        """
+        if not self._chosen:
+            self._chosen = True
+            url, self._md5_digest, python_version = self.sorted_candidates()[0]
+            self.set_field('Download-URL', url)
+            if python_version:
+                self.set_field('Requires-Python', python_version)
+            elif self._python_version:
+                # set from an earlier choice, so no longer applies
+                self.clear_field('Requires-Python')
+            self._python_version = python_version
+
+    @property
+    def metadata(self):
+        """
+        The metadata for this distribution, created from its name, version
+        and any fields which have been set.
+        """
+        self._choose()
+        if self._metadata is None:
+            md = Metadata(scheme=self.scheme)
+            md['Name'] = self.name
+            md['Version'] = self.version
+            for name, value in self._fields.items():
+                md[name] = value
+            self._fields = None
+            self._metadata = md
+        return self._metadata
+
+    def _get_md5_digest(self):
+        self._choose()
+        return self._md5_digest
+
+    def _set_md5_digest(self, value):
+        self._choose()
+        self._md5_digest = value
+
+    md5_digest = property(_get_md5_digest, _set_md5_digest)
+
+    def get_field(self, name):
+        """
+        Get a single-valued metadata field (such as ``'Download-URL'``),
+        without creating the metadata if it hasn't been created yet.
+        """
+        self._choose()
+        if self._fields is None:
+            result = self._metadata[name]
+        else:
+            result = self._fields.get(name, 'UNKNOWN')
+        return result
+
+    def set_field(self, name, value):
+        """
+        Set a single-valued metadata field, without creating the metadata if
+        it hasn't been created yet.
+        """
+        if self._fields is None:
+            self._metadata[name] = value
+        else:
+            self._fields[name] = value
+
+    def clear_field(self, name):
+        """
+        Clear a metadata field, without creating the metadata if it hasn't
+        been created yet.
+        """
+        if self._fields is None:
+            if name in self._metadata:
+                del self._metadata[name]
+        else:
+            self._fields.pop(name, None)
+
+    @property
+    def download_url(self):
+        """
+        The download URL for this distribution.
+        """
+        return self.get_field('Download-URL')
+
+    def __eq__(self, other):
+        """
+        See if this distribution is the same as another. As it stands in for
+        a plain :class:`Distribution`, it can be equal to one as well as to
+        another lazy distribution, if they have the same name, version and
+        download_url.
+        """
+        if type(other) not in (Distribution, LazyDistribution):
+            result = False
+        else:
+            result = (self.name == other.name and
+                      self.version == other.version and
+                      self.download_url == other.download_url)
+        return result
+
+    __hash__ = Distribution.__hash__
+
+
 class BaseInstalledDistribution(Distribution):
     """
     This is the base class for installed distributions (whether PEP 376 or
@@ -1215,13 +1379,13 @@ def make_graph(dists, scheme='default'):
         requires = (dist.requires | dist.setup_requires)
         for req in requires:
             try:
-                matcher = scheme.matcher(req)
+                matcher = scheme.get_matcher(req)
             except UnsupportedVersionError:
                 # XXX compat-mode if cannot read the version
                 logger.warning('could not read version %r - using name only',
                                req)
                 name = req.split()[0]
-                matcher = scheme.matcher(name)
+                matcher = scheme.get_matcher(name)
 
             name = matcher.key   # case-insensitive
 
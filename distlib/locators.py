@@ -5,34 +5,62 @@
 # See LICENSE.txt and CONTRIBUTORS.txt.
 #
 
-import gzip
-from io import BytesIO
+from bisect import bisect_left, bisect_right
+import codecs
+from collections import deque
+from email import message_from_string
+import hashlib
 import json
 import logging
 import os
 import posixpath
+import random
 import re
+import socket
+try:
+    import sqlite3
+except ImportError: # pragma: no cover
+    sqlite3 = None
+import sys
 import threading
+import time
 import zlib
 
+try:
+    import brotli
+except ImportError: # pragma: no cover
+    brotli = None
+
 from . import DistlibException
 from .compat import (urljoin, urlparse, urlunparse, url2pathname, pathname2url,
                      queue, quote, unescape, string_types, build_opener,
                      HTTPRedirectHandler as BaseRedirectHandler,
-                     Request, HTTPError, URLError)
-from .database import Distribution, DistributionPath, make_dist
+                     Request, HTTPError, URLError, scandir, xmlrpclib)
+from .database import (Distribution, LazyDistribution, DistributionPath,
+                       make_dist)
 from .metadata import Metadata
 from .util import (cached_property, parse_credentials, ensure_slash,
                    split_filename, get_project_data, parse_requirement,
-                   ServerProxy)
-from .version import get_scheme, UnsupportedVersionError
-from .wheel import Wheel, is_compatible
+                   get_cache_base, KeepAliveHandler, ServerProxy,
+                   CachePolicy, LRUCache)
+from .version import get_scheme, Matcher, UnsupportedVersionError
+from .wheel import (Wheel, TagIndex, COMPATIBLE_TAG_INDEX,
+                    FILENAME_RE as WHEEL_FILENAME_RE)
 
 logger = logging.getLogger(__name__)
 
 MD5_HASH = re.compile('^md5=([a-f0-9]+)$')
+# Matches the URLs which urlparse would split into just scheme, netloc, path
+# and fragment, and which urlunparse would then put back together unchanged.
+SIMPLE_URL = re.compile(r'^(?P<url>(?:https?|ftp)://[^/?#;\[\]\s]+'
+                        r'(?P<path>/[^?#;\s]*)?|file://(?P<fpath>/[^?#;\s]*))'
+                        r'(?:#(?P<frag>[^\s]*))?$')
 CHARSET = re.compile(r';\s*charset\s*=\s*(.*)\s*$', re.I)
 HTML_CONTENT_TYPE = re.compile('text/html|application/x(ht)?ml')
+SIMPLE_JSON_CONTENT_TYPE = 'application/vnd.pypi.simple.v1+json'
+
+# Distinguishes a missing cache entry from one whose value is None
+_MISSING = object()
 DEFAULT_INDEX = 'http://python.org/pypi'
 
 def get_all_distribution_names(url=None):
@@ -46,6 +74,22 @@ def get_all_distribution_names(url=None):
     client = ServerProxy(url, timeout=3.0)
     return client.list_packages()
 
+def _close_response(resp):
+    """
+    Close a response (which may be an HTTPError), so that its connection is
+    returned to a pool if it was read to the end, or closed if it wasn't.
+    """
+    if resp is not None and getattr(resp, 'fp', None) is not None:
+        resp.close()
+
+def _digest(data):
+    """
+    Return a hex digest of some data which can be serialized as JSON, for use
+    as a fingerprint or a cache key.
+    """
+    s = json.dumps(data, sort_keys=True)
+    return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
 class RedirectHandler(BaseRedirectHandler):
     """
     A class to work around a bug in some Python 3.2.x releases.
@@ -77,6 +121,78 @@ class RedirectHandler(BaseRedirectHandler):
 
     http_error_301 = http_error_303 = http_error_307 = http_error_302
 
+class _InFlight(object):
+    """
+    A lookup of a project which is in progress, which other threads wanting
+    the same project can wait for rather than repeating it.
+    """
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        """
+        Wait for the lookup to finish, and return its result (or raise the
+        exception it raised).
+        """
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class DownloadScorer(object):
+    """
+    Scores the candidate downloads for a version of a distribution, so that a
+    locator can choose the best one. Lower scores are better. By default,
+    wheels are preferred to other archives, more specific wheels (see
+    :meth:`Locator.wheel_rank`) to less specific ones, local downloads to
+    remote ones and https:// URLs to others, in that order of importance.
+    Any remaining ties are broken using the archive names.
+    """
+    def __init__(self, prefer_wheels=True, prefer_local=True,
+                 prefer_https=True, local_hosts=('localhost', '127.0.0.1')):
+        """
+        Initialise an instance.
+
+        :param prefer_wheels: Whether wheels are preferred to other archives.
+        :param prefer_local: Whether local downloads (``file:`` URLs, and
+                             those from ``local_hosts``) are preferred.
+        :param prefer_https: Whether https:// URLs are preferred.
+        :param local_hosts: The hosts of local mirrors.
+        """
+        self.prefer_wheels = prefer_wheels
+        self.prefer_local = prefer_local
+        self.prefer_https = prefer_https
+        self.local_hosts = frozenset(local_hosts)
+
+    def __call__(self, locator, candidates):
+        """
+        Score a list of candidates.
+
+        :param locator: The locator which found the candidates.
+        :param candidates: A list of (url, md5_digest, python_version)
+                           tuples.
+        :return: A list of the candidates' scores.
+        """
+        result = []
+        for candidate in candidates:
+            url = candidate[0]
+            scheme, netloc, path = urlparse(url)[:3]
+            rank = locator.wheel_rank(url)
+            if self.prefer_local:
+                host = netloc.rsplit('@', 1)[-1].split(':', 1)[0]
+                remote = scheme != 'file' and host not in self.local_hosts
+            else:
+                remote = False
+            result.append((self.prefer_wheels and rank is None,
+                           rank or 0, remote,
+                           self.prefer_https and scheme != 'https',
+                           posixpath.basename(path)))
+        return result
+
+
 class Locator(object):
     """
     A base class for locators - things that locate distributions.
@@ -88,20 +204,51 @@ class Locator(object):
     # A list of tags indicating which wheels you want to match. The default
     # value of None matches against the tags compatible with the running
     # Python. If you want to match other values, set wheel_tags on a locator
-    # instance to a list of tuples (pyver, abi, arch) which you want to match.
+    # instance to a list of tuples (pyver, abi, arch) which you want to match,
+    # most specific first, or to a TagIndex built from such a list.
     wheel_tags = None
 
     downloadable_extensions = source_extensions + ('.whl',)
 
-    def __init__(self, scheme='default'):
+    # Scores the candidate downloads for each version found, to choose the
+    # one used. This can be set to any callable which takes the same
+    # arguments as a DownloadScorer and returns comparable scores.
+    download_scorer = DownloadScorer()
+
+    # An estimate of the memory used by each located distribution, used to
+    # size cached projects when the cache policy has a max_size.
+    dist_size = 2048
+
+    # The maximum number of parsed requirements cached by _get_matcher.
+    max_requirement_cache = 2000
+
+    def __init__(self, scheme='default', cache_policy=None):
         """
         Initialise an instance.
         :param scheme: Because locators look for most recent versions, they
                        need to know the version scheme to use. This specifies
                        the current PEP-recommended scheme - use ``'legacy'``
                        if you need to support existing distributions on PyPI.
+        :param cache_policy: A :class:`CachePolicy` which bounds the caches
+                             of projects (and, for some locators, of pages)
+                             kept in memory by the locator.
+                             If ``None`` (the default), the caches are
+                             unbounded and their entries never expire.
         """
-        self._cache = {}
+        if cache_policy is None:
+            cache_policy = CachePolicy()
+        self.cache_policy = cache_policy
+        self._cache = cache_policy.make_cache(self._project_size)
+        self._filename_cache = {}
+        self._filename_state = None
+        self._version_index = cache_policy.make_cache(
+                                lambda entry: self._project_size(entry[0]))
+        self._requirement_cache = LRUCache(
+                                    max_entries=self.max_requirement_cache)
+        # Lookups in progress, keyed by project name, so that concurrent
+        # calls for the same project share a single lookup
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
         self.scheme = scheme
         # Because of bugs in some of the handlers on some of the platforms,
         # we use our own opener rather than just using urlopen.
@@ -109,6 +256,60 @@ class Locator(object):
 
     def clear_cache(self):
         self._cache.clear()
+        self._filename_cache.clear()
+        self._version_index.clear()
+        self._requirement_cache.clear()
+
+    def _project_size(self, versions):
+        """
+        Estimate the memory used by a result from get_project.
+        """
+        return sys.getsizeof(versions) + len(versions) * self.dist_size
+
+    def cache_stats(self):
+        """
+        Get statistics for the locator's in-memory caches.
+
+        :return: A dictionary mapping the name of each cache (such as
+                 ``'projects'``) to a dictionary of its statistics, as
+                 returned by :meth:`LRUCache.stats`. The ``'requirements'``
+                 cache holds parsed requirements, and the ``'matchers'``
+                 cache is the one shared by all users of the locator's
+                 version scheme.
+        """
+        return {
+            'projects': self._cache.stats(),
+            'requirements': self._requirement_cache.stats(),
+            'matchers': get_scheme(self.scheme).matcher_cache.stats(),
+        }
+
+    def close(self):
+        """
+        Release any resources (such as threads or network connections) held
+        by the locator. The base implementation does nothing.
+        """
+        pass
+
+    def state_fingerprint(self):
+        """
+        Return a string which identifies the state of the distributions
+        available from the locator, so that results worked out from them
+        (for example, by a :class:`DependencyFinder` with a
+        :class:`ResolutionCache`) can be reused while it doesn't change, or
+        ``None`` if there's no cheap way of identifying it.
+
+        The base implementation returns ``None``, as what's in a locator's
+        in-memory cache says nothing about what its source holds now, or in
+        another process. Subclasses which can identify the state of their
+        source cheaply and durably override this.
+        """
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def _get_scheme(self):
         return self._scheme
@@ -133,22 +334,138 @@ class Locator(object):
         """
         raise NotImplementedError('Please implement in the subclass')
 
+    def iter_distribution_names(self):
+        """
+        Return an iterator over all the distribution names known to this
+        locator. Locators which can do so return names as they're found,
+        without collecting them all first.
+
+        This implementation just iterates over what get_distribution_names
+        returns.
+        """
+        return iter(self.get_distribution_names())
+
     def get_project(self, name):
         """
         For a given project, get a dictionary mapping available versions to Distribution
         instances.
 
         This calls _get_project to do all the work, and just implements a caching layer on top.
+        If other threads call this for the same project while it's being looked up, they wait
+        for that lookup to finish and share its result.
         """
-        if self._cache is None:
-            result = self._get_project(name)
-        elif name in self._cache:
-            result = self._cache[name]
-        else:
-            result = self._get_project(name)
-            self._cache[name] = result
+        return self._get_cached_projects([name], self._get_project_dict)[name]
+
+    def _get_project_dict(self, names):
+        """
+        Look up a single project for get_project, returning a dictionary like
+        _get_projects.
+        """
+        name, = names
+        return {name: self._get_project(name)}
+
+    def _get_projects(self, names):
+        """
+        For each of a list of projects, get a dictionary mapping available
+        versions to Distribution instances. Return a dictionary mapping the
+        project names to those dictionaries.
+
+        This implementation just calls _get_project for each name in turn;
+        subclasses which can look up several projects concurrently should
+        override it.
+        """
+        result = {}
+        for name in names:
+            result[name] = self._get_project(name)
+        return result
+
+    def get_projects(self, names):
+        """
+        For each of several projects, get a dictionary mapping available
+        versions to Distribution instances.
+
+        This calls _get_projects to do all the work for the projects which
+        aren't already cached (or being looked up by another thread), and
+        returns a dictionary mapping each of the project names to the result
+        that get_project would return for it.
+        """
+        return self._get_cached_projects(names, self._get_projects)
+
+    def _get_cached_projects(self, names, lookup):
+        """
+        Get the results for several projects from the cache, from lookups
+        already in progress in other threads, or by calling ``lookup`` with a
+        list of the remaining names. Lookups made here are registered as in
+        progress until they finish, so that other threads can wait for them.
+        """
+        result = {}
+        mine = []       # names which this call looks up
+        theirs = {}     # lookups in progress elsewhere which this call needs
+        with self._in_flight_lock:
+            for name in names:
+                if name in result or name in theirs:
+                    continue
+                r = None
+                if self._cache is not None:
+                    r = self._cache.get(name)
+                if r is not None:
+                    result[name] = r
+                elif name in self._in_flight:
+                    theirs[name] = self._in_flight[name]
+                elif name not in mine:
+                    self._in_flight[name] = _InFlight()
+                    mine.append(name)
+        if mine:
+            flights = [self._in_flight[name] for name in mine]
+            try:
+                found = lookup(mine)
+                for name, flight in zip(mine, flights):
+                    r = found.get(name, {})
+                    if self._cache is not None:
+                        self._cache[name] = r
+                    result[name] = flight.result = r
+            except Exception as e:
+                for flight in flights:
+                    flight.error = e
+                raise
+            finally:
+                with self._in_flight_lock:
+                    for name in mine:
+                        del self._in_flight[name]
+                for flight in flights:
+                    flight.event.set()
+        for name, flight in theirs.items():
+            result[name] = flight.wait()
+        return result
+
+    def wheel_rank(self, url):
+        """
+        If an URL is for a wheel which is compatible with wheel_tags, return
+        the wheel's rank in a :class:`TagIndex` of those tags (lower ranks
+        are more specific). Otherwise, return None.
+        """
+        result = None
+        path = urlparse(url)[2].rstrip('/')
+        if path.endswith('.whl'):
+            m = WHEEL_FILENAME_RE.match(posixpath.basename(path))
+            if m:
+                self._check_filename_state()
+                result = self._tag_index.rank_tags(m.group('py').split('.'),
+                                                   m.group('bi').split('.'),
+                                                   m.group('ar').split('.'))
         return result
 
+    def score_candidates(self, candidates):
+        """
+        Score the candidate downloads for a version of a distribution using
+        the locator's download_scorer. Lower scores are better.
+
+        :param candidates: A list of (url, md5_digest, python_version)
+                           tuples.
+        :return: A list of the candidates' scores.
+        """
+        return self.download_scorer(self, candidates)
+
     def score_url(self, url):
         """
         Give an url a score which can be used to choose preferred URLs
@@ -164,17 +481,29 @@ class Locator(object):
         archives for the same version of a distribution (for example,
         .tar.gz vs. zip).
 
-        The current implement favours http:// URLs over https://, archives
-        from PyPI over those from other locations and then the archive name.
+        The current implement favours the more specific of two compatible
+        wheels (see wheel_rank), and otherwise http:// URLs over https://,
+        archives from PyPI over those from other locations and then the
+        archive name.
+
+        Note that locators now choose between the candidate downloads for a
+        version using :attr:`download_scorer` rather than this method.
         """
         if url1 == 'UNKNOWN':
             result = url2
         else:
             result = url2
-            s1 = self.score_url(url1)
-            s2 = self.score_url(url2)
-            if s1 > s2:
-                result = url1
+            r1 = self.wheel_rank(url1)
+            r2 = self.wheel_rank(url2)
+            if r1 is not None and r2 is not None and r1 != r2:
+                # both are compatible wheels: prefer the more specific one
+                if r1 < r2:
+                    result = url1
+            else:
+                s1 = self.score_url(url1)
+                s2 = self.score_url(url2)
+                if s1 > s2:
+                    result = url1
             if result != url2:
                 logger.debug('Not replacing %r with %r', url1, url2)
             else:
@@ -195,49 +524,145 @@ class Locator(object):
         If it is, a dictionary is returned with keys "name", "version",
         "filename" and "url"; otherwise, None is returned.
         """
-        def same_project(name1, name2):
-            name1, name2 = name1.lower(), name2.lower()
-            if name1 == name2:
-                result = True
-            else:
-                # distribute replaces '-' by '_' in project names, so it
-                # can tell where the version starts in a filename.
-                result = name1.replace('_', '-') == name2.replace('_', '-')
-            return result
-
-        result = None
-        scheme, netloc, path, params, query, frag = urlparse(url)
+        m = SIMPLE_URL.match(url)
+        if m:
+            # fast path, avoiding urlparse and urlunparse
+            path = m.group('path') or m.group('fpath') or ''
+            frag = m.group('frag') or ''
+            baseurl = m.group('url')
+        else:
+            scheme, netloc, path, params, query, frag = urlparse(url)
+            baseurl = None
         if frag.lower().startswith('egg='):
             logger.debug('%s: version hint in fragment: %r',
                          project_name, frag)
         origpath = path
         if path and path[-1] == '/':
             path = path[:-1]
-        if path.endswith('.whl'):
-            try:
-                wheel = Wheel(path)
-                if is_compatible(wheel, self.wheel_tags):
-                    if project_name is None:
-                        include = True
-                    else:
-                        include = same_project(wheel.name, project_name)
-                    if include:
-                        result = {
-                            'name': wheel.name,
-                            'version': wheel.version,
-                            'filename': wheel.filename,
-                            'url': urlunparse((scheme, netloc, origpath,
-                                               params, query, '')),
-                            'python-version': ', '.join(
-                                ['.'.join(list(v[2:])) for v in wheel.pyver]),
-                        }
-                        m = MD5_HASH.match(frag)
-                        if m:
-                            result['md5_digest'] = m.group(1)
-            except Exception as e:
-                logger.warning('invalid path for wheel: %s', path)
-        elif path.endswith(self.downloadable_extensions):
-            path = filename = posixpath.basename(path)
+        info = self._get_filename_info(path, project_name)
+        if info is None:
+            result = None
+        else:
+            result = dict(info)
+            if baseurl is None:
+                baseurl = urlunparse((scheme, netloc, origpath,
+                                      params, query, ''))
+            result['url'] = baseurl
+            m = MD5_HASH.match(frag)
+            if m:
+                result['md5_digest'] = m.group(1)
+        return result
+
+    # The maximum number of entries in the cache used by _get_filename_info.
+    max_filename_cache = 10000
+
+    def _get_filename_info(self, path, project_name):
+        """
+        Return the parts of the download information for a path which depend
+        only on its filename (i.e. everything except "url" and "md5_digest"),
+        or None if the path isn't a suitable download for the project.
+
+        As the same filenames turn up again and again (on several pages, or
+        when a project is looked up again), results are cached by filename
+        and project name. The cache is discarded if wheel_tags or
+        downloadable_extensions are set to different values.
+        """
+        cache = self._check_filename_state()
+        filename = posixpath.basename(path)
+        key = (filename, project_name)
+        if key in cache:
+            result = cache[key]
+        else:
+            if len(cache) >= self.max_filename_cache:
+                cache.clear()
+            if not path.endswith('.whl'):
+                result = self._get_archive_info(filename, project_name)
+            else:
+                m = WHEEL_FILENAME_RE.match(filename)
+                if m:
+                    result = self._get_wheel_info(m, project_name)
+                else:
+                    # Not a valid wheel filename: let Wheel decide what to
+                    # make of the whole path. As this can depend on more than
+                    # the filename, the result isn't cached.
+                    return self._get_path_wheel_info(path, project_name)
+            cache[key] = result
+        return result
+
+    def _check_filename_state(self):
+        """
+        Discard the filename cache and rebuild the wheel tag index if
+        wheel_tags or downloadable_extensions have changed. Return the cache.
+        """
+        state = (self.wheel_tags, self.downloadable_extensions)
+        if self._filename_state != state:
+            self._filename_cache.clear()
+            self._filename_state = state
+            tags = self.wheel_tags
+            if tags is None:
+                tags = COMPATIBLE_TAG_INDEX
+            elif not isinstance(tags, TagIndex):
+                tags = TagIndex(tags)
+            self._tag_index = tags
+        return self._filename_cache
+
+    def _same_project(self, name1, name2):
+        name1, name2 = name1.lower(), name2.lower()
+        if name1 == name2:
+            result = True
+        else:
+            # distribute replaces '-' by '_' in project names, so it
+            # can tell where the version starts in a filename.
+            result = name1.replace('_', '-') == name2.replace('_', '-')
+        return result
+
+    def _get_wheel_info(self, m, project_name):
+        """
+        Get the information for a wheel from a match of its filename against
+        ``WHEEL_FILENAME_RE``. This gives the same results as the more general
+        _get_path_wheel_info, without creating a Wheel instance.
+        """
+        info = m.groupdict('')
+        pyver = info['py'].split('.')
+        rank = self._tag_index.rank_tags(pyver, info['bi'].split('.'),
+                                         info['ar'].split('.'))
+        result = None
+        if rank is not None and (project_name is None or
+                           self._same_project(info['nm'], project_name)):
+            result = {
+                'name': info['nm'],
+                'version': info['vn'],
+                'filename': m.group(0),
+                'python-version': ', '.join(
+                    ['.'.join(list(v[2:])) for v in pyver]),
+            }
+        return result
+
+    def _get_path_wheel_info(self, path, project_name):
+        result = None
+        try:
+            wheel = Wheel(path)
+            if self._tag_index.is_compatible(wheel):
+                if project_name is None:
+                    include = True
+                else:
+                    include = self._same_project(wheel.name, project_name)
+                if include:
+                    result = {
+                        'name': wheel.name,
+                        'version': wheel.version,
+                        'filename': wheel.filename,
+                        'python-version': ', '.join(
+                            ['.'.join(list(v[2:])) for v in wheel.pyver]),
+                    }
+        except Exception as e:
+            logger.warning('invalid path for wheel: %s', path)
+        return result
+
+    def _get_archive_info(self, filename, project_name):
+        result = None
+        path = filename
+        if path.endswith(self.downloadable_extensions):
             for ext in self.downloadable_extensions:
                 if path.endswith(ext):
                     path = path[:-len(ext)]
@@ -246,20 +671,16 @@ class Locator(object):
                         logger.debug('No match for project/version: %s', path)
                     else:
                         name, version, pyver = t
-                        if not project_name or same_project(project_name, name):
+                        if (not project_name or
+                            self._same_project(project_name, name)):
                             result = {
                                 'name': name,
                                 'version': version,
                                 'filename': filename,
-                                'url': urlunparse((scheme, netloc, origpath,
-                                                   params, query, '')),
                                 #'packagetype': 'sdist',
                             }
                             if pyver:
                                 result['python-version'] = pyver
-                            m = MD5_HASH.match(frag)
-                            if m:
-                                result['md5_digest'] = m.group(1)
                     break
         return result
 
@@ -273,66 +694,179 @@ class Locator(object):
         version = info.pop('version')
         if version in result:
             dist = result[version]
-            md = dist.metadata
         else:
-            dist = make_dist(name, version, scheme=self.scheme)
-            md = dist.metadata
-        dist.md5_digest = info.get('md5_digest')
-        if 'python-version' in info:
-            md['Requires-Python'] = info['python-version']
-        if md['Download-URL'] != info['url']:
-            md['Download-URL'] = self.prefer_url(md['Download-URL'],
-                                                 info['url'])
+            # The metadata is only created, and the best of the candidate
+            # downloads only chosen, if they're needed
+            dist = LazyDistribution(name, version, scheme=self.scheme,
+                                    scorer=self.score_candidates)
+        dist.add_candidate(info['url'], info.get('md5_digest'),
+                           info.get('python-version'))
         dist.locator = self
         result[version] = dist
 
-    def locate(self, requirement, prereleases=False):
+    def _get_matcher(self, requirement):
         """
-        Find the most recent distribution which matches the given
-        requirement.
+        Parse a requirement passed to locate or locate_many.
 
-        :param requirement: A requirement of the form 'foo (1.0)' or perhaps
-                            'foo (>= 1.0, < 2.0, != 1.3)'
-        :param prereleases: If ``True``, allow pre-release versions
-                            to be located. Otherwise, pre-release versions
-                            are not returned.
-        :return: A :class:`Distribution` instance, or ``None`` if no such
-                 distribution could be located.
+        :return: A tuple of the parsed requirement and a version matcher for
+                 it (which ignores any extras).
+
+        Parsed requirements are cached, and matchers come from the version
+        scheme's cache, as the same requirements are located again and
+        again when resolving dependencies.
         """
-        result = None
         scheme = get_scheme(self.scheme)
-        r = parse_requirement(requirement)
+        r = self._requirement_cache.get(requirement)
         if r is None:
-            raise DistlibException('Not a valid requirement: %r' % requirement)
+            r = parse_requirement(requirement)
+            if r is None:
+                raise DistlibException('Not a valid requirement: %r' %
+                                       requirement)
+            self._requirement_cache[requirement] = r
         if r.extras:
             # lose the extras part of the requirement
             requirement = r.requirement
-        matcher = scheme.matcher(requirement)
-        vcls = matcher.version_class
+        matcher = scheme.get_matcher(requirement)
         logger.debug('matcher: %s (%s)', matcher, type(matcher).__name__)
-        versions = self.get_project(matcher.name)
-        if versions:
-            # sometimes, versions are invalid
-            slist = []
+        return r, matcher
+
+    def _get_version_index(self, versions):
+        """
+        Get an index of the versions in a result from get_project, for use
+        when selecting from it.
+
+        :param versions: A dictionary mapping versions to distributions.
+        :return: A tuple of a list of (version, parsed_version, is_prerelease)
+                 tuples, most recent version first, and a list of the
+                 versions which couldn't be parsed.
+
+        Indexes are built once for each cached project and reused, as long as
+        the scheme and the number of versions are unchanged.
+        """
+        entry = None
+        if self._cache is not None:
+            entry = self._version_index.get(id(versions))
+        if (entry is not None and entry[0] is versions and
+            entry[1] == self.scheme and entry[2] == len(versions)):
+            result = entry[3]
+        else:
+            scheme = get_scheme(self.scheme)
+            vcls = scheme.matcher.version_class
+            valid = []
+            invalid = []
             for k in versions:
                 try:
-                    if not matcher.match(k):
+                    v = vcls(k)
+                    valid.append((scheme.key(k), k, v, v.is_prerelease))
+                except Exception:
+                    invalid.append(k)
+            valid.sort(key=lambda t: t[0])
+            # newest first; of versions which compare equal, the one which
+            # a sort would put last comes first
+            result = ([t[1:] for t in reversed(valid)], invalid)
+            if self._cache is not None:
+                self._version_index[id(versions)] = (versions, self.scheme,
+                                                     len(versions), result)
+        return result
+
+    def _iter_select(self, versions, r, matcher, prereleases):
+        """
+        Generate the distributions in ``versions`` (a result from
+        get_project) which match a requirement, most recent first. The
+        versions are only matched as the distributions are asked for.
+        """
+        if versions:
+            index, invalid = self._get_version_index(versions)
+            for k in invalid:
+                # sometimes, versions are invalid
+                logger.warning('error matching %s with %r', matcher, k)
+            for k, v, is_prerelease in index:
+                try:
+                    if not matcher.match(v):
                         logger.debug('%s did not match %r', matcher, k)
-                    else:
-                        if prereleases or not vcls(k).is_prerelease:
-                            slist.append(k)
-                        else:
-                            logger.debug('skipping pre-release version %s', k)
+                        continue
+                    elif not prereleases and is_prerelease:
+                        logger.debug('skipping pre-release version %s', k)
+                        continue
                 except Exception:
                     logger.warning('error matching %s with %r', matcher, k)
-                    pass # slist.append(k)
-            if len(slist) > 1:
-                slist = sorted(slist, key=scheme.key)
-            if slist:
-                logger.debug('sorted list: %s', slist)
-                result = versions[slist[-1]]
-        if result and r.extras:
-            result.extras = r.extras
+                    continue
+                logger.debug('selected version: %s', k)
+                result = versions[k]
+                if r.extras:
+                    result.extras = r.extras
+                yield result
+
+    def _select(self, versions, r, matcher, prereleases):
+        """
+        Select the most recent distribution in ``versions`` (a result from
+        get_project) which matches a requirement.
+        """
+        for result in self._iter_select(versions, r, matcher, prereleases):
+            return result
+        return None
+
+    def locate(self, requirement, prereleases=False):
+        """
+        Find the most recent distribution which matches the given
+        requirement.
+
+        :param requirement: A requirement of the form 'foo (1.0)' or perhaps
+                            'foo (>= 1.0, < 2.0, != 1.3)'
+        :param prereleases: If ``True``, allow pre-release versions
+                            to be located. Otherwise, pre-release versions
+                            are not returned.
+        :return: A :class:`Distribution` instance, or ``None`` if no such
+                 distribution could be located.
+        """
+        r, matcher = self._get_matcher(requirement)
+        versions = self.get_project(matcher.name)
+        return self._select(versions, r, matcher, prereleases)
+
+    def iter_candidates(self, requirement, prereleases=False):
+        """
+        Iterate over the distributions which match the given requirement,
+        most recent first. The versions are only matched as the iterator
+        is advanced, so taking just the first few is cheap.
+
+        :param requirement: A requirement, of the form accepted by
+                            :meth:`locate`.
+        :param prereleases: If ``True``, allow pre-release versions
+                            to be returned.
+        :return: An iterator over :class:`Distribution` instances.
+        """
+        r, matcher = self._get_matcher(requirement)
+        versions = self.get_project(matcher.name)
+        return self._iter_select(versions, r, matcher, prereleases)
+
+    def locate_many(self, requirements, prereleases=False):
+        """
+        Find the most recent distribution matching each of several
+        requirements. The projects named in the requirements are looked up
+        with a single call to get_projects, so that locators which can fetch
+        several projects concurrently will do so.
+
+        :param requirements: An iterable of requirements, each of the form
+                             accepted by :meth:`locate`.
+        :param prereleases: If ``True``, allow pre-release versions
+                            to be located. Otherwise, pre-release versions
+                            are not returned.
+        :return: A dictionary mapping each requirement to a
+                 :class:`Distribution` instance, or to ``None`` if no
+                 distribution could be located for it.
+        """
+        parsed = []
+        names = {}  # project names, keyed case-insensitively
+        for requirement in requirements:
+            r, matcher = self._get_matcher(requirement)
+            parsed.append((requirement, r, matcher))
+            names.setdefault(matcher.key, matcher.name)
+        projects = self.get_projects(sorted(names.values()))
+        result = {}
+        for requirement, r, matcher in parsed:
+            versions = projects[names[matcher.key]]
+            result[requirement] = self._select(versions, r, matcher,
+                                               prereleases)
         return result
 
 
@@ -340,17 +874,33 @@ class PyPIRPCLocator(Locator):
     """
     This locator uses XML-RPC to locate distributions. It therefore cannot be
     used with simple mirrors (that only mirror file content).
+
+    The information for a project's releases is fetched in chunks using
+    ``system.multicall`` requests where the server supports it, or otherwise
+    by concurrent requests from a bounded number of worker threads.
     """
-    def __init__(self, url, **kwargs):
+    def __init__(self, url, timeout=3.0, num_workers=10, multicall=None,
+                 **kwargs):
         """
         Initialise an instance.
 
         :param url: The URL to use for XML-RPC.
+        :param timeout: The timeout, in seconds, to be applied to requests.
+        :param num_workers: The maximum number of worker threads used to
+                            fetch the information for a project's releases,
+                            when multicall isn't used.
+        :param multicall: Whether to batch the calls for a project's
+                          releases using ``system.multicall``. If ``None``
+                          (the default), it's tried and, if the server
+                          doesn't support it, not tried again.
         :param kwargs: Passed to the superclass constructor.
         """
         super(PyPIRPCLocator, self).__init__(**kwargs)
         self.base_url = url
-        self.client = ServerProxy(url, timeout=3.0)
+        self.timeout = timeout
+        self.num_workers = num_workers
+        self.multicall = multicall
+        self.client = ServerProxy(url, timeout=timeout)
 
     def get_distribution_names(self):
         """
@@ -358,12 +908,14 @@ class PyPIRPCLocator(Locator):
         """
         return set(self.client.list_packages())
 
+    def iter_distribution_names(self):
+        return iter(self.client.list_packages())
+
     def _get_project(self, name):
         result = {}
         versions = self.client.package_releases(name, True)
-        for v in versions:
-            urls = self.client.release_urls(name, v)
-            data = self.client.release_data(name, v)
+        releases = self._get_releases(name, versions)
+        for v, (urls, data) in zip(versions, releases):
             metadata = Metadata(scheme=self.scheme)
             metadata.update(data)
             dist = Distribution(metadata)
@@ -375,6 +927,111 @@ class PyPIRPCLocator(Locator):
                 result[v] = dist
         return result
 
+    # The maximum number of versions whose information is asked for in a
+    # single system.multicall request.
+    multicall_size = 100
+
+    def _get_releases(self, name, versions):
+        """
+        Get the URLs and release data for each of a project's versions.
+
+        :return: A list of (urls, data) tuples, one for each version.
+        """
+        result = None
+        if versions and self.multicall is not False:
+            try:
+                result = self._get_releases_by_multicall(name, versions)
+                self.multicall = True
+            except xmlrpclib.Fault as e:
+                if self.multicall or not self._is_multicall_fault(e):
+                    raise
+                logger.debug('Not using multicall for %s: %s', self.base_url,
+                             e)
+                self.multicall = False
+        if result is None:
+            result = self._get_releases_concurrently(name, versions)
+        return result
+
+    def _is_multicall_fault(self, fault):
+        """
+        Say whether a fault means that the server doesn't support
+        ``system.multicall``.
+        """
+        return (fault.faultCode == xmlrpclib.METHOD_NOT_FOUND or
+                'system.multicall' in str(fault.faultString))
+
+    def _get_releases_by_multicall(self, name, versions):
+        """
+        Get the URLs and release data for each of a project's versions, as
+        for _get_releases, using ``system.multicall`` requests for up to
+        multicall_size versions at a time. The information for versions
+        whose calls fail is then fetched using separate calls.
+        """
+        result = []
+        failed = []
+        for i in range(0, len(versions), self.multicall_size):
+            chunk = versions[i:i + self.multicall_size]
+            multicall = xmlrpclib.MultiCall(self.client)
+            for v in chunk:
+                multicall.release_urls(name, v)
+                multicall.release_data(name, v)
+            answers = multicall()
+            for j, v in enumerate(chunk):
+                try:
+                    result.append((answers[2 * j], answers[2 * j + 1]))
+                except xmlrpclib.Fault as e:
+                    logger.debug('Multicall failed for %s %s: %s', name, v, e)
+                    failed.append(len(result))
+                    result.append(None)
+        if failed:
+            retried = self._get_releases_concurrently(
+                        name, [versions[i] for i in failed])
+            for i, r in zip(failed, retried):
+                result[i] = r
+        return result
+
+    def _get_releases_concurrently(self, name, versions):
+        """
+        Get the URLs and release data for each of a project's versions, as
+        for _get_releases, using up to num_workers threads. As ServerProxy
+        instances can't be shared between threads, each has its own.
+        """
+        result = [None] * len(versions)
+        errors = []
+        todo = queue.Queue()
+        for i, v in enumerate(versions):
+            todo.put((i, v))
+
+        def work():
+            client = ServerProxy(self.base_url, timeout=self.timeout)
+            while not errors:
+                try:
+                    i, v = todo.get(block=False)
+                except queue.Empty:
+                    break
+                try:
+                    result[i] = (client.release_urls(name, v),
+                                 client.release_data(name, v))
+                except Exception as e:
+                    errors.append(e)
+
+        num_workers = min(self.num_workers, len(versions))
+        if num_workers <= 1:
+            # no need for any threads
+            work()
+        else:
+            threads = []
+            for i in range(num_workers):
+                t = threading.Thread(target=work)
+                t.setDaemon(True)
+                t.start()
+                threads.append(t)
+            for t in threads:
+                t.join()
+        if errors:
+            raise errors[0]
+        return result
+
 class PyPIJSONLocator(Locator):
     """
     This locator uses PyPI's JSON interface. It's very limited in functionality
@@ -456,95 +1113,812 @@ href\s*=\s*(?:"(?P<url1>[^"]*)"|'(?P<url2>[^']*)'|(?P<url3>[^>\s\n]*))
 
         result = set()
         for match in self._href.finditer(self.data):
-            d = match.groupdict('')
-            rel = (d['rel1'] or d['rel2'] or d['rel3'] or
-                   d['rel4'] or d['rel5'] or d['rel6'])
-            url = d['url1'] or d['url2'] or d['url3']
-            url = urljoin(self.base_url, url)
-            url = unescape(url)
-            url = self._clean_re.sub(lambda m: '%%%2x' % ord(m.group(0)), url)
-            result.add((url, rel))
+            result.add(self._make_link(self.base_url, match))
         # We sort the result, hoping to bring the most recent versions
         # to the front
         result = sorted(result, key=lambda t: t[0], reverse=True)
         return result
 
+    @classmethod
+    def _make_link(cls, base_url, match):
+        """
+        Return the (url, rel) tuple for a match of the ``_href`` regex.
+        """
+        d = match.groupdict('')
+        rel = (d['rel1'] or d['rel2'] or d['rel3'] or
+               d['rel4'] or d['rel5'] or d['rel6'])
+        url = d['url1'] or d['url2'] or d['url3']
+        url = urljoin(base_url, url)
+        url = unescape(url)
+        url = cls._clean_re.sub(lambda m: '%%%2x' % ord(m.group(0)), url)
+        return url, rel
+
 
-class SimpleScrapingLocator(Locator):
+class LinkScanner(object):
     """
-    A locator which scrapes HTML pages to locate downloads for a distribution.
-    This runs multiple threads to do the I/O; performance is at least as good
-    as pip's PackageFinder, which works in an analogous fashion.
+    This class finds the links on an HTML page incrementally, as the text of
+    the page arrives. Only the text after the last tag seen is kept between
+    calls to :meth:`feed`, so the memory used doesn't grow with the size of
+    the page.
     """
-
-    # These are used to deal with various Content-Encoding schemes.
-    decoders = {
-        'deflate': zlib.decompress,
-        'gzip': lambda b: gzip.GzipFile(fileobj=BytesIO(d)).read(),
-        'none': lambda b: b,
-    }
-
-    def __init__(self, url, timeout=None, num_workers=10, **kwargs):
+    def __init__(self, url, max_buffer=65536):
         """
         Initialise an instance.
-        :param url: The root URL to use for scraping.
-        :param timeout: The timeout, in seconds, to be applied to requests.
-                        This defaults to ``None`` (no timeout specified).
-        :param num_workers: The number of worker threads you want to do I/O,
-                            This defaults to 10.
-        :param kwargs: Passed to the superclass.
+
+        :param url: The URL of the page being scanned.
+        :param max_buffer: The maximum length of an incomplete tag which is
+                           kept while waiting for the rest of it. Longer
+                           fragments are assumed to be junk and are dropped.
         """
-        super(SimpleScrapingLocator, self).__init__(**kwargs)
-        self.base_url = ensure_slash(url)
-        self.timeout = timeout
-        self._page_cache = {}
-        self._seen = set()
-        self._to_fetch = queue.Queue()
-        self._bad_hosts = set()
-        self.skip_externals = False
-        self.num_workers = num_workers
-        self._lock = threading.RLock()
+        self.base_url = self.url = url
+        self.max_buffer = max_buffer
+        self._buffer = ''
+        self._base_seen = False
 
-    def _prepare_threads(self):
+    def feed(self, data):
         """
-        Threads are created only when get_project is called, and terminate
-        before it returns. They are there primarily to parallelise I/O (i.e.
-        fetching web pages).
+        Scan the next piece of a page's text.
+
+        :param data: The text, which needn't end on a tag boundary.
+        :return: A list of (url, rel) tuples for the links found. Unlike
+                 :attr:`Page.links`, these are in the order they appear on
+                 the page, and may contain duplicates.
         """
-        self._threads = []
-        for i in range(self.num_workers):
-            t = threading.Thread(target=self._fetch)
-            t.setDaemon(True)
-            t.start()
-            self._threads.append(t)
+        text = self._buffer + data
+        # A link can't extend beyond the end of the tag it's in, so all the
+        # text up to the last '>' can be scanned now. The rest is kept until
+        # the tag it may contain is completed.
+        i = text.rfind('>') + 1
+        text, rest = text[:i], text[i:]
+        if len(rest) > self.max_buffer:
+            i = rest.rfind('<')
+            if i < 0 or len(rest) - i > self.max_buffer:
+                rest = ''
+            else:
+                rest = rest[i:]
+        self._buffer = rest
+        if not self._base_seen:
+            m = Page._base.search(text)
+            if m:
+                self.base_url = m.group(1)
+                self._base_seen = True
+        base_url = self.base_url
+        make_link = Page._make_link
+        return [make_link(base_url, m) for m in Page._href.finditer(text)]
+
+
+class _NameScanner(object):
+    """
+    This class finds the project names on an index's root page incrementally,
+    in the same way as :class:`LinkScanner` finds links.
+    """
+    def __init__(self, pattern, max_buffer=65536):
+        """
+        Initialise an instance.
+
+        :param pattern: A compiled regex whose first group matches a name,
+                        and whose matches end with a '<'.
+        :param max_buffer: As for :class:`LinkScanner`.
+        """
+        self.pattern = pattern
+        self.max_buffer = max_buffer
+        self._buffer = ''
+
+    def feed(self, data):
+        """
+        Scan the next piece of a page's text.
+
+        :return: A list of the names found.
+        """
+        text = self._buffer + data
+        # A match can't extend beyond the '<' which ends it, so all the text
+        # up to the last '<' can be scanned now. That '<' may begin a match,
+        # so it's kept with the rest.
+        i = text.rfind('<') + 1
+        text, rest = text[:i], text[max(i - 1, 0):]
+        if len(rest) > self.max_buffer:
+            rest = ''
+        self._buffer = rest
+        return [m.group(1) for m in self.pattern.finditer(text)]
+
+
+class NameIndex(object):
+    """
+    A sorted list of distribution names, which can be saved to a file and
+    searched by prefix. Names are compared case-insensitively, and each is
+    held once. Searches use binary search, so they take O(log n) time
+    however many names the index holds.
+    """
+    def __init__(self, names=None, path=None):
+        """
+        Initialise an instance.
+
+        :param names: An iterable of names to add to the index.
+        :param path: The path of a file to load names from (and to save
+                     them to, by default). It's not an error if the file
+                     doesn't exist.
+        """
+        self.path = path
+        self._keys = []
+        self._names = []
+        if path and os.path.exists(path):
+            self.load(path)
+        if names is not None:
+            self.update(names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __contains__(self, name):
+        key = name.lower()
+        i = bisect_left(self._keys, key)
+        return i < len(self._keys) and self._keys[i] == key
+
+    def update(self, names):
+        """
+        Add names to the index.
+
+        :param names: An iterable of names, such as the iterator returned by
+                      :meth:`Locator.iter_distribution_names`.
+        """
+        d = dict(zip(self._keys, self._names))
+        for name in names:
+            key = name.lower()
+            if key not in d:
+                d[key] = name
+        self._keys = sorted(d)
+        self._names = [d[k] for k in self._keys]
+
+    def search(self, prefix):
+        """
+        Find the names which start with a prefix.
+
+        :param prefix: The prefix to search for (case-insensitively).
+        :return: A list of the matching names, in sorted order.
+        """
+        key = prefix.lower()
+        keys = self._keys
+        i = j = bisect_left(keys, key)
+        n = len(keys)
+        while j < n and keys[j].startswith(key):
+            j += 1
+        return self._names[i:j]
+
+    def load(self, path=None):
+        """
+        Replace the names in the index with those saved in a file.
+
+        :param path: The file to load. If not specified, :attr:`path` is
+                     used.
+        """
+        path = path or self.path
+        with codecs.open(path, 'r', encoding='utf-8') as f:
+            names = [line.rstrip('\n') for line in f]
+        self._keys = []
+        self._names = []
+        self.update(name for name in names if name)
+
+    def save(self, path=None):
+        """
+        Save the names in the index to a file, one per line, in sorted order.
+
+        :param path: The file to save to. If not specified, :attr:`path` is
+                     used.
+        """
+        path = path or self.path
+        with codecs.open(path, 'w', encoding='utf-8') as f:
+            for name in self._names:
+                f.write(name + '\n')
+
+
+class PageCache(object):
+    """
+    A persistent cache for pages fetched by a :class:`SimpleScrapingLocator`.
+    Each page is stored in its own file, together with the validators
+    (``ETag`` and ``Last-Modified`` headers) needed to revalidate it with a
+    conditional request once it's older than the cache's time-to-live.
+    """
+    def __init__(self, base=None, ttl=600, max_size=50 * 1024 * 1024,
+                 offline=False):
+        """
+        Initialise an instance.
+
+        :param base: The directory where pages are stored. If not specified,
+                     this will be the ``page-cache`` directory under whatever
+                     :func:`get_cache_base` returns.
+        :param ttl: The time, in seconds, for which a cached page is used
+                    without revalidating it with the server.
+        :param max_size: The maximum size in bytes of the cached pages. When
+                         it's exceeded, the least recently used pages are
+                         removed. If ``None``, the size is unbounded.
+        :param offline: If ``True``, cached pages are always used, however
+                        old they are, and pages which aren't cached are not
+                        fetched.
+        """
+        if base is None:
+            base = os.path.join(get_cache_base(), 'page-cache')
+        # we use 'isdir' instead of 'exists', because we want to
+        # fail if there's a file with that name
+        if not os.path.isdir(base):
+            os.makedirs(base)
+        self.base = os.path.abspath(os.path.normpath(base))
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self._lock = threading.RLock()
+
+    def _path(self, url):
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.base, digest + '.json')
+
+    def get(self, url):
+        """
+        Get the cache entry for an URL.
+
+        :param url: The URL of the page.
+        :return: A dictionary with keys ``url``, ``data``, ``etag``,
+                 ``last_modified`` and ``fetched`` (the time the page was
+                 last fetched or revalidated), or ``None`` if the page
+                 isn't in the cache.
+        """
+        path = self._path(url)
+        result = None
+        with self._lock:
+            if os.path.isfile(path):
+                try:
+                    with open(path, 'rb') as f:
+                        result = json.loads(f.read().decode('utf-8'))
+                    # record the access for LRU eviction
+                    os.utime(path, None)
+                except Exception as e:
+                    logger.warning('Unable to read cached page for %s: %s',
+                                   url, e)
+                    result = None
+        return result
+
+    def is_fresh(self, entry):
+        """
+        Say whether a cache entry can be used without revalidating it.
+        """
+        return (self.offline or
+                (time.time() - entry['fetched']) < self.ttl)
+
+    def put(self, url, entry):
+        """
+        Store an entry for an URL, evicting other entries if the cache has
+        grown too big.
+        """
+        path = self._path(url)
+        # json.dumps escapes non-ASCII characters by default
+        data = json.dumps(entry).encode('ascii')
+        with self._lock:
+            tmp = path + '.tmp'
+            try:
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                if os.path.exists(path):
+                    os.remove(path)
+                os.rename(tmp, path)
+            except Exception as e:
+                logger.warning('Unable to cache page for %s: %s', url, e)
+            else:
+                self.evict()
+
+    def refresh(self, url, entry):
+        """
+        Mark an entry as having been revalidated by the server just now.
+        """
+        entry['fetched'] = time.time()
+        self.put(url, entry)
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache is no bigger than
+        ``max_size``.
+        """
+        if self.max_size is None:
+            return
+        with self._lock:
+            entries = []
+            total = 0
+            for fn in os.listdir(self.base):
+                if not fn.endswith('.json'):
+                    continue
+                path = os.path.join(self.base, fn)
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+            if total > self.max_size:
+                entries.sort()
+                for _, size, path in entries:
+                    os.remove(path)
+                    total -= size
+                    if total <= self.max_size:
+                        break
+
+    def clear(self):
+        """
+        Clear the cache.
+        """
+        with self._lock:
+            for fn in os.listdir(self.base):
+                if fn.endswith(('.json', '.tmp')):
+                    os.remove(os.path.join(self.base, fn))
+
+
+class _HostState(object):
+    """
+    The health of a single host, as tracked by :class:`HostHealth`.
+    """
+    def __init__(self, tokens):
+        self.state = HostHealth.CLOSED
+        self.failures = 0       # consecutive failures
+        self.retry_at = 0       # when the host can next be tried
+        self.probing = False    # whether a half-open probe is in progress
+        self.tokens = tokens    # the retry budget left
+        self.stats = {
+            'successes': 0,
+            'total_failures': 0,
+            'retries': 0,
+            'rejected': 0,
+            'trips': 0,
+        }
+
+
+class HostHealth(object):
+    """
+    This class tracks the health of the hosts which pages are fetched from,
+    with a circuit breaker for each host.
+
+    After a failure, a host isn't tried again until a backoff delay, which
+    doubles with each consecutive failure and has random jitter added, has
+    passed. After ``max_failures`` consecutive failures, the circuit opens
+    and the host isn't tried for ``cooldown`` seconds. The circuit is then
+    half-open: a single request is let through to probe the host, and the
+    circuit closes again if it succeeds, or reopens if it fails.
+
+    Transient errors (HTTP 5xx responses) can be retried, up to
+    ``max_retries`` times for each request. Each retry uses up one unit of
+    the host's retry budget, which holds at most ``retry_budget`` units and
+    is topped up by ``retry_ratio`` units for each successful request, so
+    that retries can't multiply the load on a host which is struggling.
+
+    An instance can be shared between threads, and between locators.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    # The maximum number of hosts tracked by default. The least recently
+    # used are forgotten first.
+    max_hosts = 1000
+
+    def __init__(self, max_failures=3, backoff=1.0, max_backoff=60.0,
+                 jitter=0.1, cooldown=300.0, max_retries=2, retry_budget=10,
+                 retry_ratio=0.1, timer=None, cache_policy=None):
+        """
+        Initialise an instance.
+
+        :param max_failures: The number of consecutive failures after which
+                             a host's circuit opens.
+        :param backoff: The delay, in seconds, after a first failure (and
+                        before a first retry). It doubles for each
+                        subsequent one.
+        :param max_backoff: The maximum backoff delay, in seconds.
+        :param jitter: The maximum random jitter added to a backoff delay, as
+                       a fraction of the delay.
+        :param cooldown: The time, in seconds, for which an open circuit
+                         stays open before it's half-open.
+        :param max_retries: The maximum number of retries for each request.
+        :param retry_budget: The maximum retry budget for each host.
+        :param retry_ratio: The amount added to a host's retry budget by
+                            each successful request.
+        :param timer: A callable returning the current time, which defaults
+                      to :func:`time.time`.
+        :param cache_policy: A :class:`CachePolicy` which bounds the cache of
+                             the hosts' states. If ``None`` (the default),
+                             up to ``max_hosts`` hosts are tracked.
+        """
+        if cache_policy is None:
+            cache_policy = CachePolicy(max_entries=self.max_hosts)
+        self.max_failures = max_failures
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.cooldown = cooldown
+        self.max_retries = max_retries
+        self.retry_budget = retry_budget
+        self.retry_ratio = retry_ratio
+        self.timer = timer or time.time
+        self._hosts = cache_policy.make_cache()
+        self._lock = threading.Lock()
+
+    def _get(self, host):
+        # Call with the lock held.
+        result = self._hosts.get(host)
+        if result is None:
+            result = self._hosts[host] = _HostState(self.retry_budget)
+        return result
+
+    def delay(self, count):
+        """
+        Get a backoff delay.
+
+        :param count: The number of consecutive failures (or retries) so far.
+        :return: The delay in seconds, with jitter added.
+        """
+        result = min(self.max_backoff, self.backoff * 2 ** (count - 1))
+        return result + random.uniform(0, result * self.jitter)
+
+    def allow(self, host):
+        """
+        Check whether a request can be made to a host now. If the host's
+        circuit is half-open, this lets through a single request, whose
+        outcome must be recorded with :meth:`record_success` or
+        :meth:`record_failure`, or which must be ended with :meth:`release`
+        if its outcome says nothing about the host.
+
+        :param host: The host name.
+        :return: ``True`` if the request can be made, else ``False``.
+        """
+        with self._lock:
+            h = self._get(host)
+            now = self.timer()
+            if h.state == self.OPEN and now >= h.retry_at:
+                h.state = self.HALF_OPEN
+                h.probing = False
+            if h.state == self.HALF_OPEN:
+                result = not h.probing
+                h.probing = True
+            else:
+                result = now >= h.retry_at
+            if not result:
+                h.stats['rejected'] += 1
+            return result
+
+    def record_success(self, host):
+        """
+        Record a successful request to a host. This closes its circuit.
+        """
+        with self._lock:
+            h = self._get(host)
+            h.state = self.CLOSED
+            h.failures = 0
+            h.retry_at = 0
+            h.probing = False
+            h.tokens = min(self.retry_budget, h.tokens + self.retry_ratio)
+            h.stats['successes'] += 1
+
+    def record_failure(self, host):
+        """
+        Record a failed request to a host.
+        """
+        with self._lock:
+            h = self._get(host)
+            now = self.timer()
+            h.failures += 1
+            h.stats['total_failures'] += 1
+            h.probing = False
+            if h.state == self.HALF_OPEN or h.failures >= self.max_failures:
+                if h.state != self.OPEN:
+                    h.stats['trips'] += 1
+                h.state = self.OPEN
+                h.retry_at = now + self.cooldown
+            else:
+                h.retry_at = now + self.delay(h.failures)
+
+    def release(self, host):
+        """
+        End a request to a host without recording its outcome, as when it
+        failed for a reason which has nothing to do with the host. If the
+        request was probing a half-open circuit, another probe is let
+        through.
+        """
+        with self._lock:
+            h = self._get(host)
+            h.probing = False
+
+    def retry(self, host):
+        """
+        Check whether a request to a host which failed with a transient error
+        can be retried, using up some of the host's retry budget if so.
+
+        :return: ``True`` if the request can be retried, else ``False``.
+        """
+        with self._lock:
+            h = self._get(host)
+            result = h.tokens >= 1
+            if result:
+                h.tokens -= 1
+                h.stats['retries'] += 1
+            return result
+
+    def get_state(self, host):
+        """
+        Get the state of a host's circuit: ``'closed'``, ``'open'`` or
+        ``'half-open'``.
+        """
+        with self._lock:
+            h = self._hosts.get(host)
+            return h.state if h else self.CLOSED
+
+    def reset(self, host=None):
+        """
+        Forget what's known about a host, or about all hosts if ``host`` is
+        ``None``.
+        """
+        with self._lock:
+            if host is None:
+                self._hosts.clear()
+            else:
+                self._hosts.pop(host, None)
+
+    def cache_stats(self):
+        """
+        Get statistics for the cache of the hosts' states, as returned by
+        :meth:`LRUCache.stats`.
+        """
+        return self._hosts.stats()
+
+    def stats(self):
+        """
+        Get statistics for the hosts which have been tried.
+
+        :return: A dictionary mapping host names to dictionaries with the
+                 host's ``state``, its number of consecutive ``failures``
+                 and its remaining ``retry_budget``, and counts of its
+                 ``successes``, ``total_failures``, ``retries``,
+                 ``rejected`` requests and circuit ``trips``.
+        """
+        result = {}
+        with self._lock:
+            for host, h in self._hosts.items():
+                d = dict(h.stats)
+                d.update(state=h.state, failures=h.failures,
+                         retry_budget=h.tokens)
+                result[host] = d
+        return result
+
+
+class _ScrapeBatch(object):
+    """
+    Keeps count of the URLs queued for a call to
+    SimpleScrapingLocator._get_projects which haven't been processed yet, so
+    that the call can wait for just its own work to be done (the worker
+    threads are shared by all calls).
+    """
+    def __init__(self):
+        self.pending = 0
+        self.cond = threading.Condition()
+
+    def add(self):
+        with self.cond:
+            self.pending += 1
+
+    def done(self):
+        with self.cond:
+            self.pending -= 1
+            if not self.pending:
+                self.cond.notify_all()
+
+    def wait(self):
+        with self.cond:
+            while self.pending:
+                self.cond.wait()
+
+
+class _ScrapedProject(object):
+    """
+    The state of a scrape for one project: its name, the result being built
+    up and the links which have already been seen on its pages.
+    """
+    def __init__(self, name, batch):
+        self.name = name
+        self.batch = batch
+        self.result = {}
+        self.seen = set()
+
+
+class _Decompressor(object):
+    """
+    Decompresses a response body which has a Content-Encoding, a piece at a
+    time as it's read.
+    """
+    def __init__(self, encoding):
+        """
+        Initialise an instance.
+
+        :param encoding: The content encoding, which must be one of the keys
+                         of :attr:`SimpleScrapingLocator.decompressors`.
+        """
+        self.encoding = encoding
+        if encoding in ('gzip', 'x-gzip'):
+            self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._obj = zlib.decompressobj()
+        elif encoding == 'br':
+            self._obj = brotli.Decompressor()
+        else:
+            raise ValueError('Unsupported content encoding: %r' % encoding)
+        self._started = False
+
+    def decompress(self, data):
+        if self.encoding == 'br':
+            if hasattr(self._obj, 'process'):
+                return self._obj.process(data)
+            return self._obj.decompress(data)
+        try:
+            result = self._obj.decompress(data)
+        except zlib.error:
+            if self.encoding != 'deflate' or self._started:
+                raise
+            # Some servers send raw deflate data, without the zlib header.
+            self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+            result = self._obj.decompress(data)
+        self._started = True
+        return result
+
+    def flush(self):
+        if self.encoding == 'br':
+            return b''
+        return self._obj.flush()
+
+
+class SimpleScrapingLocator(Locator):
+    """
+    A locator which scrapes HTML pages to locate downloads for a distribution.
+    This runs multiple threads to do the I/O; performance is at least as good
+    as pip's PackageFinder, which works in an analogous fashion.
+    """
+
+    # The number of bytes read from a response at a time.
+    chunk_size = 16384
+
+    # The maximum number of chunks' worth of names which
+    # iter_distribution_names reads ahead of its caller.
+    max_queued_chunks = 16
+
+    # The number of seconds after which an idle worker thread terminates, so
+    # that locators which are never closed don't hold on to threads (which
+    # keep the locator alive). If None, worker threads live until the
+    # locator is closed.
+    idle_timeout = 5.0
+
+    # These are used to deal with various Content-Encoding schemes. Each
+    # maps an encoding to a callable which returns an object with
+    # decompress(data) and flush() methods, like a zlib decompression
+    # object. Pages are requested with any of these encodings, so that they
+    # can be transferred compressed. Setting this to an empty dictionary on
+    # an instance means uncompressed pages are asked for.
+    decompressors = {
+        'gzip': _Decompressor,
+        'x-gzip': _Decompressor,
+        'deflate': _Decompressor,
+    }
+    if brotli:
+        decompressors['br'] = _Decompressor
+
+    def __init__(self, url, timeout=None, num_workers=10, page_cache=None,
+                 host_health=None, **kwargs):
+        """
+        Initialise an instance.
+        :param url: The root URL to use for scraping.
+        :param timeout: The timeout, in seconds, to be applied to requests.
+                        This defaults to ``None`` (no timeout specified).
+        :param num_workers: The number of worker threads you want to do I/O,
+                            This defaults to 10.
+        :param page_cache: A :class:`PageCache` instance used to persist
+                           fetched pages across locator instances. This
+                           defaults to ``None`` (pages are only cached in
+                           memory).
+        :param host_health: A :class:`HostHealth` instance which decides
+                            when hosts which have failed are tried again.
+                            If ``None`` (the default), one with default
+                            settings is used.
+        :param kwargs: Passed to the superclass.
+        """
+        super(SimpleScrapingLocator, self).__init__(**kwargs)
+        self.base_url = ensure_slash(url)
+        self.timeout = timeout
+        self.page_cache = page_cache
+        self._page_cache = self.cache_policy.make_cache(self._page_size)
+        self._to_fetch = queue.Queue()
+        if host_health is None:
+            host_health = HostHealth()
+        self.host_health = host_health
+        self.skip_externals = False
+        self.num_workers = num_workers
+        self._lock = threading.RLock()
+        self._threads = []
+        self._active_batches = 0
+        # Connections are kept open and shared by the worker threads.
+        self._keep_alive = KeepAliveHandler(max_idle=num_workers)
+        self.opener = build_opener(RedirectHandler(), self._keep_alive)
+
+    def _prepare_threads(self):
+        """
+        Threads are created when get_project or get_projects is called, and
+        live until the locator is closed or until they have been idle for
+        ``idle_timeout`` seconds, so that they can be reused by calls made
+        soon afterwards. They are there primarily to parallelise I/O (i.e.
+        fetching web pages).
+        """
+        with self._lock:
+            while len(self._threads) < self.num_workers:
+                t = threading.Thread(target=self._fetch)
+                t.setDaemon(True)
+                t.start()
+                self._threads.append(t)
 
     def _wait_threads(self):
         """
         Tell all the threads to terminate (by sending a sentinel value) and
         wait for them to do so.
         """
+        with self._lock:
+            threads, self._threads = self._threads, []
         # Note that you need two loops, since you can't say which
         # thread will get each sentinel
-        for t in self._threads:
+        for t in threads:
             self._to_fetch.put(None)    # sentinel
-        for t in self._threads:
+        for t in threads:
             t.join()
-        self._threads = []
+
+    def close(self):
+        """
+        Stop the worker threads and close any idle HTTP connections.
+        """
+        self._wait_threads()
+        self._keep_alive.close()
+
+    def _page_size(self, page):
+        if page is None:
+            result = 0
+        else:
+            result = len(page.data)
+        return result
+
+    def cache_stats(self):
+        result = super(SimpleScrapingLocator, self).cache_stats()
+        result['pages'] = self._page_cache.stats()
+        result['hosts'] = self.host_health.cache_stats()
+        return result
 
     def _get_project(self, name):
-        self.result = result = {}
-        self.project_name = name
-        url = urljoin(self.base_url, '%s/' % quote(name))
-        self._seen.clear()
-        self._page_cache.clear()
-        self._prepare_threads()
+        return self._get_projects([name])[name]
+
+    def _get_projects(self, names):
+        """
+        Scrape the pages for several projects at once. All the projects share
+        the same worker threads, so at most ``num_workers`` pages are being
+        fetched at any time, whatever the number of projects.
+        """
+        batch = _ScrapeBatch()
+        projects = [_ScrapedProject(name, batch) for name in names]
+        # The lock stops idle threads exiting while work is being queued.
+        with self._lock:
+            # Pages are only cached in memory while scrapes are in progress,
+            # so don't discard those which other calls are still using.
+            if not self._active_batches:
+                self._page_cache.clear()
+            self._active_batches += 1
+            self._prepare_threads()
+            for project in projects:
+                url = urljoin(self.base_url, '%s/' % quote(project.name))
+                logger.debug('Queueing %s', url)
+                batch.add()
+                self._to_fetch.put((url, project))
         try:
-            logger.debug('Queueing %s', url)
-            self._to_fetch.put(url)
-            self._to_fetch.join()
+            batch.wait()
         finally:
-            self._wait_threads()
-        del self.result
+            with self._lock:
+                self._active_batches -= 1
+        result = {}
+        for project in projects:
+            result[project.name] = project.result
         return result
 
     platform_dependent = re.compile(r'\b(linux-(i\d86|x86_64|arm\w+)|'
@@ -556,12 +1930,12 @@ class SimpleScrapingLocator(Locator):
         """
         return self.platform_dependent.search(url)
 
-    def _process_download(self, url):
+    def _process_download(self, url, project):
         """
         See if an URL is a suitable download for a project.
 
-        If it is, register information in the result dictionary (for
-        _get_project) about the specific version it's for.
+        If it is, register information in the project's result dictionary (for
+        _get_projects) about the specific version it's for.
 
         Note that the return value isn't actually used other than as a boolean
         value.
@@ -569,11 +1943,11 @@ class SimpleScrapingLocator(Locator):
         if self._is_platform_dependent(url):
             info = None
         else:
-            info = self.convert_url_to_download_info(url, self.project_name)
+            info = self.convert_url_to_download_info(url, project.name)
         logger.debug('process_download: %s -> %s', url, info)
         if info:
-            with self._lock:    # needed because self.result is shared
-                self._update_version_data(self.result, info)
+            with self._lock:    # needed because the result is shared
+                self._update_version_data(project.result, info)
         return info
 
     def _should_queue(self, link, referrer, rel):
@@ -613,104 +1987,562 @@ class SimpleScrapingLocator(Locator):
         This is a handy method to run in a thread.
         """
         while True:
-            url = self._to_fetch.get()
             try:
-                if url:
-                    page = self.get_page(url)
-                    if page is None:    # e.g. after an error
-                        continue
-                    for link, rel in page.links:
-                        if link not in self._seen:
-                            self._seen.add(link)
-                            if (not self._process_download(link) and
-                                self._should_queue(link, url, rel)):
-                                logger.debug('Queueing %s from %s', link, url)
-                                self._to_fetch.put(link)
+                item = self._to_fetch.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                # Idle for a while, so stop this thread unless there's work
+                # for it after all, or the threads are being shut down (in
+                # which case a sentinel is on its way).
+                with self._lock:
+                    me = threading.current_thread()
+                    if me in self._threads and self._to_fetch.empty():
+                        self._threads.remove(me)
+                        break
+                continue
+            try:
+                if item:
+                    url, project = item
+                    # Links are processed as they're found, so downloads can
+                    # be considered before a large page has been fully read.
+                    def process_links(links):
+                        for link, rel in links:
+                            with self._lock:
+                                seen = link in project.seen
+                                project.seen.add(link)
+                            if not seen:
+                                if (not self._process_download(link, project)
+                                    and self._should_queue(link, url, rel)):
+                                    logger.debug('Queueing %s from %s', link,
+                                                 url)
+                                    project.batch.add()
+                                    self._to_fetch.put((link, project))
+
+                    self._get_page(url, process_links)
             finally:
                 # always do this, to avoid hangs :-)
                 self._to_fetch.task_done()
-            if not url:
+                if item:
+                    item[1].batch.done()
+            if not item:
                 #logger.debug('Sentinel seen, quitting.')
                 break
 
     def get_page(self, url):
         """
-        Get the HTML for an URL, possibly from an in-memory cache.
+        Get the HTML for an URL, possibly from an in-memory cache or from the
+        persistent :attr:`page_cache`, if one was specified.
 
-        XXX TODO Note: this cache is never actually cleared. It's assumed that
-        the data won't get stale over the lifetime of a locator instance (not
-        necessarily true for the default_locator).
+        The in-memory cache (which also remembers pages which couldn't be
+        fetched, as ``None``) is bounded by the locator's
+        :attr:`cache_policy`: the least recently used pages are evicted when
+        it holds too many entries or too much data, and pages expire after
+        the policy's ttl. It's also cleared when a lookup starts while no
+        other lookups are in progress, so pages don't go stale over the
+        lifetime of a long-lived locator such as the default_locator.
+        Entries in the persistent cache are revalidated with the server when
+        they go stale.
+        """
+        return self._get_page(url)
+
+    def _get_page(self, url, process_links=None, scanner=None):
+        """
+        Get the HTML for an URL, as for :meth:`get_page`. If process_links is
+        specified, it's called with lists of the (url, rel) tuples for the
+        page's links: as the page is read when it has to be fetched, or with
+        all of them at once when it's cached.
+
+        If scanner is specified, it's used instead of a :class:`LinkScanner`
+        to find what process_links is called with.
         """
         # http://peak.telecommunity.com/DevCenter/EasyInstall#package-index-api
         scheme, netloc, path, _, _, _ = urlparse(url)
         if scheme == 'file' and os.path.isdir(url2pathname(path)):
             url = urljoin(ensure_slash(url), 'index.html')
 
-        if url in self._page_cache:
-            result = self._page_cache[url]
+        scanned = False
+        cached = self._page_cache.get(url, _MISSING)
+        if cached is not _MISSING:
+            result = cached
             logger.debug('Returning %s from cache: %s', url, result)
         else:
             host = netloc.split(':', 1)[0]
             result = None
-            if host in self._bad_hosts:
-                logger.debug('Skipping %s due to bad host %s', url, host)
+            entry = None
+            if self.page_cache and scheme != 'file':
+                entry = self.page_cache.get(url)
+            if entry and self.page_cache.is_fresh(entry):
+                logger.debug('Returning %s from page cache', url)
+                result = Page(entry['data'], entry['url'])
+            elif self.page_cache and self.page_cache.offline:
+                logger.debug('Not fetching %s: page cache is offline', url)
+            elif scheme != 'file' and not self.host_health.allow(host):
+                logger.debug('Skipping %s: host %s is unavailable', url, host)
+                if entry:
+                    result = Page(entry['data'], entry['url'])
             else:
-                req = Request(url, headers={'Accept-encoding': 'identity'})
                 try:
-                    logger.debug('Fetching %s', url)
-                    resp = self.opener.open(req, timeout=self.timeout)
-                    logger.debug('Fetched %s', url)
-                    headers = resp.info()
-                    content_type = headers.get('Content-Type', '')
-                    if HTML_CONTENT_TYPE.match(content_type):
-                        final_url = resp.geturl()
-                        data = resp.read()
-                        encoding = headers.get('Content-Encoding')
-                        if encoding:
-                            decoder = self.decoders[encoding]   # fail if not found
-                            data = decoder(data)
-                        encoding = 'utf-8'
-                        m = CHARSET.search(content_type)
-                        if m:
-                            encoding = m.group(1)
-                        try:
-                            data = data.decode(encoding)
-                        except UnicodeError:
-                            data = data.decode('latin-1')    # fallback
-                        result = Page(data, final_url)
-                        self._page_cache[final_url] = result
-                except HTTPError as e:
-                    if e.code != 404:
-                        logger.exception('Fetch failed: %s: %s', url, e)
-                except URLError as e:
-                    logger.exception('Fetch failed: %s: %s', url, e)
-                    with self._lock:
-                        self._bad_hosts.add(host)
-                except Exception as e:
-                    logger.exception('Fetch failed: %s: %s', url, e)
+                    result, scanned = self._fetch_page(url, host, entry,
+                                                       process_links, scanner)
                 finally:
                     self._page_cache[url] = result   # even if None (failure)
+            if result is not None:
+                self._page_cache[url] = result
+        if result is not None and process_links and not scanned:
+            if scanner is None:
+                process_links(result.links)
+            else:
+                process_links(scanner.feed(result.data))
         return result
 
+    def _fetch_page(self, url, host, entry, process_links, scanner):
+        """
+        Fetch a page for _get_page, which has checked that the host can be
+        tried. Transient server errors are retried if the host's retry budget
+        allows, and the outcome is recorded in :attr:`host_health`. Only
+        network errors and server (5xx) errors count as failures of the host:
+        other errors (such as bad content) are just logged.
+
+        :param entry: The page's entry in the persistent page cache, or
+                      ``None``.
+        :return: A tuple of the page (or ``None``) and whether its links were
+                 scanned as it was read.
+        """
+        health = self.host_health
+        result = None
+        scanned = False
+        headers = {'Accept-encoding': self._accept_encoding()}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        attempts = 0
+        while True:
+            req = Request(url, headers=headers)
+            resp = None
+            try:
+                logger.debug('Fetching %s', url)
+                resp = self.opener.open(req, timeout=self.timeout)
+                logger.debug('Fetched %s', url)
+                info = resp.info()
+                content_type = info.get('Content-Type', '')
+                if HTML_CONTENT_TYPE.match(content_type):
+                    final_url = resp.geturl()
+                    encoding = 'utf-8'
+                    m = CHARSET.search(content_type)
+                    if m:
+                        encoding = m.group(1)
+                    data, scanned = self._read_page(resp, final_url, encoding,
+                                                    process_links, scanner)
+                    result = Page(data, final_url)
+                    self._page_cache[final_url] = result
+                    if self.page_cache and not url.startswith('file:'):
+                        self.page_cache.put(url, {
+                            'url': final_url,
+                            'data': data,
+                            'etag': info.get('ETag'),
+                            'last_modified': info.get('Last-Modified'),
+                            'fetched': time.time(),
+                        })
+                health.record_success(host)
+            except HTTPError as e:
+                resp = e
+                if e.code >= 500:
+                    if attempts < health.max_retries and health.retry(host):
+                        attempts += 1
+                        delay = health.delay(attempts)
+                        logger.debug('Retrying %s in %.2fs: %s', url, delay,
+                                     e)
+                        time.sleep(delay)
+                        continue
+                    health.record_failure(host)
+                else:
+                    # the host is up, even if the page isn't there
+                    health.record_success(host)
+                if e.code == 304 and entry:
+                    logger.debug('Page cache entry still valid: %s', url)
+                    self.page_cache.refresh(url, entry)
+                    result = Page(entry['data'], entry['url'])
+                elif e.code != 404:
+                    logger.exception('Fetch failed: %s: %s', url, e)
+            except (URLError, socket.error, socket.timeout) as e:
+                logger.exception('Fetch failed: %s: %s', url, e)
+                health.record_failure(host)
+                if entry:
+                    logger.debug('Using stale page cache entry: %s', url)
+                    result = Page(entry['data'], entry['url'])
+            except Exception as e:
+                # not a problem with the host, so its health is unaffected
+                logger.exception('Fetch failed: %s: %s', url, e)
+                health.release(host)
+            finally:
+                _close_response(resp)
+            break
+        return result, scanned
+
+    def _accept_encoding(self):
+        """
+        Get the value of the Accept-Encoding header sent with requests.
+        """
+        encodings = [e for e in ('br', 'gzip', 'deflate')
+                     if e in self.decompressors]
+        return ', '.join(encodings) or 'identity'
+
+    def _read_page(self, resp, url, encoding, process_links=None,
+                   scanner=None):
+        """
+        Read a page from a response in chunks of ``chunk_size`` bytes,
+        decompressing them as they're read if the response has a
+        Content-Encoding. If process_links is specified, the text is scanned
+        for links (or whatever the specified scanner finds) as it's read, and
+        process_links is called with those found in each chunk.
+
+        Return a tuple of the page's text and whether it was scanned.
+        """
+        content_encoding = resp.info().get('Content-Encoding')
+        decompressor = None
+        if content_encoding:
+            content_encoding = content_encoding.strip().lower()
+            if content_encoding not in ('identity', 'none'):
+                factory = self.decompressors.get(content_encoding)
+                if factory is None:
+                    raise DistlibException('Unsupported content encoding for '
+                                           '%s: %r' % (url, content_encoding))
+                decompressor = factory(content_encoding)
+        scanning = bool(process_links)
+        if scanning:
+            if scanner is None:
+                scanner = LinkScanner(url)
+            decoder = codecs.getincrementaldecoder(encoding)()
+        chunks = []
+        while True:
+            chunk = resp.read(self.chunk_size)
+            done = not chunk
+            if decompressor:
+                if done:
+                    chunk = decompressor.flush()
+                else:
+                    chunk = decompressor.decompress(chunk)
+            if chunk:
+                chunks.append(chunk)
+                if scanning:
+                    try:
+                        text = decoder.decode(chunk)
+                    except UnicodeError:
+                        decoder = codecs.getincrementaldecoder('latin-1')()
+                        text = decoder.decode(chunk)
+                    links = scanner.feed(text)
+                    if links:
+                        process_links(links)
+            if done:
+                break
+        if scanning:
+            links = scanner.feed(decoder.decode(b'', True))
+            if links:
+                process_links(links)
+        data = b''.join(chunks)
+        try:
+            data = data.decode(encoding)
+        except UnicodeError:
+            data = data.decode('latin-1')    # fallback
+        return data, scanning
+
     _distname_re = re.compile('<a href=[^>]*>([^<]+)<')
 
     def get_distribution_names(self):
         """
         Return all the distribution names known to this locator.
         """
-        result = set()
-        page = self.get_page(self.base_url)
-        if not page:
+        return set(self.iter_distribution_names())
+
+    def iter_distribution_names(self):
+        """
+        Return an iterator over all the distribution names known to this
+        locator. The names are returned as the index's root page is read,
+        so the first ones are available before it has all arrived.
+        """
+        # The page is fetched in another thread, which passes the names it
+        # finds through a queue. _MISSING marks the end of the page. The
+        # queue is bounded, so the thread waits for the names to be used;
+        # if the iterator is closed early, it stops passing them on.
+        names = queue.Queue(maxsize=self.max_queued_chunks)
+        stopped = threading.Event()
+        outcome = []
+
+        def put(found):
+            while not stopped.is_set():
+                try:
+                    names.put(found, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+        def fetch():
+            try:
+                page = self._get_page(self.base_url, put,
+                                      _NameScanner(self._distname_re))
+                outcome.append(page is not None)
+            except Exception as e:
+                logger.exception('Unable to get names from %s: %s',
+                                 self.base_url, e)
+            finally:
+                put(_MISSING)
+
+        t = threading.Thread(target=fetch)
+        t.setDaemon(True)
+        t.start()
+        seen = set()
+        try:
+            while True:
+                found = names.get()
+                if found is _MISSING:
+                    break
+                for name in found:
+                    if name not in seen:
+                        seen.add(name)
+                        yield name
+        finally:
+            stopped.set()
+        if not outcome or not outcome[0]:
             raise DistlibException('Unable to get %s' % self.base_url)
-        for match in self._distname_re.finditer(page.data):
-            result.add(match.group(1))
+
+class SimpleJSONLocator(Locator):
+    """
+    A locator which uses the JSON form of the 'simple' repository API (see
+    PEP 691). A single request gets the list of all the files for a project,
+    and the core metadata for a file (see PEP 658) is only fetched when a
+    version of the project is selected by :meth:`locate`.
+
+    If an index ignores the request for JSON and returns an HTML page, the
+    links on the page are used instead.
+    """
+
+    # Sent in the Accept header: JSON is preferred, but HTML will do.
+    accept = '%s, text/html;q=0.1' % SIMPLE_JSON_CONTENT_TYPE
+
+    # Used to deal with Content-Encoding schemes, as for SimpleScrapingLocator.
+    decompressors = SimpleScrapingLocator.decompressors
+
+    # Whether yanked files (see PEP 592) are included in results.
+    include_yanked = False
+
+    # The metadata fields which are updated from a file's core metadata.
+    metadata_fields = ('Requires-Dist', 'Provides-Dist', 'Obsoletes-Dist',
+                       'Requires-Python', 'Summary')
+
+    def __init__(self, url, timeout=None, fetch_metadata=True, **kwargs):
+        """
+        Initialise an instance.
+        :param url: The root URL of the index.
+        :param timeout: The timeout, in seconds, to be applied to requests.
+                        This defaults to ``None`` (no timeout specified).
+        :param fetch_metadata: If true (the default), the core metadata for
+                               a distribution returned by :meth:`locate` is
+                               fetched, if the index provides it.
+        :param kwargs: Passed to the superclass.
+        """
+        super(SimpleJSONLocator, self).__init__(**kwargs)
+        self.base_url = ensure_slash(url)
+        self.timeout = timeout
+        self.fetch_metadata = fetch_metadata
+        # Maps download URLs to the URLs of their core metadata, for those
+        # whose metadata hasn't been fetched yet.
+        self._metadata_urls = {}
+        self._keep_alive = KeepAliveHandler()
+        self.opener = build_opener(RedirectHandler(), self._keep_alive)
+
+    def clear_cache(self):
+        super(SimpleJSONLocator, self).clear_cache()
+        self._metadata_urls.clear()
+
+    def close(self):
+        """
+        Close any idle HTTP connections.
+        """
+        super(SimpleJSONLocator, self).close()
+        self._keep_alive.close()
+
+    _normalize_re = re.compile(r'[-_.]+')
+
+    def _project_url(self, name):
+        """
+        Get the URL for a project's page, using its normalised name.
+        """
+        name = self._normalize_re.sub('-', name).lower()
+        return urljoin(self.base_url, '%s/' % quote(name))
+
+    def _fetch(self, url, accept=None):
+        """
+        Fetch an URL, decompressing the response if need be.
+
+        :return: A tuple of the response's content type, its text and its
+                 final URL (after any redirects), or ``None`` if the URL
+                 couldn't be fetched.
+        """
+        encodings = [e for e in ('br', 'gzip', 'deflate')
+                     if e in self.decompressors]
+        headers = {'Accept-encoding': ', '.join(encodings) or 'identity'}
+        if accept:
+            headers['Accept'] = accept
+        result = None
+        try:
+            logger.debug('Fetching %s', url)
+            resp = self.opener.open(Request(url, headers=headers),
+                                    timeout=self.timeout)
+            try:
+                info = resp.info()
+                data = resp.read()
+            finally:
+                resp.close()
+            content_encoding = info.get('Content-Encoding')
+            if content_encoding:
+                content_encoding = content_encoding.strip().lower()
+                if content_encoding not in ('identity', 'none'):
+                    # fail if not found
+                    factory = self.decompressors[content_encoding]
+                    decompressor = factory(content_encoding)
+                    data = decompressor.decompress(data) + decompressor.flush()
+            content_type = info.get('Content-Type', '')
+            encoding = 'utf-8'
+            m = CHARSET.search(content_type)
+            if m:
+                encoding = m.group(1)
+            try:
+                text = data.decode(encoding)
+            except UnicodeError:
+                text = data.decode('latin-1')
+            content_type = content_type.split(';', 1)[0].strip().lower()
+            result = content_type, text, resp.geturl()
+        except HTTPError as e:
+            _close_response(e)
+            if e.code != 404:
+                logger.exception('Fetch failed: %s: %s', url, e)
+        except Exception as e:
+            logger.exception('Fetch failed: %s: %s', url, e)
+        return result
+
+    def _is_json(self, content_type):
+        return (content_type == SIMPLE_JSON_CONTENT_TYPE or
+                content_type == 'application/json')
+
+    def _get_project(self, name):
+        result = {}
+        fetched = self._fetch(self._project_url(name), self.accept)
+        if fetched is not None:
+            content_type, text, url = fetched
+            if self._is_json(content_type):
+                try:
+                    files = json.loads(text).get('files', ())
+                except ValueError as e:
+                    # like an HTML page which can't be fetched, it's skipped
+                    logger.warning('Invalid JSON from %s: %s', url, e)
+                    files = ()
+                for f in files:
+                    self._process_file(result, url, f, name)
+            elif HTML_CONTENT_TYPE.match(content_type):
+                for link, rel in Page(text, url).links:
+                    info = self.convert_url_to_download_info(link, name)
+                    if info:
+                        self._update_version_data(result, info)
         return result
 
+    def _process_file(self, result, url, f, name):
+        """
+        Add a file from a project's JSON page to a result dictionary for
+        _get_project, if it's a suitable download for the project.
+
+        Only an MD5 hash of the file is used, as that's the only kind of
+        digest a distribution has: any other hashes (such as ``sha256``)
+        are ignored.
+
+        :param url: The URL of the project's page.
+        :param f: The dictionary for the file from the page.
+        """
+        if f.get('yanked') and not self.include_yanked:
+            logger.debug('Skipping yanked file: %s', f.get('filename'))
+        else:
+            info = self.convert_url_to_download_info(urljoin(url, f['url']),
+                                                     name)
+            if info:
+                download_url = info['url']
+                hashes = f.get('hashes')
+                # other kinds of hash are deliberately ignored
+                if hashes and 'md5' in hashes:
+                    info['md5_digest'] = hashes['md5']
+                if f.get('requires-python'):
+                    info['python-version'] = f['requires-python']
+                # PEP 714 renamed dist-info-metadata to core-metadata
+                if f.get('core-metadata', f.get('dist-info-metadata')):
+                    self._metadata_urls[download_url] = (download_url +
+                                                         '.metadata')
+                self._update_version_data(result, info)
+
+    def get_distribution_names(self):
+        """
+        Return all the distribution names known to this locator.
+        """
+        fetched = self._fetch(self.base_url, self.accept)
+        if fetched is None:
+            raise DistlibException('Unable to get %s' % self.base_url)
+        content_type, text, url = fetched
+        if self._is_json(content_type):
+            try:
+                result = set(p['name'] for p in json.loads(text)['projects'])
+            except (ValueError, KeyError, TypeError) as e:
+                raise DistlibException('Invalid JSON from %s: %s' % (url, e))
+        else:
+            result = set(SimpleScrapingLocator._distname_re.findall(text))
+        return result
+
+    def load_metadata(self, dist):
+        """
+        Fetch the core metadata for a distribution found by this locator,
+        if the index provides it and it hasn't been fetched already, and
+        update the distribution's metadata from it.
+
+        :return: True if the metadata was fetched, else False.
+        """
+        url = self._metadata_urls.pop(dist.download_url, None)
+        result = False
+        if url is not None:
+            fetched = self._fetch(url)
+            if fetched is not None:
+                msg = message_from_string(fetched[1])
+                md = dist.metadata
+                for field in self.metadata_fields:
+                    if md.is_multi_field(field):
+                        values = msg.get_all(field)
+                    else:
+                        values = msg.get(field)
+                    if values:
+                        md[field] = values
+                result = True
+        return result
+
+    def _iter_select(self, versions, r, matcher, prereleases):
+        selected = super(SimpleJSONLocator, self)._iter_select(versions, r,
+                                                               matcher,
+                                                               prereleases)
+        for result in selected:
+            if self.fetch_metadata:
+                self.load_metadata(result)
+            yield result
+
 class DirectoryLocator(Locator):
     """
     This class locates distributions in a directory tree.
+
+    The tree is scanned once to build an index which maps project names to
+    candidate files. Before each lookup, only the directories whose
+    modification times have changed are scanned again. The index can be
+    persisted, so that other locators for the same tree don't need to scan
+    it from scratch.
     """
 
+    # Matches the places in a filename where a project name could end (see
+    # _index_keys).
+    _name_end = re.compile(r'\b|(?=-)')
+
     def __init__(self, path, **kwargs):
         """
         Initialise an instance.
@@ -720,13 +2552,24 @@ class DirectoryLocator(Locator):
                        * recursive - if True (the default), subdirectories are
                          recursed into. If False, only the top-level directory
                          is searched,
+                       * index_file - if specified, the path of a file in
+                         which the index of the directory tree is persisted.
         """
         self.recursive = kwargs.pop('recursive', True)
+        self.index_file = kwargs.pop('index_file', None)
         super(DirectoryLocator, self).__init__(**kwargs)
         path = os.path.abspath(path)
         if not os.path.isdir(path):
             raise DistlibException('Not a directory: %r' % path)
         self.base_dir = path
+        self._lock = threading.RLock()
+        # Maps directories (relative to base_dir) to dictionaries holding
+        # their mtime and the names of the files and subdirectories in them.
+        self._dirs = None
+        # Maps keys derived from project names to sets of pathnames.
+        self._index = {}
+        # Maps pathnames to the project names obtained from them.
+        self._dist_names = {}
 
     def should_include(self, filename, parent):
         """
@@ -736,70 +2579,413 @@ class DirectoryLocator(Locator):
         """
         return filename.endswith(self.downloadable_extensions)
 
+    def _scan_dir(self, path):
+        """
+        Return sorted lists of the names of the files and of the directories
+        to recurse into (as for os.walk, symbolic links to directories are
+        not followed) in a directory.
+        """
+        files = []
+        dirs = []
+        if scandir:
+            # scandir gets the file types along with the names, avoiding a
+            # stat call per entry on most platforms.
+            for entry in scandir(path):
+                if not entry.is_dir():
+                    files.append(entry.name)
+                elif not entry.is_symlink():
+                    dirs.append(entry.name)
+        else:
+            for name in os.listdir(path):
+                p = os.path.join(path, name)
+                if not os.path.isdir(p):
+                    files.append(name)
+                elif not os.path.islink(p):
+                    dirs.append(name)
+        files.sort()
+        dirs.sort()
+        return files, dirs
+
+    def _index_keys(self, filename):
+        """
+        Return the keys under which a file is indexed: the normalised forms
+        of every prefix of the filename which could be the project name, as
+        determined by convert_url_to_download_info (a prefix followed by a
+        word boundary or a hyphen).
+        """
+        result = set()
+        for m in self._name_end.finditer(filename):
+            i = m.start()
+            if 0 < i < len(filename):
+                result.add(filename[:i].lower().replace('_', '-'))
+        return result
+
+    def _update_index(self, rel, files, add):
+        """
+        Add files in a directory to the index, or remove them from it.
+        """
+        if rel:
+            root = os.path.join(self.base_dir, rel)
+        else:
+            root = self.base_dir
+        index = self._index
+        for fn in files:
+            if not self.should_include(fn, root):
+                continue
+            path = os.path.join(root, fn)
+            for key in self._index_keys(fn):
+                if add:
+                    index.setdefault(key, set()).add(path)
+                else:
+                    paths = index.get(key)
+                    if paths is not None:
+                        paths.discard(path)
+                        if not paths:
+                            del index[key]
+            if not add:
+                self._dist_names.pop(path, None)
+
+    def _refresh(self):
+        """
+        Bring the index up to date with the directory tree, rescanning only
+        those directories whose mtimes have changed since they were last
+        scanned.
+        """
+        with self._lock:
+            known = self._dirs
+            if known is None:
+                known = {}
+                listings = self._load_index()
+            else:
+                listings = known
+            now = time.time()
+            changed = False
+            dirs = {}
+            todo = ['']
+            while todo:
+                rel = todo.pop()
+                if rel:
+                    path = os.path.join(self.base_dir, rel)
+                else:
+                    path = self.base_dir
+                try:
+                    mtime = os.stat(path).st_mtime
+                    entry = listings.get(rel)
+                    if (entry is None or entry['mtime'] is None or
+                        entry['mtime'] != mtime):
+                        files, subdirs = self._scan_dir(path)
+                        if now - mtime < 2:
+                            # The directory could change again without its
+                            # mtime changing, so scan it again next time.
+                            mtime = None
+                        entry = {'mtime': mtime, 'files': files,
+                                 'dirs': subdirs}
+                        changed = True
+                except OSError as e:
+                    logger.warning('Unable to scan %s: %s', path, e)
+                    continue
+                old = known.get(rel)
+                if old is None or old['files'] is not entry['files']:
+                    if old is not None:
+                        self._update_index(rel, old['files'], False)
+                    self._update_index(rel, entry['files'], True)
+                dirs[rel] = entry
+                if self.recursive:
+                    for d in entry['dirs']:
+                        todo.append(os.path.join(rel, d))
+            for rel in known:
+                if rel not in dirs:
+                    self._update_index(rel, known[rel]['files'], False)
+                    changed = True
+            if len(dirs) != len(listings):
+                changed = True
+            self._dirs = dirs
+            if changed and self.index_file:
+                self._save_index()
+
+    def _load_index(self):
+        result = {}
+        fn = self.index_file
+        if fn and os.path.isfile(fn):
+            try:
+                with open(fn, 'rb') as f:
+                    data = json.loads(f.read().decode('utf-8'))
+                if data.get('base_dir') == self.base_dir:
+                    result = data['dirs']
+            except Exception as e:
+                logger.warning('Unable to read index %s: %s', fn, e)
+        return result
+
+    def _save_index(self):
+        fn = self.index_file
+        data = {'base_dir': self.base_dir, 'dirs': self._dirs}
+        tmp = '%s.%s.tmp' % (fn, os.getpid())
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(json.dumps(data).encode('utf-8'))
+            if os.name == 'nt' and os.path.exists(fn):
+                os.remove(fn)
+            os.rename(tmp, fn)
+        except Exception as e:
+            logger.warning('Unable to write index %s: %s', fn, e)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _file_url(self, path):
+        return urlunparse(('file', '', pathname2url(os.path.abspath(path)),
+                           '', '', ''))
+
+    def state_fingerprint(self):
+        """
+        Digest the listings of the directory tree, which are brought up to
+        date first. This doesn't depend on the in-memory cache, so it stays
+        the same between processes while the tree doesn't change.
+        """
+        self._refresh()
+        with self._lock:
+            listings = sorted([rel, entry['files']]
+                              for rel, entry in self._dirs.items())
+        return _digest([type(self).__name__, self.base_dir, self.recursive,
+                        list(self.downloadable_extensions), listings])
+
     def _get_project(self, name):
+        self._refresh()
         result = {}
-        for root, dirs, files in os.walk(self.base_dir):
-            for fn in files:
-                if self.should_include(fn, root):
-                    fn = os.path.join(root, fn)
-                    url = urlunparse(('file', '',
-                                      pathname2url(os.path.abspath(fn)),
-                                      '', '', ''))
-                    info = self.convert_url_to_download_info(url, name)
-                    if info:
-                        self._update_version_data(result, info)
-            if not self.recursive:
-                break
+        with self._lock:
+            key = name.lower().replace('_', '-')
+            paths = sorted(self._index.get(key, ()))
+        for path in paths:
+            info = self.convert_url_to_download_info(self._file_url(path),
+                                                     name)
+            if info:
+                self._update_version_data(result, info)
+        return result
+
+    def get_distribution_names(self):
+        """
+        Return all the distribution names known to this locator.
+        """
+        self._refresh()
+        result = set()
+        with self._lock:
+            paths = set()
+            for p in self._index.values():
+                paths.update(p)
+            for path in paths:
+                if path in self._dist_names:
+                    name = self._dist_names[path]
+                else:
+                    info = self.convert_url_to_download_info(
+                        self._file_url(path), None)
+                    name = info and info['name']
+                    self._dist_names[path] = name
+                if name:
+                    result.add(name)
         return result
 
-    def get_distribution_names(self):
+class JSONLocator(Locator):
+    """
+    This locator uses special extended metadata (not available on PyPI) and is
+    the basis of performant dependency resolution in distlib. Other locators
+    require archive downloads before dependencies can be determined! As you
+    might imagine, that can be slow.
+    """
+    def get_distribution_names(self):
+        """
+        Return all the distribution names known to this locator.
+        """
+        raise NotImplementedError('Not available from this locator')
+
+    def _get_project_data(self, name):
+        """
+        Get the extended metadata for a project, as a dictionary.
+        """
+        return get_project_data(name)
+
+    def _get_project(self, name):
+        result = {}
+        data = self._get_project_data(name)
+        if data:
+            for info in data.get('files', []):
+                if info['ptype'] != 'sdist' or info['pyversion'] != 'source':
+                    continue
+                dist = make_dist(data['name'], info['version'],
+                                 scheme=self.scheme)
+                md = dist.metadata
+                md['Download-URL'] = info['url']
+                dist.md5_digest = info.get('digest')
+                md.dependencies = info.get('requirements', {})
+                dist.exports = info.get('exports', {})
+                result[dist.version] = dist
+        return result
+
+class IndexSnapshot(object):
+    """
+    A local snapshot of the extended metadata used by :class:`JSONLocator`,
+    held in a single SQLite database file. Projects are indexed by name, so
+    looking one up takes O(log n) time however many the snapshot holds.
+    """
+    def __init__(self, path):
+        """
+        Initialise an instance, creating the snapshot file if it doesn't
+        exist.
+
+        :param path: The path of the snapshot file.
+        """
+        if sqlite3 is None:
+            raise DistlibException('sqlite3 is needed for index snapshots')
+        self.path = path
+        # The connection may be used by several threads, but not at once.
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS projects ('
+                               'key TEXT PRIMARY KEY, name TEXT NOT NULL, '
+                               'data TEXT NOT NULL)')
+            self._conn.commit()
+
+    def close(self):
+        """
+        Close the snapshot file.
+        """
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self):
+        with self._lock:
+            cursor = self._conn.execute('SELECT COUNT(*) FROM projects')
+            return cursor.fetchone()[0]
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def get(self, name):
+        """
+        Get the data for a project.
+
+        :param name: The project name. Case is not significant.
+        :return: The data (as found in a ``project.json`` file) for the
+                 project, or ``None`` if it's not in the snapshot.
+        """
+        with self._lock:
+            cursor = self._conn.execute('SELECT data FROM projects '
+                                        'WHERE key = ?', (name.lower(),))
+            row = cursor.fetchone()
+        if row is None:
+            result = None
+        else:
+            result = json.loads(row[0])
+        return result
+
+    def get_names(self):
+        """
+        Return the names of all the projects in the snapshot, in sorted
+        order.
+        """
+        with self._lock:
+            cursor = self._conn.execute('SELECT name FROM projects '
+                                        'ORDER BY key')
+            return [row[0] for row in cursor]
+
+    def update(self, projects):
+        """
+        Add data for several projects to the snapshot, replacing any data
+        already held for them. All the projects are added in a single
+        transaction.
+
+        :param projects: An iterable of project data dictionaries, each of
+                         which must have a ``name`` key.
+        :return: The number of projects added.
+        """
+        result = 0
+        with self._lock:
+            try:
+                for data in projects:
+                    name = data['name']
+                    self._conn.execute('INSERT OR REPLACE INTO projects '
+                                       '(key, name, data) VALUES (?, ?, ?)',
+                                       (name.lower(), name,
+                                        json.dumps(data, sort_keys=True)))
+                    result += 1
+            except Exception:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+        return result
+
+    def import_dir(self, path, filename='project.json'):
+        """
+        Add the data in a directory tree of project files (laid out in any
+        way, such as ``F/foo/project.json``) to the snapshot.
+
+        :param path: The root of the directory tree.
+        :param filename: The name of the project files.
+        :return: The number of projects added.
+        """
+        def projects():
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                if filename in files:
+                    fn = os.path.join(root, filename)
+                    with open(fn, 'rb') as f:
+                        data = json.loads(f.read().decode('utf-8'))
+                    if data and 'name' in data:
+                        yield data
+                    else:
+                        logger.warning('No project data in %s', fn)
+
+        return self.update(projects())
+
+class SnapshotLocator(JSONLocator):
+    """
+    This locator is a :class:`JSONLocator` which gets the extended metadata
+    for projects from an :class:`IndexSnapshot`, rather than from the
+    network.
+    """
+    def __init__(self, snapshot, **kwargs):
+        """
+        Initialise an instance.
+
+        :param snapshot: The snapshot to use, or the path of its file.
+        :param kwargs: Passed to the superclass constructor.
         """
-        Return all the distribution names known to this locator.
+        super(SnapshotLocator, self).__init__(**kwargs)
+        # A snapshot passed in is left for the caller to close.
+        self._owns_snapshot = not isinstance(snapshot, IndexSnapshot)
+        if self._owns_snapshot:
+            snapshot = IndexSnapshot(snapshot)
+        self.snapshot = snapshot
+
+    def close(self):
         """
-        result = set()
-        for root, dirs, files in os.walk(self.base_dir):
-            for fn in files:
-                if self.should_include(fn, root):
-                    fn = os.path.join(root, fn)
-                    url = urlunparse(('file', '',
-                                      pathname2url(os.path.abspath(fn)),
-                                      '', '', ''))
-                    info = self.convert_url_to_download_info(url, None)
-                    if info:
-                        result.add(info['name'])
-            if not self.recursive:
-                break
-        return result
+        Close the snapshot, if the locator opened it.
+        """
+        if self._owns_snapshot:
+            self.snapshot.close()
 
-class JSONLocator(Locator):
-    """
-    This locator uses special extended metadata (not available on PyPI) and is
-    the basis of performant dependency resolution in distlib. Other locators
-    require archive downloads before dependencies can be determined! As you
-    might imagine, that can be slow.
-    """
     def get_distribution_names(self):
         """
         Return all the distribution names known to this locator.
         """
-        raise NotImplementedError('Not available from this locator')
+        return set(self.snapshot.get_names())
 
-    def _get_project(self, name):
-        result = {}
-        data = get_project_data(name)
-        if data:
-            for info in data.get('files', []):
-                if info['ptype'] != 'sdist' or info['pyversion'] != 'source':
-                    continue
-                dist = make_dist(data['name'], info['version'],
-                                 scheme=self.scheme)
-                md = dist.metadata
-                md['Download-URL'] = info['url']
-                dist.md5_digest = info.get('digest')
-                md.dependencies = info.get('requirements', {})
-                dist.exports = info.get('exports', {})
-                result[dist.version] = dist
-        return result
+    def iter_distribution_names(self):
+        return iter(self.snapshot.get_names())
+
+    def _get_project_data(self, name):
+        return self.snapshot.get(name)
+
+    def state_fingerprint(self):
+        """
+        Digest the path, size and modification time of the snapshot file.
+        """
+        path = os.path.abspath(self.snapshot.path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            # e.g. an in-memory database
+            return None
+        return _digest([type(self).__name__, path, st.st_size, st.st_mtime])
 
 class DistPathLocator(Locator):
     """
@@ -829,6 +3015,8 @@ class AggregatingLocator(Locator):
     """
     This class allows you to chain and/or merge a list of locators.
     """
+    modes = ('first', 'merge', 'parallel-merge', 'race')
+
     def __init__(self, *locators, **kwargs):
         """
         Initialise an instance.
@@ -839,10 +3027,38 @@ class AggregatingLocator(Locator):
                        * merge - if False (the default), the first successful
                          search from any of the locators is returned. If True,
                          the results from all locators are merged (this can be
-                         slow).
+                         slow). This is equivalent to a mode of 'merge'.
+                       * mode - one of 'first' (the default), 'merge',
+                         'parallel-merge' or 'race'. The first two query the
+                         locators in turn. In 'parallel-merge' mode, all the
+                         locators are queried at once and their results are
+                         merged. In 'race' mode, all the locators are queried
+                         at once and the first successful search, in the
+                         order the locators were given, is returned without
+                         waiting for the locators after it.
+                       * timeout - for the 'parallel-merge' and 'race' modes,
+                         the time in seconds after which a locator which
+                         hasn't answered is ignored. This can be a sequence
+                         with a timeout for each locator. If None (the
+                         default), locators are waited for indefinitely.
         """
-        self.merge = kwargs.pop('merge', False)
+        merge = kwargs.pop('merge', False)
+        mode = kwargs.pop('mode', None)
+        if mode is None:
+            mode = merge and 'merge' or 'first'
+        if mode not in self.modes:
+            raise ValueError('Unknown mode: %r' % mode)
+        self.mode = mode
+        self.merge = mode in ('merge', 'parallel-merge')
         self.locators = locators
+        timeout = kwargs.pop('timeout', None)
+        if timeout is None or isinstance(timeout, (int, float)):
+            self.timeouts = [timeout] * len(locators)
+        else:
+            self.timeouts = list(timeout)
+            if len(self.timeouts) != len(locators):
+                raise ValueError('Expected %d timeouts, got %d' %
+                                 (len(locators), len(self.timeouts)))
         super(AggregatingLocator, self).__init__(**kwargs)
 
     def clear_cache(self):
@@ -850,6 +3066,23 @@ class AggregatingLocator(Locator):
         for locator in self.locators:
             locator.clear_cache()
 
+    def close(self):
+        for locator in self.locators:
+            locator.close()
+
+    def state_fingerprint(self):
+        """
+        Combine the fingerprints of the locators, returning ``None`` if any
+        of them can't be identified.
+        """
+        fingerprints = []
+        for locator in self.locators:
+            fingerprint = locator.state_fingerprint()
+            if fingerprint is None:
+                return None
+            fingerprints.append(fingerprint)
+        return _digest([type(self).__name__, self.mode, fingerprints])
+
     def _set_scheme(self, value):
         self._scheme = value
         for locator in self.locators:
@@ -858,6 +3091,8 @@ class AggregatingLocator(Locator):
     scheme = property(Locator.scheme.fget, _set_scheme)
 
     def _get_project(self, name):
+        if self.mode in ('parallel-merge', 'race'):
+            return self._get_projects_concurrently([name])[name]
         result = {}
         for locator in self.locators:
             r = locator.get_project(name)
@@ -869,6 +3104,117 @@ class AggregatingLocator(Locator):
                     break
         return result
 
+    def _get_projects(self, names):
+        """
+        Look up several projects, passing the whole batch to each locator in
+        turn. Unless merging, each locator is only asked about the projects
+        which the previous locators didn't find.
+        """
+        if self.mode in ('parallel-merge', 'race'):
+            return self._get_projects_concurrently(names)
+        result = {}
+        for name in names:
+            result[name] = {}
+        todo = list(names)
+        for locator in self.locators:
+            if not todo:
+                break
+            found = locator.get_projects(todo)
+            remaining = []
+            for name in todo:
+                r = found.get(name)
+                if r:
+                    if self.merge:
+                        result[name].update(r)
+                    else:
+                        result[name] = r
+                if self.merge or not r:
+                    remaining.append(name)
+            todo = remaining
+        return result
+
+    def _get_projects_concurrently(self, names):
+        """
+        Look up several projects by querying all the locators at once, each
+        in its own thread. A locator which doesn't answer within its timeout
+        is ignored: its thread is left to finish in the background.
+        """
+        answers = queue.Queue()
+
+        def query(i, locator):
+            try:
+                r = locator.get_projects(names)
+            except Exception as e:
+                logger.exception('Lookup failed: %s: %s', locator, e)
+                r = {}
+            answers.put((i, r))
+
+        start = time.time()
+        deadlines = []
+        for i, locator in enumerate(self.locators):
+            t = threading.Thread(target=query, args=(i, locator))
+            t.setDaemon(True)
+            t.start()
+            timeout = self.timeouts[i]
+            if timeout is None:
+                deadlines.append(None)
+            else:
+                deadlines.append(start + timeout)
+        results = [{} for locator in self.locators]
+        pending = set(range(len(self.locators)))
+        while pending:
+            if self.mode == 'race':
+                result = self._race_result(names, results, pending)
+                if result is not None:
+                    return result
+            now = time.time()
+            wait = None
+            for i in sorted(pending):
+                deadline = deadlines[i]
+                if deadline is None:
+                    continue
+                if deadline <= now:
+                    logger.warning('Lookup timed out: %s', self.locators[i])
+                    pending.discard(i)
+                elif wait is None or deadline - now < wait:
+                    wait = deadline - now
+            if not pending:
+                break
+            try:
+                i, r = answers.get(timeout=wait)
+            except queue.Empty:
+                continue
+            if i in pending:    # ignore answers which arrive too late
+                results[i] = r
+                pending.discard(i)
+        if self.mode == 'race':
+            result = self._race_result(names, results, pending)
+        else:
+            result = {}
+            for name in names:
+                result[name] = {}
+                for r in results:
+                    if r.get(name):
+                        result[name].update(r[name])
+        return result
+
+    def _race_result(self, names, results, pending):
+        """
+        For each project, find the result of the first locator which found
+        it. Return None if that can't be determined yet, because a locator
+        which comes before any that found it hasn't answered.
+        """
+        result = {}
+        for name in names:
+            result[name] = {}
+            for i, r in enumerate(results):
+                if i in pending:
+                    return None
+                if r.get(name):
+                    result[name] = r[name]
+                    break
+        return result
+
     def get_distribution_names(self):
         """
         Return all the distribution names known to this locator.
@@ -881,6 +3227,23 @@ class AggregatingLocator(Locator):
                 pass
         return result
 
+    def iter_distribution_names(self):
+        """
+        Return an iterator over all the distribution names known to this
+        locator. The names from each locator are returned in turn, as that
+        locator returns them, and each name is returned once.
+        """
+        seen = set()
+        for locator in self.locators:
+            try:
+                names = locator.iter_distribution_names()
+            except NotImplementedError:
+                continue
+            for name in names:
+                if name not in seen:
+                    seen.add(name)
+                    yield name
+
 
 default_locator = AggregatingLocator(
                     JSONLocator(),
@@ -889,16 +3252,455 @@ default_locator = AggregatingLocator(
 
 locate = default_locator.locate
 
+class _Resolution(object):
+    """
+    The state of a backtracking search by DependencyFinder: the distribution
+    chosen for each name, the names of those which are needed after
+    installation, the requirements still to be processed (as (requirement,
+    parent name, install) tuples) and the requirements which constrain each
+    name (as (requirement, parent name) tuples).
+    """
+    def __init__(self):
+        self.chosen = {}
+        self.install = set()
+        self.pending = deque()
+        self.constraints = {}
+
+    def copy(self):
+        result = _Resolution()
+        result.chosen = dict(self.chosen)
+        result.install = set(self.install)
+        result.pending = deque(self.pending)
+        result.constraints = dict((k, list(v))
+                                  for k, v in self.constraints.items())
+        return result
+
+    def assignment(self, name):
+        """
+        Return the (name, version) tuple for the distribution chosen for a
+        name.
+        """
+        return name, self.chosen[name].version
+
+
+class _Decision(object):
+    """
+    A choice of distribution made during a backtracking search, which can be
+    revisited: the name it was made for, the remaining candidates, the state
+    before it was made, the version chosen and the assignments which explain
+    why earlier candidates were rejected.
+    """
+    def __init__(self, name, candidates, before, install, explanation):
+        self.name = name
+        self.candidates = candidates
+        self.before = before
+        self.install = install
+        self.explanation = explanation
+        self.version = None
+
+
+class _ProviderIndex(object):
+    """
+    The distributions which provide a name, for DependencyFinder. Versions
+    which the finder's version scheme can parse are kept parsed and sorted,
+    so that providers matching simple ordering constraints can be found
+    with a range query rather than by matching every version. Iterating over
+    an instance yields (version, distribution) tuples.
+    """
+    def __init__(self, version_class):
+        self.version_class = version_class
+        self._keys = []         # (parsed version, name, version), sorted
+        self._versions = []     # the parsed versions, in the same order
+        self._providers = []    # (version, distribution), in the same order
+        self._unparsed = []     # as above, for versions which can't be parsed
+
+    def __len__(self):
+        return len(self._providers) + len(self._unparsed)
+
+    def __iter__(self):
+        for t in self._providers:
+            yield t
+        for t in self._unparsed:
+            yield t
+
+    def add(self, version, dist):
+        try:
+            parsed = self.version_class(version)
+        except Exception:
+            self._unparsed.append((version, dist))
+            self._unparsed.sort(key=lambda t: (t[1].key, t[0] or ''))
+        else:
+            # equal versions are ordered by name, so that which of them is
+            # found doesn't depend on the order they were added in
+            key = (parsed, dist.key, dist.version)
+            i = bisect_right(self._keys, key)
+            self._keys.insert(i, key)
+            self._versions.insert(i, parsed)
+            self._providers.insert(i, (version, dist))
+
+    def remove(self, version, dist):
+        t = (version, dist)
+        if t in self._unparsed:
+            self._unparsed.remove(t)
+        else:
+            i = self._providers.index(t)
+            del self._keys[i]
+            del self._versions[i]
+            del self._providers[i]
+
+    def _get_range(self, matcher):
+        """
+        Get the slice of the sorted versions which can match a matcher,
+        using its constraints which are plain comparisons (some schemes
+        treat e.g. '>=' specially, and those constraints are ignored).
+        """
+        versions = self._versions
+        lo = 0
+        hi = len(versions)
+        for op, constraint in matcher._parts:
+            if matcher._operators[op] is not Matcher._operators[op]:
+                continue
+            if op == '<':
+                hi = min(hi, bisect_left(versions, constraint))
+            elif op == '<=':
+                hi = min(hi, bisect_right(versions, constraint))
+            elif op == '>':
+                lo = max(lo, bisect_right(versions, constraint))
+            elif op == '>=':
+                lo = max(lo, bisect_left(versions, constraint))
+            elif op == '==':
+                lo = max(lo, bisect_left(versions, constraint))
+                hi = min(hi, bisect_right(versions, constraint))
+        return lo, hi
+
+    def find(self, matcher):
+        """
+        Find the provider with the most recent version which matches a
+        matcher, or None if there isn't one.
+        """
+        if (self._versions and
+            matcher.version_class is self.version_class):
+            lo, hi = self._get_range(matcher)
+        else:
+            lo, hi = 0, len(self._versions)
+        for i in range(hi - 1, lo - 1, -1):
+            try:
+                if matcher.match(self._versions[i]):
+                    return self._providers[i][1]
+            except UnsupportedVersionError:
+                pass
+        for version, provider in self._unparsed:
+            try:
+                if matcher.match(version):
+                    return provider
+            except (UnsupportedVersionError, TypeError):
+                # TypeError if there's no version but there are constraints
+                pass
+        return None
+
+
+class ResolutionResult(object):
+    """
+    The result of a call to :meth:`DependencyFinder.find`, in a form which
+    can be serialized (as a dictionary which can be saved as JSON, like a
+    lock file) and from which the distributions and problems found can be
+    recreated.
+
+    The ``dists`` attribute holds a dictionary for each distribution found,
+    in order of name, with its name, version, download URL and digest, the
+    metadata fields needed to work out its requirements, whether it was
+    requested, whether it's only a build-time dependency, and the
+    requirements it was found for. Each of the ``edges`` is a list of the
+    name of a distribution, one of its requirements and the name of the
+    distribution which satisfies it. Each of the ``problems`` is a list with
+    a problem's type followed by its details.
+    """
+
+    # The version of the format produced by to_dict.
+    format_version = 1
+
+    # The metadata fields kept for each distribution.
+    fields = ('Requires-Dist', 'Setup-Requires-Dist', 'Provides-Dist')
+
+    def __init__(self, requirement, scheme='default', mode='greedy',
+                 tests=False, prereleases=False, dists=None, edges=None,
+                 problems=None):
+        self.requirement = requirement
+        self.scheme = scheme
+        self.mode = mode
+        self.tests = tests
+        self.prereleases = prereleases
+        self.dists = dists or []
+        self.edges = edges or []
+        self.problems = problems or []
+
+    @classmethod
+    def from_finder(cls, finder, requirement, dists, problems, tests=False,
+                    prereleases=False):
+        """
+        Make an instance from the results of a call to a finder's
+        :meth:`~DependencyFinder.find`, just after it returns.
+        """
+        if isinstance(requirement, Distribution):
+            requirement = requirement.name_and_version
+        dlist = []
+        edges = []
+        for dist in sorted(dists, key=lambda d: (d.key, d.version)):
+            url = dist.download_url
+            if url == 'UNKNOWN':
+                url = None
+            d = {
+                'name': dist.name,
+                'version': dist.version,
+                'download_url': url,
+                'md5_digest': dist.md5_digest,
+                'requested': bool(dist.requested),
+                'build_time_dependency': bool(dist.build_time_dependency),
+                'reqts': sorted(finder.reqts.get(dist, ())),
+                'fields': {},
+            }
+            for name in cls.fields:
+                value = dist.metadata[name]
+                if value:
+                    d['fields'][name] = list(value)
+            dlist.append(d)
+            reqts = dist.requires | dist.setup_requires
+            if tests and not dist.build_time_dependency:
+                reqts |= dist.test_requires
+            for r in sorted(reqts):
+                for provider in finder.find_providers(r):
+                    edges.append([dist.key, r, provider.key])
+        plist = []
+        for problem in problems:
+            if problem[0] == 'cantreplace':
+                kind, provider, other, unmatched = problem
+                problem = [kind, [provider.name, provider.version],
+                           [other.name, other.version], sorted(unmatched)]
+            else:
+                problem = list(problem)
+            plist.append(problem)
+        plist.sort(key=lambda p: json.dumps(p))
+        return cls(requirement, finder.locator.scheme, finder.mode, tests,
+                   prereleases, dlist, edges, plist)
+
+    def to_dict(self):
+        """
+        Return a dictionary holding the result, which can be serialized as
+        JSON.
+        """
+        return {
+            'format_version': self.format_version,
+            'requirement': self.requirement,
+            'scheme': self.scheme,
+            'mode': self.mode,
+            'tests': self.tests,
+            'prereleases': self.prereleases,
+            'dists': self.dists,
+            'edges': self.edges,
+            'problems': self.problems,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Make an instance from a dictionary returned by :meth:`to_dict`.
+        """
+        if d.get('format_version') != cls.format_version:
+            raise DistlibException('Unsupported resolution format: %r' %
+                                   d.get('format_version'))
+        return cls(d['requirement'], d['scheme'], d['mode'], d['tests'],
+                   d['prereleases'], d['dists'], d['edges'], d['problems'])
+
+    def save(self, path):
+        """
+        Save the result to a file, as JSON.
+        """
+        with codecs.open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a result saved by :meth:`save`.
+        """
+        with codecs.open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    def get_distributions(self, locator=None):
+        """
+        Recreate the distributions and problems found.
+
+        :param locator: The locator to set as the distributions' ``locator``
+                        attribute.
+        :return: A tuple of a set of :class:`LazyDistribution` instances and
+                 a set of problems, as returned by
+                 :meth:`DependencyFinder.find`.
+        """
+        dists = {}
+        for d in self.dists:
+            dist = LazyDistribution(d['name'], d['version'],
+                                    scheme=self.scheme)
+            if d['download_url']:
+                dist.add_candidate(d['download_url'], d['md5_digest'])
+            for name, value in d['fields'].items():
+                dist.set_field(name, value)
+            dist.requested = d['requested']
+            dist.build_time_dependency = d['build_time_dependency']
+            dist.locator = locator
+            dists[dist.key, dist.version] = dist
+
+        def get_dist(name, version):
+            result = dists.get((name.lower(), version))
+            if result is None:
+                # e.g. a provider which couldn't replace another
+                result = LazyDistribution(name, version, scheme=self.scheme)
+                result.locator = locator
+            return result
+
+        problems = set()
+        for problem in self.problems:
+            if problem[0] == 'cantreplace':
+                kind, provider, other, unmatched = problem
+                problem = (kind, get_dist(*provider), get_dist(*other),
+                           frozenset(unmatched))
+            else:
+                problem = tuple(problem)
+            problems.add(problem)
+        return set(dists.values()), problems
+
+
+class ResolutionCache(object):
+    """
+    A cache of the results of :meth:`DependencyFinder.find`, as
+    :class:`ResolutionResult` instances, keyed by the requirement, the
+    version scheme, the finder's mode, the ``tests`` and ``prereleases``
+    flags and a fingerprint of the locator's state. Results are kept in a
+    bounded in-memory cache and, if a directory is given, in files there,
+    one per key, so that they can be shared between processes.
+    """
+    def __init__(self, base=None, max_entries=1000):
+        """
+        Initialise an instance.
+
+        :param base: The directory where results are stored. If ``None``,
+                     results are only kept in memory.
+        :param max_entries: The maximum number of results kept in memory.
+        """
+        if base is not None:
+            # we use 'isdir' instead of 'exists', because we want to
+            # fail if there's a file with that name
+            if not os.path.isdir(base):
+                os.makedirs(base)
+            base = os.path.abspath(os.path.normpath(base))
+        self.base = base
+        self._cache = LRUCache(max_entries=max_entries)
+        self._lock = threading.RLock()
+
+    def make_key(self, requirement, scheme, mode, tests, prereleases,
+                 fingerprint):
+        """
+        Make the key for a result.
+        """
+        return _digest([requirement, scheme, mode, bool(tests),
+                        bool(prereleases), fingerprint])
+
+    def _path(self, key):
+        return os.path.join(self.base, key + '.json')
+
+    def get(self, key):
+        """
+        Get the result for a key, or ``None`` if there isn't one.
+        """
+        result = self._cache.get(key)
+        if result is None and self.base is not None:
+            path = self._path(key)
+            with self._lock:
+                if os.path.isfile(path):
+                    try:
+                        result = ResolutionResult.load(path)
+                    except Exception as e:
+                        logger.warning('Unable to read cached resolution '
+                                       '%s: %s', path, e)
+            if result is not None:
+                self._cache[key] = result
+        return result
+
+    def put(self, key, result):
+        """
+        Store the result for a key.
+        """
+        self._cache[key] = result
+        if self.base is not None:
+            path = self._path(key)
+            with self._lock:
+                tmp = '%s.%s.tmp' % (path, os.getpid())
+                try:
+                    result.save(tmp)
+                    if os.path.exists(path):
+                        os.remove(path)
+                    os.rename(tmp, path)
+                except Exception as e:
+                    logger.warning('Unable to cache resolution %s: %s',
+                                   path, e)
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+
+    def clear(self):
+        """
+        Clear the cache.
+        """
+        self._cache.clear()
+        if self.base is not None:
+            with self._lock:
+                for fn in os.listdir(self.base):
+                    if fn.endswith(('.json', '.tmp')):
+                        os.remove(os.path.join(self.base, fn))
+
+    def stats(self):
+        """
+        Get statistics for the in-memory cache, as returned by
+        :meth:`LRUCache.stats`.
+        """
+        return self._cache.stats()
+
+
 class DependencyFinder(object):
     """
     Locate dependencies for distributions.
     """
 
-    def __init__(self, locator=None):
+    modes = ('greedy', 'backtrack')
+
+    def __init__(self, locator=None, mode='greedy', prefetch=True,
+                 resolution_cache=None):
         """
         Initialise an instance, using the specified locator
         to locate distributions.
+
+        :param mode: One of 'greedy' (the default) or 'backtrack'. In greedy
+                     mode, the most recent version matching each requirement
+                     is added as it's found, and conflicts with what was
+                     added before are reported as problems. In backtrack
+                     mode, other candidate versions are tried until a
+                     consistent set of distributions is found; if there
+                     isn't one, the greedy result is returned.
+        :param prefetch: In greedy mode, whether the projects needed for a
+                         set of unmet requirements are asked for together,
+                         using the locator's get_projects, so that locators
+                         which can look them up concurrently do so. If
+                         false, projects are looked up one at a time.
+        :param resolution_cache: A :class:`ResolutionCache` in which the
+                                 results of :meth:`find` are kept, so that
+                                 they can be reused while the locator's
+                                 state is unchanged.
         """
+        if mode not in self.modes:
+            raise ValueError('Unknown mode: %r' % mode)
+        self.mode = mode
+        self.prefetch = prefetch
+        self.resolution_cache = resolution_cache
+        self._result = None
+        self._result_args = None
         self.locator = locator or default_locator
         self.scheme = get_scheme(self.locator.scheme)
 
@@ -934,7 +3736,10 @@ class DependencyFinder(object):
         for p in dist.provides:
             name, version = self._get_name_and_version(p)
             logger.debug('Add to provided: %s, %s, %s', name, version, dist)
-            self.provided.setdefault(name, set()).add((version, dist))
+            if name not in self.provided:
+                self.provided[name] = _ProviderIndex(
+                                        self.scheme.matcher.version_class)
+            self.provided[name].add(version, dist)
 
     def remove_distribution(self, dist):
         """
@@ -950,7 +3755,7 @@ class DependencyFinder(object):
             name, version = self._get_name_and_version(p)
             logger.debug('Remove from provided: %s, %s, %s', name, version, dist)
             s = self.provided[name]
-            s.remove((version, dist))
+            s.remove(version, dist)
             if not s:
                 del self.provided[name]
 
@@ -963,11 +3768,11 @@ class DependencyFinder(object):
                  :class:`distlib.version.Matcher`).
         """
         try:
-            matcher = self.scheme.matcher(reqt)
+            matcher = self.scheme.get_matcher(reqt)
         except UnsupportedVersionError:
             # XXX compat-mode if cannot read the version
             name = reqt.split()[0]
-            matcher = self.scheme.matcher(name)
+            matcher = self.scheme.get_matcher(name)
         return matcher
 
     def find_providers(self, reqt):
@@ -977,21 +3782,17 @@ class DependencyFinder(object):
         :param reqt: The requirement.
          :type reqt: str
         :return: A set of distribution which can fulfill the requirement.
+                 This holds the provider with the most recent matching
+                 version, if there is one.
         """
         matcher = self.get_matcher(reqt)
         name = matcher.key   # case-insensitive
         result = set()
         provided = self.provided
         if name in provided:
-            for version, provider in provided[name]:
-                try:
-                    match = matcher.match(version)
-                except UnsupportedVersionError:
-                    match = False
-
-                if match:
-                    result.add(provider)
-                    break
+            provider = provided[name].find(matcher)
+            if provider is not None:
+                result.add(provider)
         return result
 
     def try_to_replace(self, provider, other, problems):
@@ -1021,7 +3822,8 @@ class DependencyFinder(object):
                 unmatched.add(s)
         if unmatched:
             # can't replace other with provider
-            problems.add(('cantreplace', provider, other, unmatched))
+            problems.add(('cantreplace', provider, other,
+                          frozenset(unmatched)))
             result = False
         else:
             # can replace other with provider
@@ -1033,6 +3835,199 @@ class DependencyFinder(object):
             result = True
         return result
 
+    def _add_providers(self, reqt, providers, problems):
+        """
+        Record the providers for a requirement, trying to replace any other
+        distribution with the same name which was found earlier.
+        """
+        for p in providers:
+            name = p.key
+            if name not in self.dists_by_name:
+                self.reqts.setdefault(p, set()).add(reqt)
+            else:
+                other = self.dists_by_name[name]
+                if other != p:
+                    # see if other can be replaced by p
+                    self.try_to_replace(p, other, problems)
+
+    def _prefetch(self, requirements):
+        """
+        Look up the projects named in some requirements with a single call
+        to the locator's get_projects, so that their results are cached
+        before they're located one by one. How (and whether) they're looked
+        up concurrently is left to the locator, as only it knows what's safe.
+        """
+        names = []
+        for r in requirements:
+            try:
+                name = self.get_matcher(r).name
+            except Exception:
+                continue    # locate will complain about it
+            if name not in names:
+                names.append(name)
+        # with a single project, there's nothing to gain by prefetching
+        if len(names) > 1:
+            try:
+                self.locator.get_projects(names)
+            except Exception as e:
+                # locate will raise this when it looks up the project again
+                logger.debug('Unable to prefetch %s: %s', names, e)
+
+    def _matches(self, matcher, dist):
+        """
+        Say whether a distribution's version matches a matcher.
+        """
+        try:
+            result = matcher.match(dist.version)
+        except UnsupportedVersionError:
+            result = False
+        return result
+
+    def _add_requirements(self, state, name, dist, tests):
+        """
+        Queue a chosen distribution's requirements for processing during a
+        backtracking search.
+        """
+        install = name in state.install
+        ireqts = dist.requires
+        others = dist.setup_requires
+        if tests and install:
+            others = others | dist.test_requires
+        for r in sorted(ireqts):
+            state.pending.append((r, name, install))
+        for r in sorted(others - ireqts):
+            state.pending.append((r, name, False))
+
+    def _decide(self, decision, nogoods, trail, tests):
+        """
+        Choose the next candidate for a decision in a backtracking search
+        (the candidates all match the requirement the decision was made for)
+        which isn't ruled out by a learned conflict. Candidates are taken
+        lazily, so the locator is only asked for as many as are needed.
+
+        :return: The state after the choice, or ``None`` if there are no
+                 candidates left.
+        """
+        name = decision.name
+        before = decision.before
+        chosen = before.chosen
+        for dist in decision.candidates:
+            assignment = (name, dist.version)
+            reason = None
+            for nogood in nogoods.get(assignment, ()):
+                for n, v in nogood:
+                    if n != name and (n not in chosen or
+                                      chosen[n].version != v):
+                        break
+                else:
+                    reason = nogood - set([assignment])
+                    break
+            if reason is not None:
+                logger.debug('rejected %s', dist.name_and_version)
+                decision.explanation |= reason
+                continue
+            logger.debug('trying %s', dist.name_and_version)
+            decision.version = dist.version
+            state = before.copy()
+            state.chosen[name] = dist
+            if decision.install:
+                state.install.add(name)
+            self._add_requirements(state, name, dist, tests)
+            trail.append(decision)
+            return state
+        return None
+
+    def _backjump(self, conflict, nogoods, trail, fixed, tests):
+        """
+        Learn from a conflict in a backtracking search (a set of assignments
+        which can't all hold at once) and go back to the most recent decision
+        which contributed to it, to try another candidate there.
+
+        :return: The state to continue the search from, or ``None`` if the
+                 search has failed.
+        """
+        while True:
+            nogood = frozenset(conflict - fixed)
+            if not nogood:
+                return None
+            logger.debug('learned conflict: %s', sorted(nogood))
+            for assignment in nogood:
+                nogoods.setdefault(assignment, []).append(nogood)
+            while trail:
+                decision = trail.pop()
+                assignment = (decision.name, decision.version)
+                if assignment in nogood:
+                    decision.explanation |= nogood - set([assignment])
+                    state = self._decide(decision, nogoods, trail, tests)
+                    if state is not None:
+                        return state
+                    conflict = decision.explanation
+                    break
+            else:
+                return None
+
+    def _find_backtracking(self, requirement, tests, prereleases):
+        """
+        Find a consistent set of distributions for find, using a
+        backtracking search. Candidate versions for each name are tried most
+        recent first. When a conflict is found, the assignments which caused
+        it are learned, so that the same combination isn't tried again, and
+        the search goes back to the most recent decision involved in it.
+
+        :return: A tuple of the distributions chosen and the names of those
+                 needed after installation, or ``None`` if there's no
+                 consistent set.
+        """
+        state = _Resolution()
+        fixed = set()   # assignments which the search can't undo
+        nogoods = {}    # learned conflicts, keyed by each of their members
+        trail = []      # decisions made, most recent last
+        if isinstance(requirement, Distribution):
+            name = requirement.key
+            state.chosen[name] = requirement
+            state.install.add(name)
+            state.constraints[name] = []
+            fixed.add((name, requirement.version))
+            self._add_requirements(state, name, requirement, tests)
+        else:
+            state.pending.append((requirement, None, True))
+        while state.pending:
+            reqt, parent, install = state.pending.popleft()
+            matcher = self.get_matcher(reqt)
+            name = matcher.key
+            if name in state.chosen:
+                state.constraints[name].append((reqt, parent))
+                dist = state.chosen[name]
+                if self._matches(matcher, dist):
+                    if install and name not in state.install:
+                        state.install.add(name)
+                        self._add_requirements(state, name, dist, tests)
+                    continue
+                logger.debug('%s does not match %r', dist.name_and_version,
+                             reqt)
+                conflict = set([state.assignment(name)])
+                if parent is not None:
+                    conflict.add(state.assignment(parent))
+            else:
+                state.constraints[name] = [(reqt, parent)]
+                explanation = set()
+                if parent is not None:
+                    explanation.add(state.assignment(parent))
+                candidates = self.locator.iter_candidates(
+                                reqt, prereleases=prereleases)
+                decision = _Decision(name, candidates, state, install,
+                                     explanation)
+                new_state = self._decide(decision, nogoods, trail, tests)
+                if new_state is not None:
+                    state = new_state
+                    continue
+                logger.debug('no candidates left for %r', reqt)
+                conflict = decision.explanation
+            state = self._backjump(conflict, nogoods, trail, fixed, tests)
+            if state is None:
+                return None
+        return state
+
     def find(self, requirement, tests=False, prereleases=False):
         """
         Find a distribution matching requirement and all distributions
@@ -1055,13 +4050,105 @@ class DependencyFinder(object):
         The problems should be a tuple consisting of the string
         ``'unsatisfied'`` and the requirement which couldn't be satisfied
         by any distribution known to the locator.
+
+        Afterwards, the :attr:`result` attribute holds a
+        :class:`ResolutionResult` for the call. If the finder has a
+        :attr:`resolution_cache` and ``requirement`` is a string, a cached
+        result is used if there is one for the same arguments and the same
+        state of the locator (as given by its
+        :meth:`~Locator.state_fingerprint`), and the distributions returned
+        are recreated from it.
+        """
+        cache = self.resolution_cache
+        use_cache = (cache is not None and
+                     isinstance(requirement, string_types))
+        if use_cache:
+            key = self._get_cache_key(requirement, tests, prereleases)
+            result = None if key is None else cache.get(key)
+            if result is not None:
+                logger.debug('using cached resolution for %r', requirement)
+                dists, problems = result.get_distributions(self.locator)
+                self.provided = {}
+                self.dists = {}
+                self.dists_by_name = {}
+                self.reqts = {}
+                found = dict(((d.key, d.version), d) for d in dists)
+                for d in result.dists:
+                    dist = found[d['name'].lower(), d['version']]
+                    self.add_distribution(dist)
+                    if d['reqts']:
+                        self.reqts[dist] = set(d['reqts'])
+                self._result = result
+                self._result_args = None
+                return dists, problems
+        dists, problems = self._find(requirement, tests, prereleases)
+        # The result is only worked out if it's needed, as that means
+        # finding the providers of every requirement and loading the
+        # metadata of every distribution.
+        self._result = None
+        self._result_args = (requirement, dists, problems, tests,
+                             prereleases)
+        if use_cache:
+            # The locator's state may have changed while finding (e.g. as
+            # projects were cached), so the fingerprint is taken again.
+            key = self._get_cache_key(requirement, tests, prereleases)
+            if key is not None:
+                cache.put(key, self.result)
+        return dists, problems
+
+    def _get_result(self):
+        if self._result is None and self._result_args is not None:
+            self._result = ResolutionResult.from_finder(self,
+                                                        *self._result_args)
+        return self._result
+
+    # A ResolutionResult for the last call to find, worked out when it's
+    # first asked for.
+    result = property(_get_result)
+
+    def _get_cache_key(self, requirement, tests, prereleases):
         """
+        Get the key for a result in the resolution cache, or ``None`` if the
+        locator's state can't be identified.
+        """
+        fingerprint = self.locator.state_fingerprint()
+        if fingerprint is None:
+            result = None
+        else:
+            result = self.resolution_cache.make_key(requirement,
+                                                    self.locator.scheme,
+                                                    self.mode, tests,
+                                                    prereleases, fingerprint)
+        return result
 
+    def _find(self, requirement, tests, prereleases):
+        """
+        Do the work for :meth:`find`.
+        """
         self.provided = {}
         self.dists = {}
         self.dists_by_name = {}
         self.reqts = {}
 
+        if self.mode == 'backtrack':
+            if isinstance(requirement, Distribution):
+                requirement.requested = True
+            state = self._find_backtracking(requirement, tests, prereleases)
+            if state is not None:
+                for dist in state.chosen.values():
+                    self.add_distribution(dist)
+                for name, constraints in state.constraints.items():
+                    dist = state.chosen[name]
+                    for reqt, parent in constraints:
+                        if parent is None:
+                            dist.requested = True
+                        self.reqts.setdefault(dist, set()).add(reqt)
+                    dist.build_time_dependency = name not in state.install
+                logger.debug('find done for %r', requirement)
+                return set(self.dists.values()), set()
+            logger.warning('No consistent set of distributions found for '
+                           '%r', requirement)
+
         if isinstance(requirement, Distribution):
             dist = odist = requirement
             logger.debug('passed %s as requirement', odist)
@@ -1076,50 +4163,58 @@ class DependencyFinder(object):
         todo = set([dist])
         install_dists = set([odist])
         while todo:
-            dist = todo.pop()
-            name = dist.key # case-insensitive
-            if name not in self.dists_by_name:
-                self.add_distribution(dist)
-            else:
-                #import pdb; pdb.set_trace()
-                other = self.dists_by_name[name]
-                if other != dist:
-                    self.try_to_replace(dist, other, problems)
-
-            ireqts = dist.requires
-            sreqts = dist.setup_requires
-            ereqts = set()
-            if not tests or dist not in install_dists:
-                treqts = set()
-            else:
-                treqts = dist.test_requires
-            all_reqts = ireqts | sreqts | treqts | ereqts
-            for r in all_reqts:
+            # The distributions found so far are dealt with as a wave, in a
+            # fixed order so that the results are deterministic. The projects
+            # needed for the wave's unmet requirements are then looked up
+            # concurrently.
+            wave = sorted(todo, key=lambda d: (d.key, d.version))
+            todo = set()
+            pending = []
+            for dist in wave:
+                name = dist.key # case-insensitive
+                if name not in self.dists_by_name:
+                    self.add_distribution(dist)
+                else:
+                    #import pdb; pdb.set_trace()
+                    other = self.dists_by_name[name]
+                    if other != dist:
+                        self.try_to_replace(dist, other, problems)
+
+                ireqts = dist.requires
+                sreqts = dist.setup_requires
+                ereqts = set()
+                if not tests or dist not in install_dists:
+                    treqts = set()
+                else:
+                    treqts = dist.test_requires
+                all_reqts = ireqts | sreqts | treqts | ereqts
+                for r in sorted(all_reqts):
+                    install = r in ireqts and dist in install_dists
+                    pending.append((r, install))
+            unmet = []
+            for r, install in pending:
                 providers = self.find_providers(r)
-                if not providers:
+                if providers:
+                    self._add_providers(r, providers, problems)
+                else:
                     logger.debug('No providers found for %r', r)
-                    provider = self.locator.locate(r, prereleases=prereleases)
-                    if provider is None:
-                        logger.debug('Cannot satisfy %r', r)
-                        problems.add(('unsatisfied', r))
-                    else:
-                        n, v = provider.key, provider.version
-                        if (n, v) not in self.dists:
-                            todo.add(provider)
-                        providers.add(provider)
-                        if r in ireqts and dist in install_dists:
-                            install_dists.add(provider)
-                            logger.debug('Adding %s to install_dists',
-                                         provider.name_and_version)
-                for p in providers:
-                    name = p.key
-                    if name not in self.dists_by_name:
-                        self.reqts.setdefault(p, set()).add(r)
-                    else:
-                        other = self.dists_by_name[name]
-                        if other != p:
-                            # see if other can be replaced by p
-                            self.try_to_replace(p, other, problems)
+                    unmet.append((r, install))
+            if self.prefetch:
+                self._prefetch([r for r, install in unmet])
+            for r, install in unmet:
+                provider = self.locator.locate(r, prereleases=prereleases)
+                if provider is None:
+                    logger.debug('Cannot satisfy %r', r)
+                    problems.add(('unsatisfied', r))
+                else:
+                    n, v = provider.key, provider.version
+                    if (n, v) not in self.dists:
+                        todo.add(provider)
+                    if install:
+                        install_dists.add(provider)
+                        logger.debug('Adding %s to install_dists',
+                                     provider.name_and_version)
+                    self._add_providers(r, set([provider]), problems)
 
         dists = set(self.dists.values())
         for dist in dists:
@@ -19,6 +19,7 @@ import ssl
 import sys
 import tarfile
 import tempfile
+import threading
 import time
 import zipfile
 
@@ -26,7 +27,8 @@ from . import DistlibException
 from .compat import (string_types, text_type, shutil, raw_input,
                      cache_from_source, urlopen, httplib, xmlrpclib, splittype,
                      HTTPHandler, HTTPSHandler as BaseHTTPSHandler,
-                     URLError, match_hostname, CertificateError)
+                     URLError, match_hostname, CertificateError, addinfourl,
+                     OrderedDict)
 
 logger = logging.getLogger(__name__)
 
@@ -1171,6 +1173,341 @@ class HTTPSOnlyHandler(HTTPSHandler, HTTPHandler):
         raise URLError('Unexpected HTTP request on what should be a secure '
                        'connection: %s' % req)
 
+#
+# HTTP/1.1 keep-alive. The standard handlers close the connection after every
+# request, so fetching many small pages from one host spends most of its time
+# setting up connections (and, for HTTPS, doing TLS handshakes). This handler
+# keeps idle connections in a pool, keyed by scheme, host and timeout, so that
+# they can be reused. It can be shared between threads: a connection is only
+# returned to the pool once its response has been read to the end.
+#
+# Like HTTPSOnlyHandler, it inherits from the standard handlers, so
+# build_opener won't add handlers of its own for HTTP and HTTPS.
+#
+
+class _PooledResponse(object):
+    """
+    A file-like wrapper around an HTTP response, which returns the connection
+    the response came from to its pool once the response has been read. If
+    it's closed before then, the connection is closed instead.
+    """
+    def __init__(self, response, release):
+        self._response = response
+        self._release = release
+
+    def _check_done(self):
+        if self._release and self._response.isclosed():
+            release, self._release = self._release, None
+            release(True)
+
+    def read(self, amt=None):
+        if amt is None:
+            result = self._response.read()
+        else:
+            result = self._response.read(amt)
+        self._check_done()
+        return result
+
+    def readline(self, limit=-1):
+        # Not used by distlib, so no attempt is made to be efficient.
+        chunks = []
+        while limit < 0 or len(chunks) < limit:
+            c = self._response.read(1)
+            if not c:
+                break
+            chunks.append(c)
+            if c == b'\n':
+                break
+        self._check_done()
+        return b''.join(chunks)
+
+    def close(self):
+        self._check_done()
+        if self._release:
+            # not read to the end, so the connection can't be reused
+            release, self._release = self._release, None
+            self._response.close()
+            release(False)
+
+
+class KeepAliveHandler(BaseHTTPSHandler, HTTPHandler):
+    def __init__(self, max_idle=10):
+        """
+        Initialise an instance.
+
+        :param max_idle: The maximum number of idle connections kept for each
+                         (scheme, host, timeout) combination.
+        """
+        BaseHTTPSHandler.__init__(self)
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def http_open(self, req):
+        return self._open(httplib.HTTPConnection, 'http', req)
+
+    def https_open(self, req):
+        return self._open(httplib.HTTPSConnection, 'https', req)
+
+    def close(self):
+        """
+        Close all the idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def _open(self, conn_class, scheme, req):
+        if getattr(req, '_tunnel_host', None):
+            # proxy tunnelling is left to the standard implementation
+            return self.do_open(conn_class, req)
+        try:
+            host, selector, data = req.host, req.selector, req.data
+        except AttributeError:  # pragma: no cover - 2.x
+            host, selector, data = (req.get_host(), req.get_selector(),
+                                    req.get_data())
+        key = (scheme, host, req.timeout)
+        headers = dict(req.unredirected_hdrs)
+        for k, v in req.headers.items():
+            if k not in headers:
+                headers[k] = v
+        headers = dict((k.title(), v) for k, v in headers.items())
+        headers['Connection'] = 'keep-alive'
+        while True:
+            with self._lock:
+                conns = self._idle.get(key)
+                conn = conns.pop() if conns else None
+            reused = conn is not None
+            if conn is None:
+                conn = conn_class(host, timeout=req.timeout)
+            try:
+                conn.request(req.get_method(), selector, data, headers)
+                r = conn.getresponse()
+                break
+            except (socket.error, httplib.HTTPException) as e:
+                conn.close()
+                # A pooled connection may have been closed by the server
+                # while idle, so retry with a new one in that case.
+                if not reused:
+                    raise URLError(e)
+
+        def release(reusable):
+            if reusable and not r.will_close:
+                with self._lock:
+                    conns = self._idle.setdefault(key, [])
+                    if len(conns) >= self.max_idle:
+                        reusable = False
+                    else:
+                        conns.append(conn)
+            if not reusable or r.will_close:
+                conn.close()
+
+        result = addinfourl(_PooledResponse(r, release), r.msg,
+                            req.get_full_url(), r.status)
+        result.msg = r.reason
+        return result
+
+#
+# Bounded in-memory caches
+#
+
+class LRUCache(object):
+    """
+    A thread-safe, dictionary-like cache which can be bounded by its number
+    of entries and/or by their total size, in which case the least recently
+    used entries are evicted first. Entries can also expire after a
+    time-to-live. Counts of hits, misses, evictions and expirations are kept.
+    """
+    def __init__(self, max_entries=None, max_size=None, ttl=None,
+                 sizeof=None, timer=None):
+        """
+        Initialise an instance.
+
+        :param max_entries: The maximum number of entries. If ``None``, the
+                            number of entries is unbounded.
+        :param max_size: The maximum total size of the entries' values, as
+                         computed by ``sizeof``. If ``None``, the size is
+                         unbounded.
+        :param ttl: The time, in seconds, after which an entry expires. If
+                    ``None``, entries don't expire.
+        :param sizeof: A callable which returns the size of a value, which
+                       defaults to :func:`sys.getsizeof`. It's only called
+                       if ``max_size`` is specified.
+        :param timer: A callable returning the current time, which defaults
+                      to :func:`time.time`.
+        """
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sizeof = sizeof or sys.getsizeof
+        self.timer = timer or time.time
+        self._data = OrderedDict()  # key -> (value, size, expiry time)
+        self._size = 0
+        self._lock = threading.RLock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def _remove(self, key):
+        value, size, expires = self._data.pop(key)
+        self._size -= size
+
+    def _lookup(self, key):
+        # Return the entry for key if it's present and hasn't expired, marking
+        # it as the most recently used. Call with the lock held.
+        entry = self._data.get(key)
+        if entry is not None:
+            if entry[2] is not None and entry[2] <= self.timer():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            else:
+                del self._data[key]
+                self._data[key] = entry
+        return entry
+
+    def __getitem__(self, key):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                raise KeyError(key)
+            self.hits += 1
+            return entry[0]
+
+    def get(self, key, default=None):
+        try:
+            result = self[key]
+        except KeyError:
+            result = default
+        return result
+
+    def __contains__(self, key):
+        # Checking for a key doesn't count as a hit or a miss.
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def __setitem__(self, key, value):
+        if self.max_size is None:
+            size = 0
+        else:
+            size = self.sizeof(value)
+        if self.ttl is None:
+            expires = None
+        else:
+            expires = self.timer() + self.ttl
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, expires)
+            self._size += size
+            while self._data and (
+                (self.max_entries is not None and
+                 len(self._data) > self.max_entries) or
+                (self.max_size is not None and self._size > self.max_size)):
+                # the oldest entry comes first
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                result = default
+            else:
+                self._remove(key)
+                result = entry[0]
+        return result
+
+    def __len__(self):
+        # This includes any expired entries which haven't been purged yet.
+        return len(self._data)
+
+    def items(self):
+        """
+        Return a list of the (key, value) pairs for the entries which haven't
+        expired, least recently used first. This doesn't count as using them.
+        """
+        with self._lock:
+            now = self.timer()
+            return [(k, v[0]) for k, v in self._data.items()
+                    if v[2] is None or v[2] > now]
+
+    @property
+    def size(self):
+        return self._size
+
+    def purge(self):
+        """
+        Remove any expired entries.
+        """
+        if self.ttl is not None:
+            with self._lock:
+                now = self.timer()
+                expired = [k for k, v in self._data.items() if v[2] <= now]
+                for k in expired:
+                    self._remove(k)
+                self.expirations += len(expired)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+    def stats(self):
+        """
+        Get statistics for the cache.
+
+        :return: A dictionary with keys ``hits``, ``misses``, ``evictions``,
+                 ``expirations``, ``entries`` and ``size``.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'entries': len(self._data),
+                'size': self._size,
+            }
+
+
+class CachePolicy(object):
+    """
+    A policy for the in-memory caches used by an object such as a locator.
+    Each cache is created by :meth:`make_cache`, which can be overridden in
+    a subclass to use another kind of cache.
+    """
+    def __init__(self, max_entries=None, max_size=None, ttl=None):
+        """
+        Initialise an instance.
+
+        :param max_entries: The maximum number of entries in each cache.
+        :param max_size: The maximum total size of the entries in each cache.
+        :param ttl: The time, in seconds, after which cache entries expire.
+
+        For each argument, ``None`` (the default) means no limit.
+        """
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.ttl = ttl
+
+    def make_cache(self, sizeof=None):
+        """
+        Make a cache which follows this policy.
+
+        :param sizeof: A callable which returns the size of a value in the
+                       cache.
+        :return: A dictionary-like object which supports ``in``, ``get``,
+                 ``pop``, ``clear`` and ``stats``, as well as getting,
+                 setting and deleting items.
+        """
+        return LRUCache(self.max_entries, self.max_size, self.ttl, sizeof)
+
 #
 # XML-RPC with timeouts
 #
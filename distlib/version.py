@@ -11,6 +11,7 @@ distribute-compatible and semantic versioning.
 import re
 
 from .compat import string_types
+from .util import LRUCache
 
 __all__ = ['NormalizedVersion', 'NormalizedMatcher',
            'LegacyVersion', 'LegacyMatcher',
@@ -667,10 +668,32 @@ class AdaptiveMatcher(NormalizedMatcher):
 
 
 class VersionScheme(object):
+
+    # The maximum number of matchers cached by get_matcher.
+    max_matchers = 2000
+
     def __init__(self, key, matcher, suggester=None):
         self.key = key
         self.matcher = matcher
         self.suggester = suggester
+        self.matcher_cache = LRUCache(max_entries=self.max_matchers)
+
+    def get_matcher(self, s):
+        """
+        Get a matcher for a requirement, as ``self.matcher(s)`` would, but
+        using a bounded cache of the matchers made for each requirement
+        string, so that the same string isn't parsed again. The matchers
+        returned are shared, so they shouldn't be modified.
+
+        Statistics for the cache are available from ``matcher_cache.stats()``.
+        """
+        cache = self.matcher_cache
+        key = (self.matcher, s)
+        result = cache.get(key)
+        if result is None:
+            result = self.matcher(s)
+            cache[key] = result
+        return result
 
     def is_valid_version(self, s):
         try:
@@ -682,7 +705,7 @@ class VersionScheme(object):
 
     def is_valid_matcher(self, s):
         try:
-            self.matcher(s)
+            self.get_matcher(s)
             result = True
         except UnsupportedVersionError:
             result = False
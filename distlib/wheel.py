@@ -625,14 +625,79 @@ COMPATIBLE_TAGS = compatible_tags()
 
 del compatible_tags
 
+class TagIndex(object):
+    """
+    An index of (pyver, abi, arch) tags, for quickly checking whether wheels
+    are compatible with them and ranking compatible wheels. Each tag's rank
+    is its position in the list the index was built from, so tags should be
+    listed most specific first (as in ``COMPATIBLE_TAGS``).
+    """
+    def __init__(self, tags=None):
+        """
+        Initialise an instance.
+
+        :param tags: The tags to index. If not specified, the tags compatible
+                     with this Python implementation are used.
+        """
+        if tags is None:
+            tags = COMPATIBLE_TAGS
+        self.tags = [tuple(tag) for tag in tags]
+        self._ranks = ranks = {}
+        for i, tag in enumerate(self.tags):
+            ranks.setdefault(tag, i)
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __contains__(self, tag):
+        return tuple(tag) in self._ranks
+
+    def rank_tags(self, pyver, abi, arch):
+        """
+        Return the rank of the best match for a wheel's tags in the index.
+
+        :param pyver: The wheel's Python version tags.
+        :param abi: The wheel's ABI tags.
+        :param arch: The wheel's architecture tags.
+        :return: The lowest rank of any combination of the tags which is in
+                 the index, or ``None`` if no combination is.
+        """
+        ranks = self._ranks
+        result = None
+        for p in pyver:
+            for b in abi:
+                for a in arch:
+                    rank = ranks.get((p, b, a))
+                    if rank is not None and (result is None or
+                                             rank < result):
+                        result = rank
+        return result
+
+    def rank(self, wheel):
+        """
+        Return the rank of a wheel: lower ranks indicate more specific
+        matches with the index, and ``None`` indicates an incompatible wheel.
+
+        :param wheel: A :class:`Wheel` instance or the filename of a wheel.
+        """
+        if not isinstance(wheel, Wheel):
+            wheel = Wheel(wheel)    # assume it's a filename
+        return self.rank_tags(wheel.pyver, wheel.abi, wheel.arch)
+
+    def is_compatible(self, wheel):
+        """
+        Indicate if a wheel is compatible with the indexed tags.
+
+        :param wheel: A :class:`Wheel` instance or the filename of a wheel.
+        """
+        return self.rank(wheel) is not None
+
+
+COMPATIBLE_TAG_INDEX = TagIndex(COMPATIBLE_TAGS)
+
 def is_compatible(wheel, tags=None):
-    if not isinstance(wheel, Wheel):
-        wheel = Wheel(wheel)    # assume it's a filename
-    result = False
     if tags is None:
-        tags = COMPATIBLE_TAGS
-    for ver, abi, arch in tags:
-        if ver in wheel.pyver and abi in wheel.abi and arch in wheel.arch:
-            result = True
-            break
-    return result
+        tags = COMPATIBLE_TAG_INDEX
+    elif not isinstance(tags, TagIndex):
+        tags = TagIndex(tags)
+    return tags.is_compatible(wheel)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Vinay Sajip.
+# Licensed to the Python Software Foundation under a contributor agreement.
+# See LICENSE.txt and CONTRIBUTORS.txt.
+#
+"""
+Benchmarks for :class:`DependencyFinder` on synthetic, conflict-heavy
+dependency graphs held by an in-memory locator:
+
+* chains, where every version of each project requires the same version of
+  the next one, and the top-level requirement pins the last project to an old
+  version, so that only the oldest chain is consistent.
+* grids, where each project in a layer requires every project in the next
+  layer at the same version or later, and the projects in the last layer
+  require old versions of each other, so only the oldest versions are
+  consistent.
+
+For each graph, the greedy and backtracking modes are timed, and the numbers
+of problems reported, of requirements left unmet by the distributions found
+and of distributions found are shown.
+
+Provider lookups are also timed, for names with many providers: each
+distribution provides itself and the virtual names ``api`` and ``impl`` (via
+``Provides-Dist``), at versions which differ between distributions. The index
+used by :meth:`DependencyFinder.find_providers` is compared with a linear scan
+of the providers.
+
+Usage: python bench_finder.py [size ...]
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+# Always find our sources first
+sys.path.insert(0, '..')
+
+from distlib.database import make_dist
+from distlib.locators import Locator, DependencyFinder
+from distlib.version import UnsupportedVersionError
+
+VERSIONS = 10
+
+class MemoryLocator(Locator):
+    """
+    A locator for canned projects, which map project names to dictionaries
+    mapping versions to lists of requirements.
+    """
+    def __init__(self, projects, **kwargs):
+        super(MemoryLocator, self).__init__(**kwargs)
+        self.projects = projects
+
+    def _get_project(self, name):
+        result = {}
+        for version, reqts in self.projects.get(name, {}).items():
+            dist = make_dist(name, version)
+            dist.metadata['Requires-Dist'] = reqts
+            dist.locator = self
+            result[version] = dist
+        return result
+
+    def get_distribution_names(self):
+        return set(self.projects)
+
+def make_chain(n):
+    projects = {}
+    for i in range(n):
+        projects['chain%d' % i] = dict(
+            ('%d.0' % v, ['chain%d (== %d.0)' % (i + 1, v)])
+            for v in range(1, VERSIONS + 1))
+    projects['chain%d' % n] = dict(('%d.0' % v, [])
+                                   for v in range(1, VERSIONS + 1))
+    projects['top'] = {'1.0': ['chain0', 'chain%d (< 2.0)' % n]}
+    return projects
+
+def make_grid(n):
+    # Layers of three projects; each version v of a project requires the
+    # projects in the next layer at versions >= v, and the last layer's
+    # projects require each other at versions < 2.0.
+    projects = {}
+    width = 3
+    for layer in range(n):
+        for j in range(width):
+            name = 'grid%d_%d' % (layer, j)
+            projects[name] = dict(
+                ('%d.0' % v, ['grid%d_%d (>= %d.0)' % (layer + 1, k, v)
+                              for k in range(width)])
+                for v in range(1, VERSIONS + 1))
+    for j in range(width):
+        name = 'grid%d_%d' % (n, j)
+        projects[name] = dict(
+            ('%d.0' % v, ['grid%d_%d (< 2.0)' % (n, (j + 1) % width)])
+            for v in range(1, VERSIONS + 1))
+    projects['top'] = {'1.0': ['grid0_%d' % j for j in range(width)] +
+                              ['grid%d_0 (< 2.0)' % n]}
+    return projects
+
+def count_unmet(finder, dists):
+    """
+    Count the requirements of the distributions found which aren't met by
+    the versions found.
+    """
+    found = dict((d.key, d) for d in dists)
+    result = 0
+    for dist in dists:
+        for reqt in dist.requires:
+            matcher = finder.get_matcher(reqt)
+            other = found.get(matcher.key)
+            if other is None or not matcher.match(other.version):
+                result += 1
+    return result
+
+def bench(projects, mode):
+    finder = DependencyFinder(MemoryLocator(projects), mode=mode)
+    start = time.time()
+    dists, problems = finder.find('top')
+    elapsed = time.time() - start
+    return elapsed, len(problems), count_unmet(finder, dists), len(dists)
+
+def make_providers(finder, n):
+    finder.provided = {}
+    finder.dists = {}
+    finder.dists_by_name = {}
+    for i in range(n):
+        dist = make_dist('dist%d' % i, '1.0')
+        dist.metadata['Provides-Dist'] = ['api (%d.%d)' % divmod(i, 10),
+                                          'impl (%d.0)' % (n - i)]
+        finder.add_distribution(dist)
+
+def linear_find_providers(finder, reqt):
+    # How providers were found before they were indexed: the first match
+    # found in a scan of all of them.
+    matcher = finder.get_matcher(reqt)
+    result = set()
+    for version, provider in set(finder.provided.get(matcher.key, ())):
+        try:
+            match = matcher.match(version)
+        except UnsupportedVersionError:
+            match = False
+        if match:
+            result.add(provider)
+            break
+    return result
+
+def bench_providers(n):
+    finder = DependencyFinder(MemoryLocator({}))
+    make_providers(finder, n)
+    reqts = ['api (< 1.0)', 'api (>= 1.0, < 2.0)', 'impl (< 3.0)',
+             'impl (== 2.0)', 'api (> %d.0)' % n, 'api']
+    results = []
+    for find in (finder.find_providers,
+                 lambda reqt: linear_find_providers(finder, reqt)):
+        start = time.time()
+        for i in range(10):
+            for reqt in reqts:
+                find(reqt)
+        results.append(time.time() - start)
+    return results
+
+def main(sizes):
+    fmt = '%-6s %6s %-10s %10s %9s %6s %6s'
+    print(fmt % ('graph', 'size', 'mode', 'time (s)', 'problems', 'unmet',
+                 'dists'))
+    for n in sizes:
+        for name, factory in (('chain', make_chain), ('grid', make_grid)):
+            projects = factory(n)
+            for mode in DependencyFinder.modes:
+                # best of three
+                results = [bench(projects, mode) for i in range(3)]
+                elapsed, problems, unmet, dists = min(results)
+                print('%-6s %6d %-10s %10.4f %9d %6d %6d' % (name, n, mode,
+                                                             elapsed,
+                                                             problems, unmet,
+                                                             dists))
+    print()
+    fmt = '%-9s %6s %12s %12s'
+    print(fmt % ('providers', 'size', 'indexed (s)', 'linear (s)'))
+    for n in sizes:
+        n *= 100
+        indexed, linear = bench_providers(n)
+        print('%-9s %6d %12.4f %12.4f' % ('api/impl', n, indexed, linear))
+
+if __name__ == '__main__':
+    sizes = [int(s) for s in sys.argv[1:]] or [10, 30]
+    main(sizes)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2013 Vinay Sajip.
+# Licensed to the Python Software Foundation under a contributor agreement.
+# See LICENSE.txt and CONTRIBUTORS.txt.
+#
+"""
+Benchmarks for processing large synthetic simple-index pages:
+
+* scanning a page for links with the :class:`LinkScanner` (fed in chunks, as
+  when a page is streamed) against :attr:`Page.links` (which needs the whole
+  page up front).
+* converting the links to download information, with and without the
+  results for their filenames cached.
+
+Usage: python bench_locators.py [number-of-links ...]
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+# Always find our sources first
+sys.path.insert(0, '..')
+
+from distlib.locators import Locator, Page, LinkScanner, SimpleScrapingLocator
+
+URL = 'https://pypi.python.org/simple/foo/'
+LINK = ('<a href="../../packages/%s#md5=0123456789abcdef0123456789abcdef"'
+        ' rel="download">%s</a><br/>\n')
+FILENAMES = ('foo-%s.tar.gz', 'foo-%s.zip', 'foo-%s-py2.py3-none-any.whl',
+             'foo-%s-cp27-none-win32.whl')
+
+def make_filenames(n):
+    result = []
+    for i in range(n):
+        version = '%d.%d.%d' % (i // 400, (i // 40) % 10, (i // 4) % 10)
+        result.append(FILENAMES[i % 4] % version)
+    return result
+
+def make_page(n):
+    links = [LINK % (fn, fn) for fn in make_filenames(n)]
+    return '<html><body>\n%s</body></html>\n' % ''.join(links)
+
+def bench_regex(data):
+    start = time.time()
+    links = Page(data, URL).links
+    elapsed = time.time() - start
+    # all the page must be read before the first link is available
+    return elapsed, elapsed, len(links)
+
+def bench_scanner(data, chunk_size):
+    start = time.time()
+    first = None
+    scanner = LinkScanner(URL)
+    links = set()
+    for i in range(0, len(data), chunk_size):
+        found = scanner.feed(data[i:i + chunk_size])
+        if found and first is None:
+            first = time.time() - start
+        links.update(found)
+    elapsed = time.time() - start
+    return elapsed, first, len(links)
+
+def bench_convert(links, cached):
+    locator = Locator()
+    if not cached:
+        locator.max_filename_cache = 0
+    convert = locator.convert_url_to_download_info
+    # the first pass fills the cache, and the second uses it
+    times = []
+    for i in range(2):
+        start = time.time()
+        count = 0
+        for url, rel in links:
+            if convert(url, 'foo'):
+                count += 1
+        times.append(time.time() - start)
+    return times[0], times[1], count
+
+def main(sizes):
+    chunk_size = SimpleScrapingLocator.chunk_size
+    fmt = '%-8s %8s %10s %10s %10s'
+    print(fmt % ('method', 'links', 'size (KB)', 'total (s)', 'first (s)'))
+    for n in sizes:
+        data = make_page(n)
+        kb = len(data) // 1024
+        for name, func, args in (('regex', bench_regex, ()),
+                                 ('scanner', bench_scanner, (chunk_size,))):
+            # best of three
+            results = [func(data, *args) for i in range(3)]
+            elapsed, first, count = min(results)
+            print('%-8s %8d %10d %10.4f %10.4f' % (name, count, kb, elapsed,
+                                                   first))
+    print()
+    fmt = '%-8s %8s %12s %12s %10s'
+    print(fmt % ('method', 'links', 'pass 1 (s)', 'pass 2 (s)', 'matched'))
+    for n in sizes:
+        links = Page(make_page(n), URL).links
+        for name, cached in (('uncached', False), ('cached', True)):
+            first, second, count = bench_convert(links, cached)
+            print('%-8s %8d %12.4f %12.4f %10d' % (name, len(links), first,
+                                                   second, count))
+
+if __name__ == '__main__':
+    sizes = [int(s) for s in sys.argv[1:]] or [1000, 10000, 50000]
+    main(sizes)
@@ -19,7 +19,8 @@ if _ver[0] < 3:
     import Queue as queue
     from SimpleXMLRPCServer import SimpleXMLRPCServer
     from SimpleHTTPServer import SimpleHTTPRequestHandler
-    from BaseHTTPServer import HTTPServer
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
     text_type = unicode
     from urllib import unquote
     from urllib2 import Request
@@ -27,7 +28,9 @@ if _ver[0] < 3:
 else:
     import queue
     from xmlrpc.server import SimpleXMLRPCServer
-    from http.server import HTTPServer, SimpleHTTPRequestHandler
+    from http.server import (HTTPServer, SimpleHTTPRequestHandler,
+                             BaseHTTPRequestHandler)
+    from socketserver import ThreadingMixIn
     text_type = str
     from urllib.parse import urlparse, unquote
     from urllib.request import Request
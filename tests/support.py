@@ -4,6 +4,7 @@
 # See LICENSE.txt and CONTRIBUTORS.txt.
 #
 import codecs
+import hashlib
 import os
 import logging
 import logging.handlers
@@ -16,7 +17,8 @@ import threading
 import weakref
 
 from compat import (unittest, HTTPServer as BaseHTTPServer,
-                    SimpleHTTPRequestHandler, urlparse)
+                    SimpleHTTPRequestHandler, BaseHTTPRequestHandler,
+                    ThreadingMixIn, SimpleXMLRPCServer, urlparse)
 
 from distlib import logger
 
@@ -243,6 +245,151 @@ class HTTPSServerThread(threading.Thread):
     def stop(self):
         self.server.shutdown()
 
+class PageRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serve canned responses from the server's ``pages`` dictionary, which maps
+    a path to a (content_type, body) tuple, or to an HTTP status code for an
+    error response. A path can also be mapped to a list of these, which are
+    used in turn for successive requests (the last is repeated). Each request
+    is recorded in the server's ``requests`` list as a (path, headers) tuple.
+
+    If the server's ``compress`` attribute is set to 'gzip' or 'deflate' (or
+    'raw-deflate', for deflate data without the zlib header) and the client
+    accepts that encoding, bodies are sent compressed.
+    """
+
+    server_version = "TestHTTP/1.0"
+    protocol_version = 'HTTP/1.1'
+    timeout = 5
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers))
+        page = self.server.pages.get(self.path)
+        if isinstance(page, list):
+            page = page.pop(0) if len(page) > 1 else page[0]
+        if page is None:
+            self.send_error(404)
+            return
+        if isinstance(page, int):
+            self.send_error(page)
+            return
+        content_type, body = page
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        compress = self.server.compress
+        encoding = compress and compress.replace('raw-', '')
+        accepted = self.headers.get('Accept-Encoding', '')
+        if encoding and encoding in accepted:
+            if compress == 'gzip':
+                c = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            elif compress == 'raw-deflate':
+                c = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+            else:
+                c = zlib.compressobj(9)
+            body = c.compress(body) + c.flush()
+        else:
+            encoding = None
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class ThreadingHTTPServer(ThreadingMixIn, BaseHTTPServer):
+    daemon_threads = True
+
+class HTTPServerThread(threading.Thread):
+    """
+    A plain HTTP server running in a thread, serving canned pages. The number
+    of connections made to it is kept in ``connections``.
+    """
+    def __init__(self, pages=None, handler_class=PageRequestHandler,
+                 compress=None):
+        self.server = ThreadingHTTPServer(('localhost', 0), handler_class)
+        self.server.pages = pages or {}
+        self.server.compress = compress
+        self.server.requests = []
+        self.server.connections = 0
+        self.port = self.server.server_port
+        self.url = 'http://localhost:%d/' % self.port
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    @property
+    def connections(self):
+        return self.server.connections
+
+    def run(self):
+        try:
+            self.server.serve_forever(0.05)
+        finally:
+            self.server.server_close()
+
+    def stop(self):
+        self.server.shutdown()
+        self.join()
+
+class ThreadingXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+    def _marshaled_dispatch(self, *args, **kwargs):
+        with self.lock:
+            self.requests += 1
+        return SimpleXMLRPCServer._marshaled_dispatch(self, *args, **kwargs)
+
+class XMLRPCServerThread(threading.Thread):
+    """
+    An XML-RPC server running in a thread, serving the methods of an
+    instance. The number of requests made to it is kept in ``requests``.
+    If ``multicall`` is false, the server doesn't support
+    ``system.multicall``.
+    """
+    def __init__(self, instance, multicall=True):
+        self.server = ThreadingXMLRPCServer(('localhost', 0), logRequests=False)
+        self.server.register_instance(instance)
+        if multicall:
+            self.server.register_multicall_functions()
+        self.server.lock = threading.Lock()
+        self.server.requests = 0
+        self.port = self.server.server_address[1]
+        self.url = 'http://localhost:%d/' % self.port
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def run(self):
+        try:
+            self.server.serve_forever(0.05)
+        finally:
+            self.server.server_close()
+
+    def stop(self):
+        self.server.shutdown()
+        self.join()
+
 try:
     import docutils
 except ImportError:
@@ -5,25 +5,122 @@
 # See LICENSE.txt and CONTRIBUTORS.txt.
 #
 from __future__ import unicode_literals
+import gc
+import io
+import json
 import os
+import shutil
 import sys
+import tempfile
+import threading
+import time
+import weakref
 
 from compat import unittest
+from support import HTTPServerThread, XMLRPCServerThread
 
-from distlib.compat import url2pathname, urlparse, urljoin
-from distlib.database import DistributionPath, make_graph, make_dist
-from distlib.locators import (SimpleScrapingLocator, PyPIRPCLocator,
-                              PyPIJSONLocator, DirectoryLocator,
-                              DistPathLocator, AggregatingLocator,
-                              JSONLocator, DistPathLocator,
-                              DependencyFinder, locate,
-                              get_all_distribution_names, default_locator)
+from distlib import DistlibException
+from distlib.compat import (url2pathname, urlparse, urljoin, HTTPError,
+                            addinfourl)
+from distlib.database import (DistributionPath, LazyDistribution,
+                              make_graph, make_dist)
+from distlib.util import CachePolicy
+from distlib.locators import (Locator, SimpleScrapingLocator, DownloadScorer,
+                              PyPIRPCLocator, PyPIJSONLocator,
+                              DirectoryLocator, DistPathLocator,
+                              AggregatingLocator, JSONLocator,
+                              DependencyFinder, PageCache, Page, LinkScanner,
+                              IndexSnapshot, SnapshotLocator, NameIndex,
+                              HostHealth, SimpleJSONLocator,
+                              ResolutionCache, ResolutionResult,
+                              locate, get_all_distribution_names,
+                              default_locator)
 
 HERE = os.path.abspath(os.path.dirname(__file__))
 
 PYPI_RPC_HOST = 'http://python.org/pypi'
 PYPI_WEB_HOST = os.environ.get('PYPI_WEB_HOST', 'https://pypi.python.org/simple/')
 
+SIMPLE_PAGES = {
+    '/simple/foo/': ('text/html', '<html><body>'
+                     '<a href="../../packages/foo-1.0.tar.gz">foo-1.0</a>'
+                     '<a href="../../packages/foo-1.1.tar.gz">foo-1.1</a>'
+                     '</body></html>'),
+    '/simple/bar/': ('text/html', '<html><body>'
+                     '<a href="../../packages/bar-0.1.zip">bar-0.1</a>'
+                     '</body></html>'),
+}
+
+class RecordingLocator(DirectoryLocator):
+    """
+    A directory locator which records the batches of projects it's asked
+    to look up.
+    """
+    def __init__(self, *args, **kwargs):
+        super(RecordingLocator, self).__init__(*args, **kwargs)
+        self.batches = []
+
+    def _get_projects(self, names):
+        self.batches.append(list(names))
+        return super(RecordingLocator, self)._get_projects(names)
+
+class SlowLocator(Locator):
+    """
+    A locator which takes a while to return canned results, which map
+    project names to lists of versions. The names it's asked to look up are
+    recorded in ``calls``.
+    """
+    def __init__(self, delay, projects, **kwargs):
+        super(SlowLocator, self).__init__(**kwargs)
+        self.delay = delay
+        self.projects = projects
+        self.calls = []
+
+    def _get_project(self, name):
+        self.calls.append(name)
+        time.sleep(self.delay)
+        if name == 'broken':
+            raise ValueError('broken project')
+        result = {}
+        for version in self.projects.get(name, []):
+            dist = make_dist(name, version)
+            dist.locator = self
+            result[version] = dist
+        return result
+
+    def get_distribution_names(self):
+        return set(self.projects)
+
+class MemoryLocator(Locator):
+    """
+    A locator for canned projects, which map project names to dictionaries
+    mapping versions to lists of requirements. The names it's asked to look
+    up are recorded in ``calls``, and each lookup takes ``delay`` seconds.
+    """
+    def __init__(self, projects, delay=0, **kwargs):
+        super(MemoryLocator, self).__init__(**kwargs)
+        self.projects = projects
+        self.delay = delay
+        self.calls = []
+
+    def _get_project(self, name):
+        self.calls.append(name)
+        if self.delay:
+            time.sleep(self.delay)
+        result = {}
+        for version, reqts in self.projects.get(name, {}).items():
+            dist = make_dist(name, version)
+            dist.metadata['Requires-Dist'] = reqts
+            dist.locator = self
+            result[version] = dist
+        return result
+
+    def get_distribution_names(self):
+        return set(self.projects)
+
+    def state_fingerprint(self):
+        return json.dumps(self.projects, sort_keys=True)
+
 class LocatorTestCase(unittest.TestCase):
 
     @unittest.skipIf('SKIP_SLOW' in os.environ, 'Skipping slow test')
@@ -42,6 +139,84 @@ class LocatorTestCase(unittest.TestCase):
         names = locator.get_distribution_names()
         self.assertGreater(len(names), 25000)
 
+    def test_xmlrpc_fan_out(self):
+        class FakeIndex(object):
+            releases = ['1.%d' % i for i in range(20)]
+
+            def package_releases(self, name, show_hidden):
+                if name != 'foo':
+                    return []
+                return self.releases
+
+            def release_urls(self, name, version):
+                return [{'url': 'http://example.com/foo-%s.tar.gz' % version,
+                         'md5_digest': 'a' * 32}]
+
+            def release_data(self, name, version):
+                return {'name': name, 'version': version,
+                        'summary': 'Foo %s' % version}
+
+        for multicall in (True, False):
+            server = XMLRPCServerThread(FakeIndex(), multicall)
+            server.start()
+            try:
+                locator = PyPIRPCLocator(server.url)
+                for i in range(2):
+                    result = locator.get_project('foo')
+                    self.assertEqual(set(result), set(FakeIndex.releases))
+                    for v, dist in result.items():
+                        self.assertEqual(dist.version, v)
+                        self.assertEqual(dist.metadata['Summary'],
+                                         'Foo %s' % v)
+                        self.assertEqual(dist.download_url,
+                                         'http://example.com/foo-%s.tar.gz' %
+                                         v)
+                        self.assertEqual(dist.md5_digest, 'a' * 32)
+                    locator.clear_cache()
+                self.assertEqual(locator.multicall, multicall)
+                if multicall:
+                    # package_releases and a multicall, twice
+                    self.assertEqual(server.requests, 4)
+                else:
+                    # one failed multicall attempt, then 41 calls, twice
+                    self.assertEqual(server.requests, 83)
+                self.assertEqual(locator.get_project('bar'), {})
+            finally:
+                server.stop()
+
+    def test_xmlrpc_multicall_faults(self):
+        class FakeIndex(object):
+            releases = ['1.%d' % i for i in range(20)]
+            failures = ['1.3', '1.7']
+
+            def package_releases(self, name, show_hidden):
+                return self.releases
+
+            def release_urls(self, name, version):
+                return [{'url': 'http://example.com/foo-%s.tar.gz' % version}]
+
+            def release_data(self, name, version):
+                if version in self.failures:
+                    # fails the first time only
+                    self.failures.remove(version)
+                    raise ValueError('transient failure')
+                return {'name': name, 'version': version}
+
+        server = XMLRPCServerThread(FakeIndex())
+        server.start()
+        try:
+            locator = PyPIRPCLocator(server.url)
+            # large release lists are sent in chunks
+            locator.multicall_size = 8
+            result = locator.get_project('foo')
+            self.assertEqual(set(result), set(FakeIndex.releases))
+            # failures of single calls don't stop multicall being used, and
+            # the calls for those versions are made again separately
+            self.assertTrue(locator.multicall)
+            self.assertEqual(server.requests, 1 + 3 + 4)
+        finally:
+            server.stop()
+
     @unittest.skipIf('SKIP_SLOW' in os.environ, 'Skipping slow test')
     def test_json(self):
         locator = PyPIJSONLocator(PYPI_RPC_HOST)
@@ -87,6 +262,880 @@ class LocatorTestCase(unittest.TestCase):
         result = locator.get_project(NAME)
         self.assertFalse(result)
 
+    def test_page_cache(self):
+        server = HTTPServerThread(SIMPLE_PAGES)
+        server.start()
+        cache_dir = tempfile.mkdtemp()
+        try:
+            url = server.url + 'simple/'
+            cache = PageCache(cache_dir, ttl=0)
+            with SimpleScrapingLocator(url, page_cache=cache) as locator:
+                result = locator.get_project('foo')
+            self.assertEqual(set(result), set(['1.0', '1.1']))
+            self.assertEqual(len(server.requests), 1)
+            self.assertNotIn('If-None-Match', server.requests[0][1])
+            # a new locator revalidates the cached page
+            with SimpleScrapingLocator(url, page_cache=cache) as locator:
+                result = locator.get_project('foo')
+            self.assertEqual(set(result), set(['1.0', '1.1']))
+            self.assertEqual(len(server.requests), 2)
+            self.assertIn('If-None-Match', server.requests[1][1])
+            # within the TTL, the server isn't contacted at all
+            cache.ttl = 3600
+            with SimpleScrapingLocator(url, page_cache=cache) as locator:
+                result = locator.get_project('foo')
+            self.assertEqual(set(result), set(['1.0', '1.1']))
+            self.assertEqual(len(server.requests), 2)
+            # offline, only cached pages are available
+            server.stop()
+            server = None
+            cache = PageCache(cache_dir, ttl=0, offline=True)
+            with SimpleScrapingLocator(url, page_cache=cache) as locator:
+                result = locator.get_project('foo')
+                self.assertFalse(locator.get_project('bar'))
+            self.assertEqual(set(result), set(['1.0', '1.1']))
+            # the cache is trimmed to its maximum size
+            cache.max_size = 0
+            cache.evict()
+            self.assertEqual(os.listdir(cache_dir), [])
+        finally:
+            if server:
+                server.stop()
+            shutil.rmtree(cache_dir)
+
+    def test_get_projects(self):
+        server = HTTPServerThread(SIMPLE_PAGES)
+        server.start()
+        try:
+            with SimpleScrapingLocator(server.url + 'simple/',
+                                       num_workers=2) as locator:
+                result = locator.get_projects(['foo', 'bar', 'baz', 'foo'])
+                self.assertEqual(set(result), set(['foo', 'bar', 'baz']))
+                self.assertEqual(set(result['foo']), set(['1.0', '1.1']))
+                self.assertEqual(set(result['bar']), set(['0.1']))
+                self.assertEqual(result['bar']['0.1'].name, 'bar')
+                self.assertEqual(result['baz'], {})
+                self.assertEqual(len(server.requests), 3)
+                # results are cached, as for get_project
+                self.assertIs(locator.get_project('foo'), result['foo'])
+                result = locator.get_projects(['bar', 'foo'])
+                self.assertEqual(len(server.requests), 3)
+        finally:
+            server.stop()
+        d = os.path.join(HERE, 'fake_archives')
+        locator = DirectoryLocator(d)
+        result = locator.get_projects(['Flask', 'coverage'])
+        self.assertIn('0.9', result['Flask'])
+        self.assertEqual(result['coverage'], locator.get_project('coverage'))
+
+    def test_worker_pool(self):
+        server = HTTPServerThread(SIMPLE_PAGES)
+        server.start()
+        try:
+            url = server.url + 'simple/'
+            with SimpleScrapingLocator(url, num_workers=1) as locator:
+                self.assertEqual(len(locator._threads), 0)
+                self.assertIn('1.0', locator.get_project('foo'))
+                self.assertEqual(len(locator._threads), 1)
+                thread = locator._threads[0]
+                self.assertIn('0.1', locator.get_project('bar'))
+                # the same thread and connection were used for both projects
+                self.assertEqual(locator._threads, [thread])
+                self.assertEqual(len(server.requests), 2)
+                self.assertEqual(server.connections, 1)
+            self.assertEqual(locator._threads, [])
+            self.assertFalse(thread.is_alive())
+            # idle threads terminate, and new ones are started when needed
+            locator = SimpleScrapingLocator(url, num_workers=2)
+            locator.idle_timeout = 0.01
+            self.assertIn('1.0', locator.get_project('foo'))
+            for t in list(locator._threads):
+                t.join()
+            self.assertEqual(locator._threads, [])
+            self.assertIn('0.1', locator.get_project('bar'))
+            locator.close()
+        finally:
+            server.stop()
+
+    def test_unclosed_locators(self):
+        # Locators which aren't closed don't keep their threads, which would
+        # keep the locators alive, for long.
+        self.assertIsNotNone(SimpleScrapingLocator.idle_timeout)
+        server = HTTPServerThread(SIMPLE_PAGES)
+        server.start()
+        try:
+            url = server.url + 'simple/'
+            refs = []
+            threads = []
+            for i in range(5):
+                locator = SimpleScrapingLocator(url, num_workers=4)
+                locator.idle_timeout = 0.05
+                self.assertIn('1.0', locator.get_project('foo'))
+                self.assertEqual(len(locator._threads), 4)
+                threads.extend(locator._threads)
+                refs.append(weakref.ref(locator))
+            del locator
+            for t in threads:
+                t.join(5.0)
+                self.assertFalse(t.is_alive())
+            gc.collect()
+            self.assertEqual([r() for r in refs], [None] * 5)
+        finally:
+            server.stop()
+
+    def test_link_scanner(self):
+        data = ('<html><head><base href="http://example.com/simple/">'
+                '</head><body>\n'
+                '<a href="../packages/foo-1.0.tar.gz#md5=123">foo-1.0</a>\n'
+                "<A HREF='foo-1.1.zip' rel=download>foo-1.1</A>\n"
+                '<a rel="homepage" href="http://foo.org/">home</a>\n'
+                '<p>no links here, 1 < 2</p><a href=foo%20bar&amp;x.zip>x</a>'
+                '</body></html>')
+        expected = Page(data, 'http://localhost/').links
+        self.assertEqual(len(expected), 5)   # includes the base URL
+        for size in (1, 7, 64, len(data)):
+            scanner = LinkScanner('http://localhost/')
+            links = []
+            for i in range(0, len(data), size):
+                links.extend(scanner.feed(data[i:i + size]))
+            self.assertEqual(sorted(links, reverse=True), expected)
+            self.assertEqual(scanner.base_url, 'http://example.com/simple/')
+        # an unterminated tag isn't buffered indefinitely
+        scanner = LinkScanner('http://localhost/', max_buffer=10)
+        self.assertEqual(scanner.feed('<a href="%s' % ('x' * 20)), [])
+        self.assertEqual(scanner.feed('.zip">'), [])
+        self.assertEqual(scanner.feed('<a href="y.zip">'),
+                         [('http://localhost/y.zip', '')])
+
+    def test_host_health(self):
+        now = [0]
+        health = HostHealth(max_failures=3, backoff=1, max_backoff=4,
+                            jitter=0, cooldown=30, retry_budget=2,
+                            retry_ratio=0.5, timer=lambda: now[0])
+        self.assertTrue(health.allow('a'))
+        health.record_failure('a')
+        # backoff doubles with each consecutive failure
+        self.assertFalse(health.allow('a'))
+        now[0] = 1
+        self.assertTrue(health.allow('a'))
+        health.record_failure('a')
+        now[0] = 2.5
+        self.assertFalse(health.allow('a'))
+        now[0] = 3
+        self.assertTrue(health.allow('a'))
+        self.assertTrue(health.allow('b'))   # other hosts are unaffected
+        health.record_failure('a')
+        self.assertEqual(health.get_state('a'), 'open')
+        now[0] = 32
+        self.assertFalse(health.allow('a'))
+        # after the cooldown, a single probe is allowed
+        now[0] = 33
+        self.assertTrue(health.allow('a'))
+        self.assertEqual(health.get_state('a'), 'half-open')
+        self.assertFalse(health.allow('a'))
+        health.record_failure('a')
+        self.assertEqual(health.get_state('a'), 'open')
+        now[0] = 63
+        self.assertTrue(health.allow('a'))
+        health.record_success('a')
+        self.assertEqual(health.get_state('a'), 'closed')
+        self.assertTrue(health.allow('a'))
+        # the retry budget is used up by retries and topped up by successes
+        self.assertTrue(health.retry('a'))
+        self.assertTrue(health.retry('a'))
+        self.assertFalse(health.retry('a'))
+        health.record_success('a')
+        health.record_success('a')
+        self.assertTrue(health.retry('a'))
+        stats = health.stats()['a']
+        self.assertEqual(stats, {
+            'state': 'closed', 'failures': 0, 'retry_budget': 0,
+            'successes': 3, 'total_failures': 4, 'retries': 3,
+            'rejected': 4, 'trips': 2,
+        })
+        self.assertEqual(health.delay(10), 4)
+        health.reset()
+        self.assertEqual(health.stats(), {})
+        # the hosts tracked are bounded, the least recently used going first
+        self.assertEqual(health._hosts.max_entries, HostHealth.max_hosts)
+        health = HostHealth(cache_policy=CachePolicy(max_entries=2))
+        for host in ('a', 'b', 'a', 'c'):
+            health.record_failure(host)
+        self.assertEqual(set(health.stats()), set(['a', 'c']))
+        self.assertEqual(health.stats()['a']['total_failures'], 2)
+        self.assertEqual(health.cache_stats()['evictions'], 1)
+
+    def test_transient_errors(self):
+        page = ('text/html', '<a href="foo-1.0.tar.gz">foo-1.0.tar.gz</a>')
+        pages = {
+            '/simple/foo/': [503, 500, page],
+            '/simple/bar/': 502,
+            '/simple/baz/': [404, page],
+        }
+        server = HTTPServerThread(pages)
+        server.start()
+        try:
+            health = HostHealth(backoff=0.1, max_failures=2, cooldown=60)
+            with SimpleScrapingLocator(server.url + 'simple/',
+                                       host_health=health) as locator:
+                # retried until it succeeds
+                self.assertIn('1.0', locator.get_project('foo'))
+                self.assertEqual(len(server.requests), 3)
+                # retried until the retries for the request run out, which
+                # counts as a failure of the host
+                self.assertEqual(locator.get_project('bar'), {})
+                self.assertEqual(len(server.requests), 6)
+                self.assertEqual(health.get_state('localhost'), 'closed')
+                # until the backoff delay has passed, the host isn't tried
+                locator.clear_cache()
+                self.assertEqual(locator.get_project('bar'), {})
+                self.assertEqual(len(server.requests), 6)
+                # the next failure opens the circuit, after which the host
+                # isn't tried
+                time.sleep(0.2)
+                locator.clear_cache()
+                self.assertEqual(locator.get_project('bar'), {})
+                self.assertEqual(health.get_state('localhost'), 'open')
+                self.assertEqual(len(server.requests), 9)
+                self.assertEqual(locator.get_project('baz'), {})
+                self.assertEqual(len(server.requests), 9)
+                stats = health.stats()['localhost']
+                self.assertEqual((stats['retries'], stats['rejected']),
+                                 (6, 2))
+        finally:
+            server.stop()
+
+    def test_errors_not_from_host(self):
+        # Errors which aren't network or server errors don't count against
+        # the host.
+        pages = {'/simple/foo/': ('text/html',
+                                  '<a href="foo-1.0.tar.gz">foo-1.0</a>')}
+        server = HTTPServerThread(pages)
+        server.start()
+        try:
+            health = HostHealth(max_failures=1, cooldown=60)
+            url = server.url + 'simple/foo/'
+            with SimpleScrapingLocator(server.url + 'simple/',
+                                       host_health=health) as locator:
+                def process_links(links):
+                    raise ValueError('bug in process_links')
+
+                for i in range(3):
+                    locator._page_cache.clear()
+                    self.assertIsNone(locator._get_page(url, process_links))
+                self.assertEqual(len(server.requests), 3)
+                self.assertEqual(health.get_state('localhost'), 'closed')
+                self.assertEqual(health.stats()['localhost']['total_failures'],
+                                 0)
+                self.assertIn('1.0', locator.get_project('foo'))
+                # a probe of a half-open circuit which fails like that lets
+                # another probe through
+                health.cooldown = 0
+                health.record_failure('localhost')
+                self.assertEqual(health.get_state('localhost'), 'open')
+                for i in range(2):
+                    locator._page_cache.clear()
+                    self.assertIsNone(locator._get_page(url, process_links))
+                    self.assertEqual(health.get_state('localhost'),
+                                     'half-open')
+                self.assertEqual(len(server.requests), 6)
+                locator._page_cache.clear()
+                self.assertIsNotNone(locator._get_page(url))
+                self.assertEqual(health.get_state('localhost'), 'closed')
+        finally:
+            server.stop()
+
+    def test_streaming(self):
+        links = ''.join(['<a href="../../packages/foo-1.%d.tar.gz">x</a>\n' % i
+                         for i in range(500)])
+        pages = {'/simple/foo/': ('text/html; charset=utf-8',
+                                  '<html><body>%s</body></html>' % links)}
+        server = HTTPServerThread(pages)
+        server.start()
+        try:
+            with SimpleScrapingLocator(server.url + 'simple/') as locator:
+                locator.chunk_size = 100
+                found = []
+                locator._get_page(server.url + 'simple/foo/', found.extend)
+                self.assertEqual(len(found), 500)
+                # the page is still cached for get_page
+                page = locator.get_page(server.url + 'simple/foo/')
+                self.assertEqual(sorted(found, reverse=True), page.links)
+                result = locator.get_project('foo')
+            self.assertEqual(len(result), 500)
+            self.assertIn('1.499', result)
+        finally:
+            server.stop()
+
+    def test_iter_distribution_names(self):
+        names = ['Project-%d' % i for i in range(300)]
+        links = ''.join(['<a href="%s/">%s</a>\n' % (n.lower(), n)
+                         for n in names])
+        pages = {'/simple/': ('text/html; charset=utf-8',
+                              '<html><body>%s</body></html>' % links)}
+        server = HTTPServerThread(pages)
+        server.start()
+        try:
+            with SimpleScrapingLocator(server.url + 'simple/') as locator:
+                # names split across chunks are still found
+                locator.chunk_size = 7
+                it = locator.iter_distribution_names()
+                self.assertEqual(next(it), 'Project-0')
+                self.assertEqual(list(it), names[1:])
+                # now the page is cached
+                self.assertEqual(locator.get_distribution_names(), set(names))
+            self.assertEqual(len(server.requests), 1)
+            # the page is only read ahead of the caller by a few chunks, and
+            # the reading finishes if the caller stops early
+            with SimpleScrapingLocator(server.url + 'simple/') as locator:
+                locator.chunk_size = 7
+                locator.max_queued_chunks = 2
+                url = server.url + 'simple/'
+                it = locator.iter_distribution_names()
+                self.assertEqual(next(it), 'Project-0')
+                time.sleep(0.2)
+                self.assertIsNone(locator._page_cache.get(url))
+                it.close()
+                for i in range(50):
+                    if locator._page_cache.get(url) is not None:
+                        break
+                    time.sleep(0.1)
+                self.assertIsNotNone(locator._page_cache.get(url))
+            with SimpleScrapingLocator(server.url + 'missing/') as locator:
+                it = locator.iter_distribution_names()
+                self.assertRaises(DistlibException, list, it)
+            locator = AggregatingLocator(
+                        JSONLocator(),
+                        SlowLocator(0, {'Project-1': ['1.0'], 'foo': ['1.0']}),
+                        SimpleScrapingLocator(server.url + 'simple/'))
+            with locator:
+                result = list(locator.iter_distribution_names())
+            self.assertEqual(len(result), 301)
+            self.assertEqual(set(result), set(names + ['foo']))
+        finally:
+            server.stop()
+
+    def test_name_index(self):
+        fd, fn = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+        os.remove(fn)
+        try:
+            index = NameIndex(['Flask', 'flask-login', 'Flask-WTF', 'six',
+                               'setuptools', 'Sphinx'], path=fn)
+            index.update(['FLASK', 'sphinxcontrib-foo'])
+            self.assertEqual(len(index), 7)
+            self.assertIn('flask', index)
+            self.assertNotIn('flas', index)
+            self.assertEqual(index.search('FLASK'),
+                             ['Flask', 'flask-login', 'Flask-WTF'])
+            self.assertEqual(index.search('sphinx'),
+                             ['Sphinx', 'sphinxcontrib-foo'])
+            self.assertEqual(index.search('z'), [])
+            self.assertEqual(index.search(''), list(index))
+            index.save()
+            other = NameIndex(path=fn)
+            self.assertEqual(list(other), list(index))
+            self.assertEqual(other.search('s'), ['setuptools', 'six',
+                                                 'Sphinx',
+                                                 'sphinxcontrib-foo'])
+        finally:
+            if os.path.exists(fn):
+                os.remove(fn)
+
+    def test_compressed_pages(self):
+        links = ''.join(['<a href="../../packages/foo-1.%d.tar.gz">x</a>\n' % i
+                         for i in range(500)])
+        body = '<html><body>%s</body></html>' % links
+        pages = {'/simple/foo/': ('text/html; charset=utf-8', body)}
+        for compress in ('gzip', 'deflate', 'raw-deflate'):
+            server = HTTPServerThread(pages, compress=compress)
+            server.start()
+            try:
+                with SimpleScrapingLocator(server.url + 'simple/') as locator:
+                    locator.chunk_size = 100
+                    found = []
+                    url = server.url + 'simple/foo/'
+                    page = locator._get_page(url, found.extend)
+                    self.assertEqual(page.data, body)
+                    # links were found as the page was read
+                    self.assertEqual(len(found), 500)
+                    self.assertEqual(len(locator.get_project('foo')), 500)
+                headers = server.requests[0][1]
+                self.assertIn('gzip', headers.get('Accept-Encoding'))
+                self.assertIn('deflate', headers.get('Accept-Encoding'))
+            finally:
+                server.stop()
+        # compression can be turned off
+        server = HTTPServerThread(pages, compress='gzip')
+        server.start()
+        try:
+            with SimpleScrapingLocator(server.url + 'simple/') as locator:
+                locator.decompressors = {}
+                self.assertEqual(len(locator.get_project('foo')), 500)
+            headers = server.requests[0][1]
+            self.assertEqual(headers.get('Accept-Encoding'), 'identity')
+        finally:
+            server.stop()
+
+    def test_responses_closed(self):
+        # Responses are closed, however a fetch ends, so that connections
+        # are returned to the pool or closed.
+        class Body(io.BytesIO):
+            pass
+
+        class Opener(object):
+            def __init__(self, responses):
+                self.responses = responses
+                self.bodies = []
+                # kept, so that they don't close their bodies when they're
+                # garbage collected
+                self.opened = []
+
+            def open(self, req, timeout=None):
+                code, ctype, data = self.responses.pop(0)
+                body = Body(data)
+                self.bodies.append(body)
+                headers = {'Content-Type': ctype}
+                if code != 200:
+                    result = HTTPError(req.get_full_url(), code, 'Error',
+                                       headers, body)
+                    self.opened.append(result)
+                    raise result
+                result = addinfourl(body, headers, req.get_full_url(), code)
+                self.opened.append(result)
+                return result
+
+        page = b'<a href="foo-1.0.tar.gz">foo-1.0.tar.gz</a>' * 10
+        health = HostHealth(backoff=0)
+        with SimpleScrapingLocator('http://localhost/simple/',
+                                   host_health=health) as locator:
+            url = 'http://localhost/simple/foo/'
+            locator.chunk_size = 8
+            locator.opener = Opener([(503, 'text/html', b'unavailable'),
+                                     (404, 'text/html', b'not found'),
+                                     (200, 'text/html', page),
+                                     (200, 'text/html', page)])
+            self.assertIsNone(locator._get_page(url))
+            locator._page_cache.clear()
+            self.assertIsNotNone(locator._get_page(url))
+
+            def process_links(links):
+                raise ValueError('abandoned')
+
+            locator._page_cache.clear()
+            self.assertIsNone(locator._get_page(url, process_links))
+            self.assertEqual(len(locator.opener.bodies), 4)
+            for body in locator.opener.bodies:
+                self.assertTrue(body.closed)
+
+    def test_unsupported_encoding(self):
+        class Response(object):
+            def info(self):
+                return {'Content-Encoding': 'compress'}
+
+            def read(self, size):
+                return b''
+
+        with SimpleScrapingLocator('http://localhost/simple/') as locator:
+            self.assertRaises(DistlibException, locator._read_page,
+                              Response(), 'http://localhost/simple/foo/',
+                              'utf-8')
+
+    def test_simple_json(self):
+        files = [
+            {'filename': 'foo-1.0.tar.gz', 'url': '../../packages/foo-1.0.tar.gz',
+             'hashes': {'md5': 'a' * 32}},
+            {'filename': 'foo-1.1.tar.gz', 'url': '../../packages/foo-1.1.tar.gz',
+             'hashes': {'sha256': 'c' * 64}, 'requires-python': '>=2.6',
+             'core-metadata': {'sha256': 'b' * 64}},
+            {'filename': 'foo-1.2.tar.gz', 'url': '../../packages/foo-1.2.tar.gz',
+             'hashes': {}, 'yanked': 'broken'},
+            {'filename': 'bar-1.0.tar.gz', 'url': '../../packages/bar-1.0.tar.gz',
+             'hashes': {}},
+        ]
+        ctype = 'application/vnd.pypi.simple.v1+json'
+        metadata = ('Metadata-Version: 2.1\nName: foo\nVersion: 1.1\n'
+                    'Requires-Dist: bar (>= 1.0)\n'
+                    'Requires-Dist: baz; extra == "test"\n')
+        pages = {
+            '/simple/': (ctype, json.dumps({'meta': {'api-version': '1.0'},
+                                            'projects': [{'name': 'foo'},
+                                                         {'name': 'Bar'}]})),
+            '/simple/foo/': (ctype, json.dumps({'meta': {'api-version': '1.0'},
+                                                'name': 'foo',
+                                                'files': files})),
+            '/simple/bar-baz/': ('text/html', '<a href="../../packages/'
+                                 'bar_baz-2.0.tar.gz">bar_baz-2.0.tar.gz</a>'),
+            '/packages/foo-1.1.tar.gz.metadata': ('text/plain', metadata),
+        }
+        server = HTTPServerThread(pages)
+        server.start()
+        try:
+            with SimpleJSONLocator(server.url + 'simple/') as locator:
+                self.assertEqual(locator.get_distribution_names(),
+                                 set(['foo', 'Bar']))
+                result = locator.get_project('foo')
+                self.assertEqual(set(result), set(['1.0', '1.1']))
+                dist = result['1.0']
+                self.assertEqual(dist.download_url,
+                                 server.url + 'packages/foo-1.0.tar.gz')
+                self.assertEqual(dist.md5_digest, 'a' * 32)
+                # only one request per project so far
+                self.assertEqual([r[0] for r in server.requests],
+                                 ['/simple/', '/simple/foo/'])
+                self.assertTrue(server.requests[1][1]['Accept'].startswith(
+                                ctype))
+                dist = locator.locate('foo')
+                self.assertEqual(dist.version, '1.1')
+                # only MD5 digests are used
+                self.assertIsNone(dist.md5_digest)
+                self.assertEqual(dist.metadata['Requires-Python'], '>=2.6')
+                self.assertEqual(dist.requires, set(['bar (>= 1.0)']))
+                self.assertEqual(len(server.requests), 3)
+                # the metadata is only fetched once
+                self.assertIs(locator.locate('foo'), dist)
+                self.assertEqual(len(server.requests), 3)
+                # no metadata for this version
+                dist = locator.locate('foo (< 1.1)')
+                self.assertEqual(dist.version, '1.0')
+                self.assertEqual(len(server.requests), 3)
+                # HTML is accepted too; names are normalised
+                dist = locator.locate('Bar_Baz')
+                self.assertEqual(dist.version, '2.0')
+                self.assertEqual(server.requests[-1][0], '/simple/bar-baz/')
+                self.assertEqual(locator.get_project('missing'), {})
+        finally:
+            server.stop()
+
+    def test_simple_json_malformed(self):
+        ctype = 'application/vnd.pypi.simple.v1+json'
+        pages = {
+            '/simple/': [(ctype, '{"projects": [{"name": "foo"'),
+                         (ctype, '{"meta": {"api-version": "1.0"}}'),
+                         (ctype, '{"projects": [{"title": "foo"}]}'),
+                         (ctype, '{"projects": 1}')],
+            '/simple/foo/': (ctype, '{"name": "foo", "files": [{"filen'),
+        }
+        server = HTTPServerThread(pages)
+        server.start()
+        try:
+            with SimpleJSONLocator(server.url + 'simple/') as locator:
+                # bad pages are skipped, as for the HTML locators
+                self.assertEqual(locator.get_project('foo'), {})
+                self.assertIsNone(locator.locate('foo'))
+                # malformed JSON, and JSON without the expected contents
+                for i in range(4):
+                    self.assertRaises(DistlibException,
+                                      locator.get_distribution_names)
+                self.assertEqual(len(server.requests), 5)
+        finally:
+            server.stop()
+
+    def test_single_flight(self):
+        locator = SlowLocator(0.2, {'foo': ['1.0', '1.1'], 'bar': ['2.0']})
+        results = []
+        errors = []
+
+        def lookup(names):
+            try:
+                if len(names) == 1:
+                    results.append(locator.get_project(names[0]))
+                else:
+                    results.append(locator.get_projects(names)['foo'])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=lookup, args=(names,))
+                   for names in [['foo']] * 8 + [['foo', 'bar']] * 2]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertFalse(errors)
+        # the lookup was only done once, and its result shared
+        self.assertEqual(locator.calls.count('foo'), 1)
+        self.assertEqual(len(results), 10)
+        for r in results:
+            self.assertIs(r, results[0])
+        self.assertEqual(set(results[0]), set(['1.0', '1.1']))
+        # errors are passed on to all the waiting callers
+        threads = [threading.Thread(target=lookup, args=(['broken'],))
+                   for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(locator.calls.count('broken'), 1)
+        self.assertEqual(len(errors), 4)
+        self.assertFalse(locator._in_flight)
+        # failed lookups aren't cached
+        self.assertRaises(ValueError, locator.get_project, 'broken')
+        self.assertEqual(locator.calls.count('broken'), 2)
+
+    def test_scraper_single_flight(self):
+        pages = {
+            '/simple/foo/': ('text/html', '<a href="../../packages/'
+                             'foo-1.0.tar.gz">foo-1.0.tar.gz</a>'),
+        }
+        server = HTTPServerThread(pages)
+        server.start()
+        try:
+            with SimpleScrapingLocator(server.url + 'simple/') as locator:
+                results = []
+                threads = [threading.Thread(target=lambda: results.append(
+                                            locator.get_project('foo')))
+                           for i in range(10)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                self.assertEqual(len(results), 10)
+                for r in results:
+                    self.assertEqual(list(r), ['1.0'])
+            self.assertEqual([r[0] for r in server.requests],
+                             ['/simple/foo/'])
+        finally:
+            server.stop()
+
+    def test_locate_many(self):
+        d = os.path.join(HERE, 'fake_archives')
+        loc1 = RecordingLocator(os.path.join(d, 'subdir'), recursive=False)
+        loc2 = RecordingLocator(d)
+        locator = AggregatingLocator(loc1, loc2)
+        reqts = ['python-gnupg', 'coverage (< 3.5)', 'coverage',
+                 'Flask (0.9)', 'flask', 'nonexistent']
+        result = locator.locate_many(reqts)
+        self.assertEqual(set(result), set(reqts))
+        self.assertEqual(result['python-gnupg'].version, '0.2.9')
+        self.assertEqual(result['coverage (< 3.5)'].version, '3.3.1')
+        self.assertEqual(result['coverage'].version, '3.5.2')
+        self.assertEqual(result['Flask (0.9)'].name, 'Flask')
+        self.assertIs(result['flask'], result['Flask (0.9)'])
+        self.assertIsNone(result['nonexistent'])
+        # each child saw one batch, with names deduplicated and only those
+        # not already found
+        self.assertEqual(loc1.batches, [['Flask', 'coverage', 'nonexistent',
+                                         'python-gnupg']])
+        self.assertEqual(loc2.batches, [['Flask', 'coverage',
+                                         'nonexistent']])
+        for reqt in reqts:
+            self.assertEqual(result[reqt], locator.locate(reqt))
+        result = locator.locate_many(['coverage (< 3.5)'], prereleases=True)
+        self.assertEqual(result['coverage (< 3.5)'].version, '3.4b2')
+        self.assertEqual(len(loc2.batches), 1)
+
+    def test_version_index(self):
+        versions = ['1.0', '1.10', '1.2', '2.0b1', '1.9.1', 'bogus']
+        locator = SlowLocator(0, {'foo': versions}, scheme='normalized')
+        for reqt, prereleases, expected in (
+            ('foo', False, '1.10'),
+            ('foo', True, '2.0b1'),
+            ('foo (< 1.10)', False, '1.9.1'),
+            ('foo (< 1.2)', True, '1.0'),
+            ('foo (> 2.0)', True, None)):
+            dist = locator.locate(reqt, prereleases)
+            if expected is None:
+                self.assertIsNone(dist)
+            else:
+                self.assertEqual(dist.version, expected)
+        # the index was built once, for the cached project
+        self.assertEqual(len(locator._version_index), 1)
+        project = locator.get_project('foo')
+        index, invalid = locator._get_version_index(project)
+        self.assertEqual([t[0] for t in index],
+                         ['2.0b1', '1.10', '1.9.1', '1.2', '1.0'])
+        self.assertEqual([t[2] for t in index],
+                         [True, False, False, False, False])
+        self.assertEqual(invalid, ['bogus'])
+        self.assertIs(locator._get_version_index(project)[0], index)
+        # a change of scheme means the index is rebuilt
+        locator.scheme = 'legacy'
+        self.assertIsNot(locator._get_version_index(project)[0], index)
+        self.assertEqual(locator.locate('foo').version, '1.10')
+        locator.clear_cache()
+        self.assertFalse(locator._version_index)
+
+    def test_cache_policy(self):
+        projects = {'foo': ['1.0'], 'bar': ['2.0'], 'baz': ['3.0']}
+        policy = CachePolicy(max_entries=2, ttl=60)
+        locator = SlowLocator(0, projects, cache_policy=policy)
+        for name in ('foo', 'bar', 'baz', 'bar'):
+            self.assertTrue(locator.locate(name))
+        stats = locator.cache_stats()['projects']
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'],
+                          stats['entries']), (1, 3, 1, 2))
+        # entries expire after the ttl
+        now = time.time()
+        locator._cache.timer = lambda: now + 61
+        self.assertNotIn('bar', locator._cache)
+        self.assertEqual(locator.locate('bar').version, '2.0')
+        stats = locator.cache_stats()['projects']
+        self.assertEqual((stats['misses'], stats['expirations']), (4, 1))
+        # scraping locators bound their pages too
+        locator = SimpleScrapingLocator('http://localhost/',
+                                        cache_policy=policy)
+        try:
+            self.assertEqual(locator._page_cache.max_entries, 2)
+            self.assertEqual(set(locator.cache_stats()),
+                             set(['projects', 'requirements', 'matchers',
+                                  'pages', 'hosts']))
+        finally:
+            locator.close()
+        # an aggregating locator's merged results follow its policy
+        locator = AggregatingLocator(SlowLocator(0, projects),
+                                     cache_policy=CachePolicy(max_entries=1))
+        locator.locate('foo')
+        locator.locate('bar')
+        self.assertEqual(locator.cache_stats()['projects']['entries'], 1)
+
+    def test_convert_url(self):
+        locator = Locator()
+        convert = locator.convert_url_to_download_info
+        url = 'https://pypi.python.org/packages/source/f/foo/foo-1.0.tar.gz'
+        md5 = '#md5=0123456789abcdef0123456789abcdef'
+        expected = {
+            'name': 'foo',
+            'version': '1.0',
+            'filename': 'foo-1.0.tar.gz',
+            'url': url,
+            'md5_digest': '0123456789abcdef0123456789abcdef',
+        }
+        self.assertEqual(convert(url + md5, 'foo'), expected)
+        # results are cached by filename, but the URL and digest aren't
+        info = convert(url, 'foo')
+        del expected['md5_digest']
+        self.assertEqual(info, expected)
+        info.pop('name')
+        self.assertEqual(convert(url, 'foo'), expected)
+        self.assertEqual(convert('http://x.org/foo-1.0.tar.gz', 'foo'),
+                         dict(expected, url='http://x.org/foo-1.0.tar.gz'))
+        self.assertIsNone(convert(url, 'bar'))
+        self.assertEqual(convert('http://x.org/foo-1.0-py2.7.zip/', None),
+                         {'name': 'foo', 'version': '1.0',
+                          'filename': 'foo-1.0-py2.7.zip',
+                          'python-version': '2.7',
+                          'url': 'http://x.org/foo-1.0-py2.7.zip/'})
+        self.assertIsNone(convert('http://x.org/foo-1.0.pdf', 'foo'))
+        wheel = 'Foo_Bar-0.1-1-py27.py3-none-any.whl'
+        self.assertEqual(convert('http://x.org/%s%s' % (wheel, md5),
+                                 'foo-bar'),
+                         {'name': 'Foo_Bar', 'version': '0.1',
+                          'filename': wheel, 'python-version': '2.7, 3',
+                          'url': 'http://x.org/' + wheel,
+                          'md5_digest': '0123456789abcdef0123456789abcdef'})
+        self.assertIsNone(convert('http://x.org/' + wheel, 'foo'))
+        self.assertIsNone(convert('http://x.org/foo.whl', 'foo'))
+        # changing the wheel tags discards cached results
+        locator.wheel_tags = [('py26', 'none', 'any')]
+        self.assertIsNone(convert('http://x.org/' + wheel, 'foo-bar'))
+        locator.wheel_tags = [('py3', 'none', 'any')]
+        self.assertEqual(convert('http://x.org/' + wheel, None)['name'],
+                         'Foo_Bar')
+
+    def test_wheel_preference(self):
+        locator = Locator()
+        locator.wheel_tags = [('cp27', 'cp27m', 'linux_x86_64'),
+                              ('py27', 'none', 'any'), ('py2', 'none', 'any')]
+        urls = ['http://x.org/foo-1.0-py2-none-any.whl',
+                'https://x.org/foo-1.0-cp27-cp27m-linux_x86_64.whl',
+                'http://x.org/foo-1.0-py27-none-any.whl',
+                'http://x.org/foo-1.0-py3-none-any.whl',
+                'http://x.org/foo-1.0.tar.gz']
+        ranks = [locator.wheel_rank(url) for url in urls]
+        self.assertEqual(ranks, [2, 0, 1, None, None])
+        # the most specific wheel is preferred, whatever the order
+        for order in (urls[:3], urls[2::-1]):
+            result = {}
+            for url in order:
+                info = locator.convert_url_to_download_info(url, 'foo')
+                locator._update_version_data(result, info)
+            self.assertEqual(result['1.0'].metadata['Download-URL'], urls[1])
+        # which is independent of URL scoring otherwise
+        self.assertEqual(locator.prefer_url(urls[4], urls[0]), urls[4])
+        self.assertEqual(locator.prefer_url(urls[0], urls[2]), urls[2])
+
+    def test_download_candidates(self):
+        locator = Locator()
+        locator.wheel_tags = [('py27', 'none', 'any'), ('py2', 'none', 'any')]
+        urls = ['http://x.org/foo-1.0.tar.gz#md5=' + 'a' * 32,
+                'https://x.org/foo-1.0.tar.gz',
+                'file:///mirror/foo-1.0.zip',
+                'http://x.org/foo-1.0-py2-none-any.whl',
+                'http://localhost:8000/foo-1.0-py2-none-any.whl',
+                'https://x.org/foo-1.0-py27-none-any.whl',
+                'http://x.org/foo-1.0-py3-none-any.whl']
+        result = {}
+        for url in urls:
+            info = locator.convert_url_to_download_info(url, 'foo')
+            if info:
+                locator._update_version_data(result, info)
+        dist = result['1.0']
+        # all the compatible candidates are kept
+        self.assertEqual(len(dist.candidates), 6)
+        ranked = [c[0] for c in dist.sorted_candidates()]
+        self.assertEqual(ranked, [urls[5], urls[4], urls[3], urls[2],
+                                  urls[1], urls[0].split('#')[0]])
+        self.assertEqual(dist.download_url, urls[5])
+        self.assertIsNone(dist.md5_digest)
+        # a scorer can be plugged in
+        locator.download_scorer = DownloadScorer(prefer_wheels=False)
+        dist.add_candidate('http://localhost/foo-1.0.tar.gz', 'b' * 32)
+        self.assertEqual(dist.download_url, 'http://localhost/foo-1.0.tar.gz')
+        self.assertEqual(dist.md5_digest, 'b' * 32)
+        self.assertEqual(dist.metadata['Download-URL'], dist.download_url)
+        locator.download_scorer = lambda locator, candidates: [
+            -len(c[0]) for c in candidates]
+        dist.add_candidate('http://x.org/foo-1.0.tar.gz')
+        self.assertEqual(dist.metadata['Download-URL'], urls[4])
+
+    def test_snapshot(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        path = os.path.join(workdir, 'index.db')
+        snapshot = IndexSnapshot(path)
+        self.assertEqual(len(snapshot), 0)
+        n = snapshot.import_dir(os.path.join(HERE, 'fake_projects'))
+        self.assertEqual(n, 3)
+        self.assertEqual(snapshot.get_names(), ['hgtools', 'irc',
+                                                'pytest-runner'])
+        self.assertEqual(snapshot.get('IRC')['name'], 'irc')
+        self.assertIsNone(snapshot.get('nonexistent'))
+        # data is replaced, not duplicated
+        data = snapshot.get('hgtools')
+        data['files'] = data['files'][:2]
+        self.assertEqual(snapshot.update([data]), 1)
+        self.assertEqual(len(snapshot), 3)
+        snapshot.close()
+
+        # the snapshot persists, and serves a locator
+        with SnapshotLocator(path, scheme='legacy') as locator:
+            self.assertEqual(locator.get_distribution_names(),
+                             set(['hgtools', 'irc', 'pytest-runner']))
+            result = locator.get_project('irc')
+            self.assertEqual(set(result), set(['5.0', '5.0.1']))
+            dist = result['5.0.1']
+            self.assertEqual(dist.download_url, 'https://pypi.python.org/'
+                             'packages/source/i/irc/irc-5.0.1.tar.gz')
+            self.assertEqual(dist.md5_digest,
+                             'c0191b44412af2a0166460f994ba8626')
+            self.assertEqual(set(locator.get_project('hgtools')),
+                             set(['2.0.3']))
+            self.assertEqual(locator.get_project('nonexistent'), {})
+            finder = DependencyFinder(locator)
+            dists, problems = finder.find('irc (5.0.1)')
+            self.assertFalse(problems)
+            actual = sorted([d.name_and_version for d in dists])
+            self.assertEqual(actual, ['hgtools (2.0.3)', 'irc (5.0.1)',
+                                      'pytest-runner (1.2)'])
+        # a snapshot passed in is left open for its owner
+        snapshot = IndexSnapshot(path)
+        try:
+            with SnapshotLocator(snapshot, scheme='legacy') as locator:
+                self.assertIn('5.0', locator.get_project('irc'))
+            self.assertEqual(len(snapshot), 3)
+        finally:
+            snapshot.close()
+
     def test_dir(self):
         d = os.path.join(HERE, 'fake_archives')
         locator = DirectoryLocator(d)
@@ -110,6 +1159,51 @@ class LocatorTestCase(unittest.TestCase):
             expected.add('config')
         self.assertEqual(names, expected)
 
+    def test_lazy_metadata(self):
+        d = os.path.join(HERE, 'fake_archives')
+        locator = DirectoryLocator(d)
+        result = locator.get_project('Flask')
+        dist = result['0.9']
+        self.assertIsInstance(dist, LazyDistribution)
+        self.assertIsNone(dist._metadata)
+        url = dist.download_url
+        self.assertTrue(url.endswith('/Flask-0.9.tar.gz'))
+        self.assertEqual(dist.name_and_version, 'Flask (0.9)')
+        self.assertIs(locator.locate('Flask'), dist)
+        self.assertIsNone(dist._metadata)
+        # the metadata is created on first use, from the known fields
+        md = dist.metadata
+        self.assertEqual(md['Name'], 'Flask')
+        self.assertEqual(md['Version'], '0.9')
+        self.assertEqual(md['Download-URL'], url)
+        self.assertIs(dist.metadata, md)
+        dist.set_field('Download-URL', 'http://example.com/Flask-0.9.zip')
+        self.assertEqual(md['Download-URL'], 'http://example.com/Flask-0.9.zip')
+        self.assertEqual(dist.download_url, md['Download-URL'])
+        # equal to a plain distribution with the same name, version and URL
+        plain = make_dist('Flask', '0.9')
+        plain.metadata['Download-URL'] = dist.download_url
+        self.assertEqual(dist, plain)
+        self.assertEqual(plain, dist)
+        self.assertEqual(set([dist, plain]), set([plain]))
+        plain.metadata['Download-URL'] = 'http://example.com/other.zip'
+        self.assertFalse(dist == plain)
+
+    def test_lazy_requires_python(self):
+        # Requires-Python comes from the chosen candidate, and is cleared if
+        # a better one without it is added later
+        for create in (False, True):
+            dist = LazyDistribution('foo', '1.0',
+                                    scorer=lambda c: [-len(u) for u, m, p in c])
+            dist.add_candidate('http://example.com/f.tgz', None, '>=3.6')
+            self.assertEqual(dist.get_field('Requires-Python'), '>=3.6')
+            if create:
+                self.assertEqual(dist.metadata['Requires-Python'], '>=3.6')
+            dist.add_candidate('http://example.com/foo-1.0.tar.gz')
+            self.assertEqual(dist.download_url,
+                             'http://example.com/foo-1.0.tar.gz')
+            self.assertEqual(dist.metadata['Requires-Python'], 'UNKNOWN')
+
     def test_dir_nonrecursive(self):
         d = os.path.join(HERE, 'fake_archives')
         locator = DirectoryLocator(d, recursive=False)
@@ -126,6 +1220,55 @@ class LocatorTestCase(unittest.TestCase):
         expected = set(['coverage'])
         self.assertEqual(names, expected)
 
+    def test_dir_index(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        d = os.path.join(workdir, 'archives')
+        shutil.copytree(os.path.join(HERE, 'fake_archives'), d)
+        index_file = os.path.join(workdir, 'index.json')
+
+        # make the directories old enough for their mtimes to be trusted
+        t = os.stat(d).st_mtime - 10
+        for root, dirs, files in os.walk(d):
+            os.utime(root, (t, t))
+
+        class CountingLocator(DirectoryLocator):
+            scans = 0
+            def _scan_dir(self, path):
+                CountingLocator.scans += 1
+                return super(CountingLocator, self)._scan_dir(path)
+
+        locator = CountingLocator(d, index_file=index_file)
+        self.assertEqual(set(locator.get_project('flask')), set(['0.9']))
+        self.assertEqual(CountingLocator.scans, 3)
+        self.assertTrue(os.path.isfile(index_file))
+        self.assertEqual(set(locator.get_project('coverage')),
+                         set(['3.3.1', '3.4b2', '3.5.2']))
+        self.assertEqual(CountingLocator.scans, 3)
+
+        # a new locator uses the saved index
+        CountingLocator.scans = 0
+        locator = CountingLocator(d, index_file=index_file)
+        names = locator.get_distribution_names()
+        self.assertTrue(set(['coverage', 'Django', 'Flask',
+                             'python-gnupg']) <= names)
+        self.assertEqual(CountingLocator.scans, 0)
+
+        # only changed directories are scanned again
+        subdir = os.path.join(d, 'subdir', 'subsubdir')
+        shutil.copy(os.path.join(subdir, 'Flask-0.9.tar.gz'),
+                    os.path.join(subdir, 'Flask-0.10.tar.gz'))
+        os.remove(os.path.join(d, 'subdir', 'python-gnupg-0.2.9.tar.gz'))
+        for p in (os.path.join(d, 'subdir'), subdir):
+            os.utime(p, (t + 5, t + 5))
+        locator.clear_cache()
+        self.assertEqual(set(locator.get_project('Flask')),
+                         set(['0.9', '0.10']))
+        self.assertEqual(locator.get_project('python-gnupg'), {})
+        self.assertEqual(CountingLocator.scans, 2)
+        self.assertEqual(locator.get_distribution_names(),
+                         names - set(['python-gnupg']))
+
     def test_path(self):
         fakes = os.path.join(HERE, 'fake_dists')
         sys.path.insert(0, fakes)
@@ -184,6 +1327,50 @@ class LocatorTestCase(unittest.TestCase):
         n2 = loc2.get_distribution_names()
         self.assertEqual(locator.get_distribution_names(), n1 | n2)
 
+    def test_aggregation_modes(self):
+        fast = SlowLocator(0, {'foo': ['1.0'], 'bar': ['0.1']})
+        slow = SlowLocator(0.1, {'foo': ['1.1'], 'baz': ['0.2']})
+        stuck = SlowLocator(2, {'foo': ['2.0']})
+        self.assertRaises(ValueError, AggregatingLocator, fast, mode='bogus')
+        self.assertRaises(ValueError, AggregatingLocator, fast, slow,
+                          timeout=[1])
+
+        # parallel-merge waits for all but stuck locators
+        locator = AggregatingLocator(stuck, slow, fast,
+                                     mode='parallel-merge', timeout=0.6)
+        start = time.time()
+        result = locator.get_projects(['foo', 'bar', 'baz', 'quux'])
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(set(result['foo']), set(['1.0', '1.1']))
+        self.assertEqual(set(result['bar']), set(['0.1']))
+        self.assertEqual(set(result['baz']), set(['0.2']))
+        self.assertEqual(result['quux'], {})
+        self.assertTrue(locator.merge)
+
+        # race returns the first result in priority order ...
+        locator = AggregatingLocator(slow, fast, mode='race')
+        locator.clear_cache()
+        start = time.time()
+        self.assertEqual(set(locator.get_project('foo')), set(['1.1']))
+        self.assertGreaterEqual(time.time() - start, 0.1)
+        # ... but doesn't wait for locators after one which has found it
+        locator = AggregatingLocator(fast, stuck, mode='race')
+        start = time.time()
+        result = locator.get_projects(['foo', 'bar'])
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(set(result['foo']), set(['1.0']))
+        self.assertEqual(set(result['bar']), set(['0.1']))
+        # locators which time out are skipped
+        locator = AggregatingLocator(stuck, slow, fast, mode='race',
+                                     timeout=[0.5, None, None])
+        locator.clear_cache()
+        start = time.time()
+        result = locator.get_projects(['foo', 'bar', 'quux'])
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(set(result['foo']), set(['1.1']))
+        self.assertEqual(set(result['bar']), set(['0.1']))
+        self.assertEqual(result['quux'], {})
+
     def test_dependency_finder(self):
         locator = AggregatingLocator(
             JSONLocator(),
@@ -242,6 +1429,357 @@ class LocatorTestCase(unittest.TestCase):
         actual = sorted([d.name_and_version for d in dists])
         self.assertTrue(actual[0].startswith('Jinja2 ('))
 
+    def test_backtracking(self):
+        projects = {
+            'A': {'1.0': ['B (== 1.0)'], '2.0': ['B (== 2.0)'],
+                  '3.0': ['B (== 3.0)', 'D (>= 1.0)']},
+            'B': {'1.0': [], '2.0': [], '3.0': []},
+            'C': {'1.0': ['B (< 2.0)'], '0.9': ['B (< 3.0)', 'E']},
+            'D': {'1.0': ['B (>= 3.0)']},
+            'E': {'1.0': []},
+        }
+        dummy = make_dist('dummy', '0.1')
+        dummy.metadata['Requires-Dist'] = ['A', 'C']
+        finder = DependencyFinder(MemoryLocator(projects))
+        dists, problems = finder.find(dummy)
+        self.assertTrue(problems)
+        finder = DependencyFinder(MemoryLocator(projects), mode='backtrack')
+        dists, problems = finder.find(dummy)
+        self.assertFalse(problems)
+        actual = sorted([d.name_and_version for d in dists])
+        self.assertEqual(actual, ['A (2.0)', 'B (2.0)', 'C (0.9)',
+                                  'E (1.0)', 'dummy (0.1)'])
+        self.assertTrue(dummy.requested)
+        for d in dists:
+            self.assertFalse(d.build_time_dependency)
+        # the results are usable by make_graph
+        g = make_graph(dists)
+        slist, cycle = g.topological_sort()
+        self.assertFalse(cycle)
+        self.assertIn(slist[0].name, ('B', 'E'))
+        self.assertEqual(slist[-1].name, 'dummy')
+        # a string requirement is resolved in the same way
+        projects['top'] = {'1.0': ['A (>= 3.0)', 'C'], '0.5': ['A', 'C']}
+        dists, problems = finder.find('top')
+        self.assertFalse(problems)
+        actual = sorted([d.name_and_version for d in dists])
+        self.assertEqual(actual, ['A (2.0)', 'B (2.0)', 'C (0.9)',
+                                  'E (1.0)', 'top (0.5)'])
+        # if there's no consistent set, the greedy result is returned
+        projects['C']['0.9'] = ['B (== 4.0)']
+        dummy.metadata['Requires-Dist'] = ['A (>= 2.0)', 'C']
+        finder = DependencyFinder(MemoryLocator(projects), mode='backtrack')
+        dists, problems = finder.find(dummy)
+        self.assertTrue(problems)
+        self.assertRaises(ValueError, DependencyFinder, finder.locator,
+                          mode='bogus')
+
+    def test_backtracking_learning(self):
+        # Every version of each Pi requires the same version of P(i+1), and
+        # the last one has to be old, so only the oldest chain works. Each
+        # conflict learned rules out a version of P0 without trying the
+        # rest of its chain again.
+        n = 20
+        projects = {}
+        for i in range(n):
+            projects['P%d' % i] = dict(('%d.0' % v,
+                                        ['P%d (== %d.0)' % (i + 1, v)])
+                                       for v in range(1, 6))
+        projects['P%d' % n] = dict(('%d.0' % v, []) for v in range(1, 6))
+        projects['top'] = {'1.0': ['P0', 'P%d (< 2.0)' % n]}
+        locator = MemoryLocator(projects)
+        finder = DependencyFinder(locator, mode='backtrack')
+        dists, problems = finder.find('top')
+        self.assertFalse(problems)
+        versions = set(d.version for d in dists if d.name != 'top')
+        self.assertEqual(versions, set(['1.0']))
+        self.assertEqual(len(dists), n + 2)
+        # each project is only looked up once, thanks to the cache
+        self.assertEqual(len(locator.calls), len(set(locator.calls)))
+
+    def test_find_providers(self):
+        finder = DependencyFinder(MemoryLocator({}))
+        finder.provided = {}
+        finder.dists = {}
+        finder.dists_by_name = {}
+        dists = {}
+        for name, provides in (
+            ('foo', []),
+            ('foo15', ['foo (1.5)']),
+            ('foo20', ['foo (2.0)']),
+            ('foo30a1', ['foo (3.0a1)']),
+            ('bar', ['foo (2.5)']),
+            ('baz', ['foo']),
+            ('a', ['virtual (1.0)']),
+            ('b', ['virtual (1.0)'])):
+            dist = make_dist(name, '1.0')
+            dist.metadata['Provides-Dist'] = provides
+            dists[name] = dist
+        # the order distributions are added in doesn't matter
+        for name in sorted(dists, reverse=True):
+            finder.add_distribution(dists[name])
+
+        def provider(reqt):
+            result = finder.find_providers(reqt)
+            self.assertLessEqual(len(result), 1)
+            if result:
+                return list(result)[0].name
+
+        self.assertEqual(provider('foo'), 'foo30a1')
+        self.assertEqual(provider('foo (< 2.0)'), 'foo15')
+        self.assertEqual(provider('foo (<= 2.0)'), 'foo20')
+        self.assertEqual(provider('foo (> 1.0, < 2.9)'), 'bar')
+        self.assertEqual(provider('foo (>= 1.0, != 2.5, < 2.9)'), 'foo20')
+        self.assertEqual(provider('foo (== 1.0)'), 'foo')
+        self.assertEqual(provider('foo (>= 1.0.0)'), 'foo30a1')
+        self.assertEqual(provider('foo (< 1.0)'), None)
+        self.assertEqual(provider('virtual (>= 1.0)'), 'b')
+        self.assertEqual(provider('nothing'), None)
+        # virtual providers come and go with their distributions
+        finder.remove_distribution(dists['b'])
+        self.assertEqual(provider('virtual (>= 1.0)'), 'a')
+        finder.remove_distribution(dists['a'])
+        self.assertNotIn('virtual', finder.provided)
+        self.assertEqual(provider('virtual'), None)
+        # unversioned providers only match unconstrained requirements
+        for name in ('foo', 'foo15', 'foo20', 'foo30a1', 'bar'):
+            finder.remove_distribution(dists[name])
+        self.assertEqual(provider('foo (>= 1.0)'), None)
+        self.assertEqual(provider('foo'), 'baz')
+
+    def test_prefetch(self):
+        # top needs eight projects, which all need leaf. With prefetching,
+        # the eight are asked for together, and this locator looks them up
+        # concurrently.
+        class BatchLocator(MemoryLocator):
+            def __init__(self, *args, **kwargs):
+                super(BatchLocator, self).__init__(*args, **kwargs)
+                self.batches = []
+
+            def _get_projects(self, names):
+                self.batches.append(sorted(names))
+                result = {}
+
+                def work(name):
+                    result[name] = self._get_project(name)
+
+                threads = [threading.Thread(target=work, args=(name,))
+                           for name in names]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                return result
+
+        names = ['dep%d' % i for i in range(8)]
+        projects = dict((name, {'1.0': ['leaf (>= 1.0)']}) for name in names)
+        projects['leaf'] = {'1.0': [], '2.0': []}
+        projects['top'] = {'1.0': names}
+        results = []
+        times = []
+        for prefetch in (False, True):
+            locator = BatchLocator(projects, delay=0.1)
+            finder = DependencyFinder(locator, prefetch=prefetch)
+            start = time.time()
+            dists, problems = finder.find('top')
+            times.append(time.time() - start)
+            self.assertFalse(problems)
+            results.append(sorted(d.name_and_version for d in dists))
+            self.assertEqual(sorted(locator.calls), sorted(projects))
+            if prefetch:
+                self.assertEqual(locator.batches, [names])
+            else:
+                self.assertEqual(locator.batches, [])
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(len(results[0]), 10)
+        self.assertIn('leaf (2.0)', results[0])
+        self.assertGreater(times[0], 0.9)
+        self.assertLess(times[1], 0.6)
+
+    def test_prefetch_xmlrpc(self):
+        # A ServerProxy can't be used by several threads at once, so the
+        # finder mustn't look up a PyPIRPCLocator's projects concurrently.
+        names = ['dep%d' % i for i in range(30)]
+
+        class FakeIndex(object):
+            def package_releases(self, name, show_hidden):
+                if name != 'root' and name not in names:
+                    return []
+                return ['1.0']
+
+            def release_urls(self, name, version):
+                return [{'url': 'http://example.com/%s-%s.tar.gz' %
+                                (name, version),
+                         'md5_digest': 'a' * 32}]
+
+            def release_data(self, name, version):
+                result = {'name': name, 'version': version}
+                if name == 'root':
+                    result['requires_dist'] = names
+                return result
+
+        server = XMLRPCServerThread(FakeIndex())
+        server.start()
+        try:
+            locator = PyPIRPCLocator(server.url)
+            finder = DependencyFinder(locator)
+            dists, problems = finder.find('root')
+            self.assertFalse(problems)
+            self.assertEqual(sorted(d.key for d in dists),
+                             sorted(names + ['root']))
+        finally:
+            server.stop()
+
+    def test_resolution_cache(self):
+        # top needs a and an old c, but a needs a new c, so greedy finding
+        # reports that c can't be replaced, as well as a missing project.
+        projects = {
+            'top': {'1.0': ['a', 'c (< 2.0)', 'missing']},
+            'a': {'1.0': ['c (>= 3.0)']},
+            'c': {'1.0': [], '1.5': [], '3.0': []},
+        }
+
+        def summary(dists, problems):
+            dists = sorted((d.name_and_version, d.requested,
+                            d.build_time_dependency, sorted(d.requires))
+                           for d in dists)
+            plist = []
+            for p in problems:
+                if p[0] == 'cantreplace':
+                    p = (p[0], p[1].name_and_version, p[2].name_and_version,
+                         sorted(p[3]))
+                plist.append(p)
+            return dists, sorted(plist)
+
+        locator = MemoryLocator(projects)
+        cache = ResolutionCache()
+        finder = DependencyFinder(locator, resolution_cache=cache)
+        expected = summary(*finder.find('top'))
+        self.assertEqual(expected[1], [('cantreplace', 'c (3.0)', 'c (1.5)',
+                                        ['c (< 2.0)']),
+                                       ('unsatisfied', 'missing')])
+        result = finder.result
+        # there's no edge for a's unmet requirement
+        self.assertEqual(result.edges, [['top', 'a', 'a'],
+                                        ['top', 'c (< 2.0)', 'c']])
+        # the result survives a round trip through JSON
+        d = json.loads(json.dumps(result.to_dict()))
+        self.assertEqual(ResolutionResult.from_dict(d).to_dict(),
+                         result.to_dict())
+        self.assertEqual(summary(*result.get_distributions()), expected)
+        d['format_version'] = 0
+        self.assertRaises(DistlibException, ResolutionResult.from_dict, d)
+
+        # the same call again uses the cached result
+        calls = len(locator.calls)
+        dists, problems = finder.find('top')
+        self.assertEqual(len(locator.calls), calls)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertIs(finder.result, result)
+        self.assertEqual(summary(dists, problems), expected)
+        for dist in dists:
+            self.assertIsInstance(dist, LazyDistribution)
+            self.assertIs(dist.locator, locator)
+        c = finder.dists_by_name['c']
+        self.assertEqual(finder.reqts[c], set(['c (< 2.0)']))
+        self.assertEqual(finder.find_providers('c (< 2.0)'), set([c]))
+
+        # other arguments and modes have their own results
+        finder.find('top', prereleases=True)
+        finder.find('top', tests=True)
+        DependencyFinder(locator, mode='backtrack',
+                         resolution_cache=cache).find('top')
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['entries'], 4)
+
+        # when the locator's state changes, the result is worked out again
+        projects['c']['4.0'] = []
+        locator.clear_cache()
+        dists, problems = finder.find('top')
+        self.assertIn('c (4.0)', [p[1].name_and_version for p in problems
+                                  if p[0] == 'cantreplace'])
+        self.assertEqual(cache.stats()['hits'], 1)
+
+        # without a resolution cache, the result is only worked out (and
+        # the distributions' metadata loaded) if it's asked for
+        finder = DependencyFinder(locator)
+        dists, problems = finder.find('top')
+        self.assertIsNone(finder._result)
+        self.assertEqual(finder.result.requirement, 'top')
+        # locators whose state can't be identified don't use the cache
+        locator = SlowLocator(0, {'foo': ['1.0']})
+        cache = ResolutionCache()
+        finder = DependencyFinder(locator, resolution_cache=cache)
+        finder.find('foo')
+        finder.find('foo')
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertIsNone(finder._result)
+
+    def test_state_fingerprint(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        for fn in ('foo-1.0.tar.gz', 'bar-1.0.zip'):
+            with open(os.path.join(workdir, fn), 'wb') as f:
+                f.write(b'')
+        fingerprint = DirectoryLocator(workdir).state_fingerprint()
+        self.assertIsNotNone(fingerprint)
+        # the same for another locator for the same tree, until it changes
+        locator = DirectoryLocator(workdir)
+        self.assertEqual(locator.state_fingerprint(), fingerprint)
+        with open(os.path.join(workdir, 'foo-2.0.tar.gz'), 'wb') as f:
+            f.write(b'')
+        self.assertNotEqual(locator.state_fingerprint(), fingerprint)
+        # by default, the state can't be identified
+        locator = SlowLocator(0, {'foo': ['1.0']})
+        self.assertIsNone(locator.state_fingerprint())
+        self.assertIsNone(AggregatingLocator(
+            locator, DirectoryLocator(workdir)).state_fingerprint())
+        # aggregating locators combine those of their locators
+        locator = MemoryLocator({'foo': {'1.0': []}})
+        aggregator = AggregatingLocator(locator, DirectoryLocator(workdir))
+        fingerprint = aggregator.state_fingerprint()
+        self.assertIsNotNone(fingerprint)
+        locator.projects['foo']['2.0'] = []
+        self.assertNotEqual(aggregator.state_fingerprint(), fingerprint)
+
+    def test_resolution_cache_persistence(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        path = os.path.join(workdir, 'index.db')
+        snapshot = IndexSnapshot(path)
+        snapshot.import_dir(os.path.join(HERE, 'fake_projects'))
+        snapshot.close()
+        cache_dir = os.path.join(workdir, 'resolutions')
+        results = []
+        # the second time round, as if in another process, the result is
+        # loaded from the cache directory
+        for i in range(2):
+            with SnapshotLocator(path, scheme='legacy') as locator:
+                cache = ResolutionCache(cache_dir)
+                finder = DependencyFinder(locator, resolution_cache=cache)
+                dists, problems = finder.find('irc (5.0.1)', tests=True)
+                self.assertFalse(problems)
+                results.append(sorted((d.name_and_version,
+                                       d.build_time_dependency,
+                                       d.download_url) for d in dists))
+                self.assertEqual(len(os.listdir(cache_dir)), 1)
+                self.assertEqual(finder.result.edges, [
+                    ['irc', 'hgtools (>= 2.0)', 'hgtools'],
+                    ['irc', 'pytest-runner (>= 1.0)', 'pytest-runner'],
+                    ['pytest-runner', 'hgtools (>= 2.0)', 'hgtools']])
+        self.assertEqual(results[0], results[1])
+        self.assertEqual([r[:2] for r in results[0]],
+                         [('hgtools (2.0.3)', False), ('irc (5.0.1)', False),
+                          ('pytest-runner (1.2)', True)])
+        self.assertEqual(cache.stats()['entries'], 1)
+        # results can be saved and loaded
+        fn = os.path.join(workdir, 'result.json')
+        finder.result.save(fn)
+        self.assertEqual(ResolutionResult.load(fn).to_dict(),
+                         finder.result.to_dict())
+        cache.clear()
+        self.assertEqual(os.listdir(cache_dir), [])
+
     def test_get_all_dist_names(self):
         for url in (None, PYPI_RPC_HOST):
             all_dists = get_all_distribution_names(url)
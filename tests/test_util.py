@@ -22,7 +22,8 @@ from distlib.util import (get_export_entry, ExportEntry, resolve,
                           parse_credentials, ensure_slash, split_filename,
                           EventMixin, Sequencer, unarchive, Progress,
                           iglob, RICH_GLOB, parse_requirement, Container,
-                          FileOperator, is_string_sequence, get_package_data)
+                          FileOperator, is_string_sequence, get_package_data,
+                          LRUCache, CachePolicy, _PooledResponse)
 
 
 HERE = os.path.dirname(__file__)
@@ -395,6 +396,88 @@ class UtilTestCase(unittest.TestCase):
                                 metadata=None))
         self.assertFalse(data)
 
+    def test_pooled_response(self):
+        class Response(object):
+            def __init__(self, data):
+                self.data = data
+
+            def read(self, amt=None):
+                if amt is None:
+                    amt = len(self.data)
+                result, self.data = self.data[:amt], self.data[amt:]
+                return result
+
+            def isclosed(self):
+                return not self.data
+
+            def close(self):
+                self.data = b''
+
+        # a connection is reused if its response was read to the end, and
+        # closed if it wasn't
+        for amt, reusable in ((None, True), (3, False)):
+            released = []
+            resp = _PooledResponse(Response(b'abcdef'), released.append)
+            resp.read(amt)
+            resp.close()
+            resp.close()
+            self.assertEqual(released, [reusable])
+
+    def test_lru_cache(self):
+        now = [0]
+        cache = LRUCache(max_entries=3, ttl=10, timer=lambda: now[0])
+        for c in 'abc':
+            cache[c] = c.upper()
+        self.assertEqual(cache['a'], 'A')   # 'a' is now the most recent
+        cache['d'] = 'D'
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('c'), 'C')
+        now[0] = 5
+        cache['e'] = 'E'
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.items(), [('d', 'D'), ('c', 'C'), ('e', 'E')])
+        now[0] = 10
+        self.assertEqual(cache.items(), [('e', 'E')])
+        self.assertNotIn('c', cache)
+        self.assertEqual(cache.pop('e'), 'E')
+        self.assertRaises(KeyError, lambda: cache['a'])
+        cache.purge()
+        self.assertEqual(len(cache), 0)
+        stats = cache.stats()
+        self.assertEqual(stats, {
+            'hits': 2, 'misses': 2, 'evictions': 2, 'expirations': 2,
+            'entries': 0, 'size': 0,
+        })
+        # bounded by size, and caching None
+        cache = LRUCache(max_size=10, sizeof=lambda v: len(v or ''))
+        cache['a'] = 'x' * 6
+        cache['b'] = None
+        cache['c'] = 'x' * 4
+        self.assertEqual(cache.size, 10)
+        cache['a'] = 'x' * 7
+        # least recently used first, even when an entry takes no space
+        self.assertEqual(list(cache._data), ['a'])
+        self.assertEqual(cache.size, 7)
+        cache['b'] = None
+        self.assertIn('b', cache)
+        self.assertIsNone(cache['b'])
+        cache['d'] = 'x' * 11   # too big to be cached at all
+        self.assertNotIn('d', cache)
+        cache.clear()
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+    def test_cache_policy(self):
+        policy = CachePolicy(max_entries=2, ttl=60)
+        cache = policy.make_cache()
+        self.assertIsInstance(cache, LRUCache)
+        self.assertEqual((cache.max_entries, cache.max_size, cache.ttl),
+                         (2, None, 60))
+        cache = CachePolicy().make_cache()
+        for i in range(1000):
+            cache[i] = i
+        self.assertEqual(len(cache), 1000)
+
 def _speed_range(min_speed, max_speed):
     return tuple(['%d KB/s' % s for s in range(min_speed,
                                                max_speed + 1)])
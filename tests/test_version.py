@@ -293,6 +293,38 @@ class VersionTestCase(unittest.TestCase):
 
         self.assertRaises(ValueError, get_scheme, 'random')
 
+    def test_matcher_cache(self):
+        scheme = get_scheme('normalized')
+        cache = scheme.matcher_cache
+        saved = cache.max_entries
+        cache.clear()
+        cache.max_entries = 2
+        before = cache.stats()
+        try:
+            m = scheme.get_matcher('foo (>= 1.0, < 2.0)')
+            self.assertIsInstance(m, NM)
+            self.assertTrue(m.match('1.5'))
+            self.assertFalse(m.match('2.0'))
+            self.assertIs(scheme.get_matcher('foo (>= 1.0, < 2.0)'), m)
+            self.assertIsNot(get_scheme('legacy').get_matcher(
+                                'foo (>= 1.0, < 2.0)'), m)
+            scheme.get_matcher('bar')
+            scheme.get_matcher('baz')
+            stats = cache.stats()
+            self.assertEqual((stats['hits'] - before['hits'],
+                              stats['misses'] - before['misses'],
+                              stats['evictions'] - before['evictions'],
+                              stats['entries']), (1, 3, 1, 2))
+            self.assertIsNot(scheme.get_matcher('foo (>= 1.0, < 2.0)'), m)
+            # invalid requirements aren't cached
+            self.assertRaises(UnsupportedVersionError, scheme.get_matcher,
+                              'foo (>= bar)')
+            self.assertFalse(scheme.is_valid_matcher('foo (>= bar)'))
+            self.assertEqual(cache.stats()['entries'], 2)
+        finally:
+            cache.max_entries = saved
+            cache.clear()
+
     def test_prereleases(self):
         pre_releases = (
             '1.0.dev456',
@@ -21,7 +21,8 @@ from distlib import DistlibException
 from distlib.compat import ZipFile
 from distlib.database import DistributionPath, InstalledDistribution
 from distlib.manifest import Manifest
-from distlib.wheel import Wheel, PYVER, IMPVER, ARCH, ABI, COMPATIBLE_TAGS
+from distlib.wheel import (Wheel, PYVER, IMPVER, ARCH, ABI, COMPATIBLE_TAGS,
+                           TagIndex, is_compatible)
 
 try:
     with open(os.devnull, 'wb') as junk:
@@ -158,6 +159,33 @@ class WheelTestCase(unittest.TestCase):
         this_arch = filter(lambda o: o[-1] == ARCH, tags)
         self.assertTrue(this_arch)
 
+    def test_tag_index(self):
+        index = TagIndex()
+        self.assertEqual(len(index), len(COMPATIBLE_TAGS))
+        self.assertIn((PYVER, 'none', 'any'), index)
+        self.assertIn([PYVER, 'none', 'any'], index)
+        self.assertNotIn(('py1', 'none', 'any'), index)
+        tags = [('cp27', 'cp27m', 'linux_x86_64'), ('cp27', 'none', 'any'),
+                ('py27', 'none', 'any'), ('py2', 'none', 'any')]
+        index = TagIndex(tags)
+        cases = (
+            ('dummy-0.1-cp27-cp27m-linux_x86_64.whl', 0),
+            ('dummy-0.1-py2.py3-none-any.whl', 3),
+            ('dummy-0.1-py27.cp27-none-any.whl', 1),
+            ('dummy-0.1-py3-none-any.whl', None),
+            ('dummy-0.1-cp27-cp27m-win32.whl', None),
+        )
+        for fn, rank in cases:
+            self.assertEqual(index.rank(fn), rank)
+            self.assertEqual(index.rank(Wheel(fn)), rank)
+            compatible = rank is not None
+            self.assertEqual(index.is_compatible(fn), compatible)
+            self.assertEqual(is_compatible(fn, index), compatible)
+            self.assertEqual(is_compatible(fn, tags), compatible)
+        self.assertEqual(index.rank_tags(['py27', 'py2'], ['none'], ['any']),
+                         2)
+        self.assertTrue(is_compatible('dummy-0.1-%s-none-any.whl' % PYVER))
+
     def check_built_wheel(self, wheel, expected):
         for key in expected:
             self.assertEqual(expected[key], getattr(wheel, key))